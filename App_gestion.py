@@ -1,7 +1,5 @@
 import streamlit as st
 import sys # For debug printing
-import os
-import sqlite3
 import pandas as pd
 from datetime import date
 from io import BytesIO
@@ -12,6 +10,7 @@ from streamlit_option_menu import option_menu
 # --- Custom Modules ---
 from accueil_coop import accueil
 from Modules.auth import login_user
+from Modules import db_pool, session
 # Autres modules importés de manière paresseuse pour éviter les conflits de session_state
 
 # --- Session State Initialization for the App ---
@@ -31,7 +30,15 @@ if "db_path" not in st.session_state:
 if "nom_coop" not in st.session_state:
     st.session_state["nom_coop"] = None
 if "config_df" not in st.session_state:
-    st.session_state["config_df"] = pd.DataFrame(columns=['logo', 'slogan', 'name'])
+    st.session_state["config_df"] = pd.DataFrame(columns=['logo_path', 'slogan', 'name'])
+
+# --- Authenticated Session (Modules/session.py) ---
+# Le cookie signé est écrit (ou supprimé) au rendu qui suit la connexion (ou la
+# déconnexion) ; après un rafraîchissement du navigateur, la session est
+# restaurée depuis ce cookie sans nouveau hachage du mot de passe.
+session.appliquer_cookie()
+if not st.session_state.get("authentication_status"):
+    session.restaurer_session()
 
 # --- Sidebar Welcome and Logout ---
 with st.sidebar:
@@ -41,6 +48,7 @@ with st.sidebar:
             st.write(f'Rôle : **{st.session_state.get("user_role").capitalize()}**')
         if st.button("Déconnexion"):
             # Déconnexion : garder la coopérative sélectionnée mais réinitialiser l'authentification
+            session.fermer_session()
             st.session_state["authentication_status"] = None
             st.session_state["user_role"] = None
             st.session_state["name"] = None
@@ -70,8 +78,9 @@ try:
         # Réinitialiser toutes les variables de session
         st.session_state["db_path"] = None
         st.session_state["nom_coop"] = None
-        st.session_state["config_df"] = pd.DataFrame(columns=['logo', 'slogan', 'name'])
+        st.session_state["config_df"] = pd.DataFrame(columns=['logo_path', 'slogan', 'name'])
         # Réinitialiser les variables d'authentification
+        session.fermer_session()
         st.session_state["authentication_status"] = None
         st.session_state["user_role"] = None
         st.session_state["name"] = None
@@ -85,15 +94,10 @@ try:
         if not current_db_path:
             st.error("Erreur critique : Le chemin de la base de données n'est pas défini.")
             st.stop()
-        return sqlite3.connect(current_db_path, check_same_thread=False)
+        return db_pool.get_connection(current_db_path)
 
+    # La table config est créée par les migrations appliquées à l'ouverture de la base
     conn = get_app_db_connection()
-    # Initialisation des paramètres avec import paresseux
-    try:
-        import Modules.module_settings as module_settings
-        module_settings.initialize_settings_table()
-    except Exception as e:
-        st.warning(f"Impossible d'initialiser les paramètres: {e}")
     c = conn.cursor()
     st.write(f"Connecté à la coopérative : {st.session_state.get('nom_coop', 'N/A')}")
 
@@ -103,8 +107,9 @@ except Exception as e_init:
         # Réinitialiser toutes les variables de session
         st.session_state["db_path"] = None
         st.session_state["nom_coop"] = None
-        st.session_state["config_df"] = pd.DataFrame(columns=['logo', 'slogan', 'name'])
+        st.session_state["config_df"] = pd.DataFrame(columns=['logo_path', 'slogan', 'name'])
         # Réinitialiser les variables d'authentification
+        session.fermer_session()
         st.session_state["authentication_status"] = None
         st.session_state["user_role"] = None
         st.session_state["name"] = None
@@ -114,6 +119,8 @@ except Exception as e_init:
     st.stop()
 
 # --- UI and Logic (Only if DB setup was successful) ---
+# Configuration et logo mis en cache par base (Modules/module_settings.py) :
+# la navigation entre les pages ne relit ni la table config ni les fichiers.
 try:
     import Modules.module_settings as module_settings
     coop_info = module_settings.load_cooperative_info()
@@ -123,46 +130,31 @@ try:
         st.session_state['config_df'] = config_df
     else:
         st.sidebar.warning("Infos de configuration de la coopérative non trouvées.")
-        st.session_state['config_df'] = pd.DataFrame(columns=['logo', 'slogan', 'name'])
+        st.session_state['config_df'] = pd.DataFrame(columns=['logo_path', 'slogan', 'name'])
 except Exception as e:
     st.sidebar.warning(f"Erreur lors du chargement des informations: {e}")
-    st.session_state['config_df'] = pd.DataFrame(columns=['logo', 'slogan', 'name'])
+    st.session_state['config_df'] = pd.DataFrame(columns=['logo_path', 'slogan', 'name'])
 
 # --- Sidebar Rendering ---
 with st.sidebar:
-    current_config_df = st.session_state.get('config_df', pd.DataFrame(columns=['logo', 'slogan', 'name']))
+    current_config_df = st.session_state.get('config_df', pd.DataFrame(columns=['logo_path', 'slogan', 'name']))
     if not current_config_df.empty:
-        logo_path_sidebar = current_config_df["logo"].iloc[0] if "logo" in current_config_df.columns and pd.notna(current_config_df["logo"].iloc[0]) else None
+        logo_path_sidebar = current_config_df["logo_path"].iloc[0] if "logo_path" in current_config_df.columns and pd.notna(current_config_df["logo_path"].iloc[0]) else None
         slogan_sidebar = current_config_df["slogan"].iloc[0] if "slogan" in current_config_df.columns and pd.notna(current_config_df["slogan"].iloc[0]) else None
-        if logo_path_sidebar and os.path.exists(logo_path_sidebar):
-            st.image(logo_path_sidebar, use_container_width=True)
+        logo_sidebar = module_settings.load_logo_bytes(logo_path_sidebar) if logo_path_sidebar else None
+        if logo_sidebar:
+            st.image(logo_sidebar, use_container_width=True)
         st.title(f"{st.session_state.get('nom_coop', 'N/A')}")
         if slogan_sidebar:
             st.markdown(f'*{slogan_sidebar}*')
 
 # --- Role-Based Menu Navigation ---
-base_menu = ["🏡Accueil", "✨Interface Membre"]
-admin_menu = ["👥Gestion des Membres", "💳Cotisations", "🌱Gestion des Cultures", "🌾Production & Collecte", "📦Stocks", "🛒Ventes", "📊Comptabilité", "📑Rapports & Synthèse", "⚙️Paramètres"]
-comptable_menu = ["💳Cotisations", "📊Comptabilité", "📑Rapports & Synthèse"]
-magasinier_menu = ["🌱Gestion des Cultures", "📦Stocks", "🛒Ventes", "🌾Production & Collecte"]
-
-# Commencer avec les modules de base dans l'ordre fixe
-menu_options = base_menu.copy()
-user_role = st.session_state.get("user_role")
-
-# Ajouter les modules spécifiques au rôle
-additional_menu = []
-if user_role == 'admin':
-    additional_menu = admin_menu
-elif user_role == 'comptable':
-    additional_menu = comptable_menu
-elif user_role == 'magasinier':
-    additional_menu = magasinier_menu
-
-# Ajouter les modules supplémentaires en évitant les doublons
-for item in additional_menu:
-    if item not in menu_options:
-        menu_options.append(item)
+# Menus autorisés calculés une fois à l'ouverture de la session (voir Modules/session.py)
+session_utilisateur = session.session_courante()
+if session_utilisateur:
+    menu_options = list(session_utilisateur["permissions"])
+else:
+    menu_options = session.MENUS_BASE + session.MENUS_PAR_ROLE.get(st.session_state.get("user_role"), [])
 
 # Pas d'icônes Bootstrap - utilisation des émojis uniquement
 menu_icons = [None] * len(menu_options)
@@ -656,6 +648,20 @@ elif menu == "📑Rapports & Synthèse":
         st.error(f"Erreur lors du chargement des Rapports: {e}")
         st.write("Détails de l'erreur:", str(e))
 
+elif menu == "🌐Fédération":
+    try:
+        import Modules.module_federation as module_federation
+        module_federation.tableau_federation()
+    except Exception as e:
+        st.error(f"Erreur lors du chargement de la Fédération: {e}")
+
+elif menu == "📥Import en masse":
+    try:
+        import Modules.module_import as module_import
+        module_import.import_en_masse()
+    except Exception as e:
+        st.error(f"Erreur lors du chargement de l'Import en masse: {e}")
+
 elif menu == "⚙️Paramètres":
     try:
         import Modules.module_settings as module_settings
@@ -668,7 +674,7 @@ else: # Default to "🏡Accueil"
         import Modules.module_settings as module_settings
         coop_info_main = module_settings.load_cooperative_info()
         main_coop_name = coop_info_main.get('name', st.session_state.get('nom_coop', 'N/A'))
-        main_logo_path = coop_info_main.get('logo')
+        main_logo_path = coop_info_main.get('logo_path')
         main_slogan = coop_info_main.get('slogan')
     except Exception as e:
         st.error(f"Erreur lors du chargement des informations de la coopérative: {e}")
@@ -688,10 +694,11 @@ else: # Default to "🏡Accueil"
     st.markdown(welcome_content, unsafe_allow_html=True)
 
     # Logo affiché séparément en dehors du conteneur HTML pour éviter les conflits
-    if main_logo_path and os.path.exists(main_logo_path):
+    main_logo = module_settings.load_logo_bytes(main_logo_path) if main_logo_path else None
+    if main_logo:
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
-            st.image(main_logo_path, width=200)
+            st.image(main_logo, width=200)
     
     # Intégrer le tableau de bord avec les courbes descriptives
     try:
@@ -709,8 +716,9 @@ else: # Default to "🏡Accueil"
             # Réinitialiser toutes les variables de session
             st.session_state["db_path"] = None
             st.session_state["nom_coop"] = None
-            st.session_state["config_df"] = pd.DataFrame(columns=['logo', 'slogan', 'name'])
+            st.session_state["config_df"] = pd.DataFrame(columns=['logo_path', 'slogan', 'name'])
             # Réinitialiser les variables d'authentification
+            session.fermer_session()
             st.session_state["authentication_status"] = None
             st.session_state["user_role"] = None
             st.session_state["name"] = None
@@ -0,0 +1,209 @@
+# Modules/archives.py
+
+import json
+import os
+import sqlite3
+from datetime import date, datetime
+
+from Modules import db_agregats, db_pool
+from Modules.db_stocks import EPSILON
+
+# Clôture de campagne : les lignes d'une année terminée sont déplacées de la
+# base vivante vers une base d'archive par année (data/archives/<base>_<année>.db).
+# Les agrégats (agregats_mensuels, resume_membres, soldes_stock) sont conservés
+# tels quels dans la base vivante : tableaux de bord et espace membre restent
+# justes sans relire les archives. Les historiques filtrés sur une année
+# archivée lisent la base d'archive, attachée en lecture seule au pool.
+
+DOSSIER_ARCHIVES = "archives"
+
+# table -> (colonne de date, condition supplémentaire)
+TABLES_ARCHIVEES = {
+    "productions": ("date_livraison", ""),
+    "ventes": ("date_vente", ""),
+    "cotisations": ("date_paiement", ""),
+    "transactions": ("date_transaction", ""),
+    # Seuls les lots épuisés quittent la base vivante (les autres restent vendables)
+    "stocks": ("date_entree", f"AND quantite <= {EPSILON}"),
+}
+
+TAILLE_LOT_COPIE = 5000   # lignes copiées par lot vers la base d'archive
+
+# Agrégats de la base vivante conservés à l'identique lors de la suppression des lignes archivées
+_AGREGATS_CONSERVES = ("resume_membres", "soldes_stock")
+
+
+def dossier_archives(db_path):
+    """Dossier des archives d'une base (data/archives pour data/<coop>.db)."""
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), DOSSIER_ARCHIVES)
+
+
+def chemin_archive(db_path, annee):
+    """Chemin de la base d'archive d'une année."""
+    base = os.path.splitext(os.path.basename(db_path))[0]
+    return os.path.join(dossier_archives(db_path), f"{base}_{int(annee)}.db")
+
+
+def _alias(annee):
+    return f"archive_{int(annee)}"
+
+
+def _conditions(table):
+    """Condition SQL (bornes :debut / :fin) des lignes d'une table à archiver."""
+    if table == "mouvements_stock":
+        # Les mouvements suivent leur lot
+        return f"id_lot IN (SELECT id FROM stocks WHERE {_conditions('stocks')})"
+    colonne, supplement = TABLES_ARCHIVEES[table]
+    return f"{colonne} >= :debut AND {colonne} < :fin {supplement}"
+
+
+def annees_archivees(conn):
+    """Années clôturées, triées (liste vide si aucune)."""
+    return [ligne[0] for ligne in conn.execute("SELECT annee FROM campagnes_archivees ORDER BY annee").fetchall()]
+
+
+def source_annee(conn, table, annee):
+    """
+    Nom qualifié de la table à lire pour une année : la table de l'archive
+    (attachée en lecture seule à la connexion) si l'année est clôturée, sinon
+    la table de la base vivante. Les vues *_effectives existent aussi dans les archives.
+    """
+    if annee is None or not isinstance(annee, int) or annee not in annees_archivees(conn):
+        return table
+    chemin = chemin_archive(conn.pool.db_path, annee)
+    if not os.path.exists(chemin):
+        return table
+    conn.pool.attacher_archive(_alias(annee), chemin)
+    conn.pool.synchroniser_archives(conn)
+    if _alias(annee) not in (conn.archives_attachees or {}):
+        return table
+    return f"{_alias(annee)}.{table}"
+
+
+def lignes_restantes(conn, annee):
+    """Nombre de lignes d'une année clôturée encore présentes dans la base vivante, par table."""
+    bornes = {"debut": f"{int(annee):04d}-01-01", "fin": f"{int(annee) + 1:04d}-01-01"}
+    restantes = {}
+    for table in TABLES_ARCHIVEES:
+        nombre = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE {_conditions(table)}", bornes).fetchone()[0]
+        if nombre:
+            restantes[table] = nombre
+    return restantes
+
+
+def _colonnes(conn, schema, table):
+    return [ligne[1] for ligne in conn.execute(f"PRAGMA {schema}.table_info({table})").fetchall()]
+
+
+def _copier_vers_archive(conn, chemin, bornes):
+    """
+    Étape 1 (thread d'écriture) : copie les lignes de l'année, lues sur la
+    connexion de la transaction qui va les supprimer, dans la base d'archive
+    (créée au besoin avec le schéma des tables vivantes). Retourne {table: id maximum copié}.
+    """
+    tables = list(TABLES_ARCHIVEES) + ["mouvements_stock"]
+    os.makedirs(os.path.dirname(chemin), exist_ok=True)
+    archive = sqlite3.connect(chemin)
+    try:
+        ids_max = {}
+        for table in tables:
+            if not _colonnes(archive, "main", table):
+                sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                   (table,)).fetchone()[0]
+                archive.execute(sql)
+            # Colonnes communes : une archive ancienne reste lisible si le schéma vivant évolue
+            communes = [c for c in _colonnes(conn, "main", table) if c in _colonnes(archive, "main", table)]
+            liste = ", ".join(communes)
+            condition = _conditions(table)
+            curseur = conn.execute(f"SELECT {liste} FROM {table} WHERE {condition}", bornes)
+            insertion = f"INSERT OR REPLACE INTO {table} ({liste}) VALUES ({', '.join('?' * len(communes))})"
+            while True:
+                lot = curseur.fetchmany(TAILLE_LOT_COPIE)
+                if not lot:
+                    break
+                archive.executemany(insertion, lot)
+            ids_max[table] = conn.execute(f"SELECT MAX(id) FROM {table} WHERE {condition}",
+                                          bornes).fetchone()[0]
+        db_agregats.creer_vues_effectives(archive)
+        archive.commit()
+    finally:
+        archive.close()
+    return ids_max
+
+
+def _supprimer_de_la_base(conn, annee, bornes, ids_max, fichier):
+    """
+    Étape 2 (thread d'écriture) : supprime les lignes copiées de la base vivante
+    sans modifier les agrégats, et enregistre la clôture. Retourne {table: lignes supprimées}.
+    """
+    # Les triggers de suppression retirent les lignes des agrégats : ceux-ci sont relus puis restaurés
+    agregats = conn.execute("SELECT periode, culture, indicateur, valeur, nb FROM agregats_mensuels "
+                            "WHERE periode LIKE ?", (f"{int(annee):04d}-%",)).fetchall()
+    conserves = {}
+    for table in _AGREGATS_CONSERVES:
+        curseur = conn.execute(f"SELECT * FROM {table}")
+        conserves[table] = ([d[0] for d in curseur.description], curseur.fetchall())
+
+    supprimees = {}
+    # Mouvements avant leurs lots (la condition des mouvements lit les lots)
+    for table in ["mouvements_stock"] + list(TABLES_ARCHIVEES):
+        if ids_max.get(table) is None:
+            continue
+        supprimees[table] = conn.execute(f"DELETE FROM {table} WHERE {_conditions(table)} AND id <= :id_max",
+                                         {**bornes, "id_max": ids_max[table]}).rowcount
+
+    conn.execute("DELETE FROM agregats_mensuels WHERE periode LIKE ?", (f"{int(annee):04d}-%",))
+    conn.executemany("INSERT INTO agregats_mensuels (periode, culture, indicateur, valeur, nb) VALUES (?, ?, ?, ?, ?)",
+                     agregats)
+    for table, (colonnes, lignes) in conserves.items():
+        conn.execute(f"DELETE FROM {table}")
+        conn.executemany(f"INSERT INTO {table} ({', '.join(colonnes)}) VALUES ({', '.join('?' * len(colonnes))})",
+                         lignes)
+
+    # Une clôture relancée (lignes saisies après coup) cumule les lignes archivées
+    precedentes = conn.execute("SELECT lignes_archivees FROM campagnes_archivees WHERE annee = ?",
+                               (int(annee),)).fetchone()
+    total = json.loads(precedentes[0]) if precedentes and precedentes[0] else {}
+    for table, nombre in supprimees.items():
+        total[table] = total.get(table, 0) + nombre
+    conn.execute("""
+        INSERT OR REPLACE INTO campagnes_archivees (annee, fichier, date_archivage, lignes_archivees)
+        VALUES (?, ?, ?, ?)
+    """, (int(annee), fichier, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), json.dumps(total)))
+    return supprimees
+
+
+def archiver_annee(db_path, annee, compacter=False):
+    """
+    Clôture une campagne : copie ses lignes dans la base d'archive de l'année,
+    les supprime de la base vivante (agrégats inchangés) puis, si demandé,
+    compacte la base (VACUUM). Peut être relancée sans risque.
+    Retourne {table: lignes archivées}. Lève ValueError pour l'année en cours,
+    TimeoutError si le thread d'écriture reste occupé (rien n'est alors archivé).
+    """
+    annee = int(annee)
+    if annee >= date.today().year:
+        raise ValueError("Seules les campagnes terminées (années antérieures) peuvent être archivées.")
+    bornes = {"debut": f"{annee:04d}-01-01", "fin": f"{annee + 1:04d}-01-01"}
+    chemin = chemin_archive(db_path, annee)
+    pool = db_pool.get_pool(db_path)
+    pool.connexion()  # schéma à jour avant la copie
+
+    def cloturer(conn):
+        # Copie et suppression dans la même transaction : aucune écriture (correction,
+        # changement de statut) ne peut s'intercaler, l'archive contient exactement
+        # les lignes supprimées de la base vivante.
+        ids_max = _copier_vers_archive(conn, chemin, bornes)
+        return _supprimer_de_la_base(conn, annee, bornes, ids_max, os.path.basename(chemin))
+
+    # Le délai ne porte que sur l'attente du thread d'écriture : une clôture commencée va à son terme
+    supprimees = db_pool.executer_ecriture(cloturer, pool.db_path)
+
+    if compacter:
+        # Connexion directe : VACUUM ne peut pas s'exécuter dans une transaction
+        conn = sqlite3.connect(pool.db_path, timeout=10)
+        try:
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+    return supprimees
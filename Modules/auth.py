@@ -1,35 +1,226 @@
 import streamlit as st
 import sqlite3
 import hashlib
+import hmac
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from Modules import db_pool, session
 
-def verify_password(stored_salt_hex, stored_key_hex, provided_password):
+logger = logging.getLogger(__name__)
+
+# Password hashing parameters. Each user row stores the algorithm and the
+# iteration count used for its hash, so the cost can be raised through the
+# environment and existing hashes are upgraded transparently at next login.
+HASH_ALGORITHM = 'pbkdf2_sha256'
+MIN_PBKDF2_ITERATIONS = 100000
+PBKDF2_ITERATIONS = max(int(os.environ.get("COOP_PBKDF2_ITERATIONS", MIN_PBKDF2_ITERATIONS)), MIN_PBKDF2_ITERATIONS)
+
+# Bounded hashing pool: PBKDF2 releases the GIL, so hashes run in parallel on
+# the worker threads while the number of concurrent hashes stays capped.
+HASH_WORKERS = min(4, os.cpu_count() or 1)
+MAX_PENDING_HASHES = 32      # hashes queued or running before new logins are refused
+HASH_TIMEOUT_SECONDS = 15    # maximum wait for a verification result
+
+# Login throttling (sliding window): failed attempts per account and per
+# client IP address are checked before any hashing. Successful logins are not
+# counted, so many users behind one NAT or proxy address are not locked out;
+# the per-IP limit can be raised through the environment for large sites.
+THROTTLE_WINDOW_SECONDS = 300
+MAX_FAILED_PER_USER = 5
+MAX_FAILED_PER_IP = int(os.environ.get("COOP_MAX_FAILED_PER_IP", 20))
+
+# Account lookup at login (index on utilisateurs.gmail)
+USER_QUERY = ("SELECT id, mot_de_passe, salt, role, nom_prenoms, algo_hash, iterations "
+              "FROM utilisateurs WHERE gmail = ?")
+
+# Outcomes of check_credentials()
+LOGIN_OK = "ok"
+LOGIN_INVALID = "invalid"
+LOGIN_THROTTLED = "throttled"
+LOGIN_BUSY = "busy"
+
+LOGIN_MESSAGES = {
+    LOGIN_INVALID: "Nom d'utilisateur ou mot de passe incorrect.",
+    LOGIN_THROTTLED: "Trop de tentatives de connexion. Veuillez réessayer dans quelques minutes.",
+    LOGIN_BUSY: "Le serveur est très sollicité. Veuillez réessayer dans un instant.",
+}
+
+# Salt and key used to hash the password of unknown accounts, so that the
+# response time does not reveal whether an account exists.
+_DUMMY_SALT = os.urandom(32)
+
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+
+
+def hash_password(password, iterations=None):
+    """
+    Hashes a password with a new random salt.
+    Returns (salt, key, algorithm, iterations); salt and key are bytes.
+    """
+    iterations = iterations or PBKDF2_ITERATIONS
+    salt = os.urandom(32)
+    return salt, _pbkdf2(password, salt, iterations), HASH_ALGORITHM, iterations
+
+
+def verify_password(stored_salt_hex, stored_key_hex, provided_password, iterations=MIN_PBKDF2_ITERATIONS):
     """Verifies a provided password against a stored salt and key."""
     salt = bytes.fromhex(stored_salt_hex)
     key = bytes.fromhex(stored_key_hex)
-    new_key = hashlib.pbkdf2_hmac('sha256', provided_password.encode('utf-8'), salt, 100000)
-    return new_key == key
+    new_key = _pbkdf2(provided_password, salt, iterations)
+    return hmac.compare_digest(new_key, key)
+
+
+def needs_rehash(algorithm, iterations):
+    """True if a stored hash uses an older algorithm or fewer iterations than configured."""
+    return algorithm != HASH_ALGORITHM or (iterations or 0) < PBKDF2_ITERATIONS
+
+
+class _HashPool:
+    """Thread pool running password hashes, with a cap on pending work."""
+
+    def __init__(self, workers, max_pending):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hachage")
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def submit(self, fn, *args):
+        """Submits fn(*args); returns None if too many hashes are already pending."""
+        if not self._slots.acquire(blocking=False):
+            return None
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+
+@st.cache_resource(show_spinner=False)
+def _hash_pool():
+    """Hashing pool shared by all sessions of the process."""
+    return _HashPool(HASH_WORKERS, MAX_PENDING_HASHES)
+
+
+class _Throttle:
+    """Sliding-window attempt counters, keyed by account or by IP address."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._attempts = {}
+
+    def _recent(self, key, now):
+        attempts = self._attempts.get(key)
+        if attempts is None:
+            return 0
+        while attempts and attempts[0] <= now - THROTTLE_WINDOW_SECONDS:
+            attempts.popleft()
+        if not attempts:
+            del self._attempts[key]
+            return 0
+        return len(attempts)
+
+    def allowed(self, user_key, ip_key):
+        """Checks the failed-attempt limits of the account and of the IP address."""
+        now = time.monotonic()
+        with self._lock:
+            if self._recent(user_key, now) >= MAX_FAILED_PER_USER:
+                return False
+            return ip_key is None or self._recent(ip_key, now) < MAX_FAILED_PER_IP
+
+    def failed(self, user_key, ip_key):
+        now = time.monotonic()
+        with self._lock:
+            for key in (user_key, ip_key):
+                if key is not None:
+                    self._attempts.setdefault(key, deque()).append(now)
+
+    def succeeded(self, user_key):
+        with self._lock:
+            self._attempts.pop(user_key, None)
+
+
+@st.cache_resource(show_spinner=False)
+def _throttle():
+    return _Throttle()
+
+
+def _upgrade_hash(db_path, user_id, password):
+    """Re-hashes a password with the current parameters (runs on the hashing pool)."""
+    salt, key, algorithm, iterations = hash_password(password)
+    try:
+        db_pool.ecrire("UPDATE utilisateurs SET mot_de_passe = ?, salt = ?, algo_hash = ?, iterations = ? WHERE id = ?",
+                       (key.hex(), salt.hex(), algorithm, iterations, user_id), db_path)
+    except (sqlite3.Error, TimeoutError) as e:
+        # The login still succeeds with the old hash; the upgrade is retried at next login
+        logger.warning("Password hash upgrade failed for user %s: %s", user_id, e)
+
+
+def check_credentials(db_path, username, password, ip_address=None):
+    """
+    Checks a login without touching the Streamlit session.
+    Returns (outcome, user) where outcome is one of LOGIN_OK, LOGIN_INVALID,
+    LOGIN_THROTTLED or LOGIN_BUSY, and user is (role, nom_prenoms) on success.
+    """
+    user_key = ("user", os.path.abspath(db_path), (username or "").strip().lower())
+    ip_key = ("ip", ip_address) if ip_address else None
+    throttle = _throttle()
+    if not throttle.allowed(user_key, ip_key):
+        return LOGIN_THROTTLED, None
+
+    conn = db_pool.get_connection(db_path)
+    cursor = conn.cursor()
+    cursor.execute(USER_QUERY, (username,))
+    user_data = cursor.fetchone()
+    conn.close()
+
+    pool = _hash_pool()
+    if user_data:
+        user_id, stored_key_hex, stored_salt_hex, role, nom_prenoms, algorithm, iterations = user_data
+        future = pool.submit(verify_password, stored_salt_hex, stored_key_hex, password,
+                             iterations or MIN_PBKDF2_ITERATIONS)
+    else:
+        future = pool.submit(_pbkdf2, password, _DUMMY_SALT, PBKDF2_ITERATIONS)
+    if future is None:
+        return LOGIN_BUSY, None
+    try:
+        valid = bool(future.result(timeout=HASH_TIMEOUT_SECONDS)) and user_data is not None
+    except FutureTimeoutError:
+        return LOGIN_BUSY, None
+
+    if not valid:
+        throttle.failed(user_key, ip_key)
+        return LOGIN_INVALID, None
+
+    throttle.succeeded(user_key)
+    if needs_rehash(algorithm, iterations):
+        # Upgrade before the session is opened: the session cookie is bound to
+        # the stored hash (Modules/session.py), so it must be the final one.
+        upgrade = pool.submit(_upgrade_hash, db_path, user_id, password)
+        if upgrade is not None:
+            try:
+                upgrade.result(timeout=HASH_TIMEOUT_SECONDS)
+            except FutureTimeoutError:
+                pass
+    return LOGIN_OK, (role, nom_prenoms)
+
 
 def login_user(db_path, username, password):
     """Logs in a user by checking credentials against the database."""
+    st.session_state.pop("login_message", None)
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT mot_de_passe, salt, role, nom_prenoms FROM utilisateurs WHERE gmail = ?", (username,))
-        user_data = cursor.fetchone()
-        conn.close()
-
-        if user_data:
-            stored_key_hex, stored_salt_hex, role, nom_prenoms = user_data
-            if verify_password(stored_salt_hex, stored_key_hex, password):
-                st.session_state["authentication_status"] = True
-                st.session_state["name"] = nom_prenoms
-                st.session_state["username"] = username
-                st.session_state["user_role"] = role
+        outcome, user = check_credentials(db_path, username, password, st.context.ip_address)
+        if outcome == LOGIN_OK:
+            # Session object (user, role, linked member, permissions) and signed cookie
+            if session.ouvrir_session(db_path, username):
                 return True
-        
+            outcome = LOGIN_INVALID
+
+        st.session_state["login_message"] = LOGIN_MESSAGES[outcome]
         st.session_state["authentication_status"] = False
         return False
     except sqlite3.Error as e:
         st.error(f"Erreur de base de données lors de la connexion : {e}")
         st.session_state["authentication_status"] = False
-        return False
\ No newline at end of file
+        return False
@@ -0,0 +1,244 @@
+# Modules/db_agregats.py
+
+# Agrégats mensuels (période × culture × indicateur) maintenus par triggers
+# à chaque écriture dans productions, ventes et transactions. Les tableaux de
+# bord lisent ces quelques centaines de lignes au lieu de réagréger les tables.
+# Module sans dépendance à Streamlit (utilisé par les migrations).
+
+# Enregistrements effectifs : une ligne corrigée passe en statut 'erreur' et sa
+# correction est insérée avec le statut 'correction' (elle-même corrigeable).
+# Une chaîne de corrections se résout donc en gardant les lignes dont le statut
+# n'est pas 'erreur'. Cette condition unique est celle des triggers, des vues
+# *_effectives et des index partiels qui servent ces vues.
+CONDITION_EFFECTIVE = "{r}.statut IS NOT 'erreur'"
+_EFFECTIF = CONDITION_EFFECTIVE
+
+# Montant d'une vente (prix_total absent des ventes les plus anciennes)
+MONTANT_VENTE = "COALESCE({r}.prix_total, {r}.quantite * {r}.prix_unitaire)"
+
+# table -> (expression de période, expression de culture, [(indicateur, valeur, condition)])
+# {r} est remplacé par NEW / OLD dans les triggers et par le nom de la table pour la reconstruction.
+AGREGATS_MENSUELS = {
+    "productions": (
+        "COALESCE(strftime('%Y-%m', {r}.date_livraison), '')",
+        "COALESCE({r}.culture_nom, 'Hévéa')",
+        [("production", "{r}.quantite", _EFFECTIF)],
+    ),
+    "ventes": (
+        "COALESCE(strftime('%Y-%m', {r}.date_vente), '')",
+        "COALESCE({r}.culture_nom, 'Hévéa')",
+        [("ventes_montant", MONTANT_VENTE, _EFFECTIF),
+         ("ventes_quantite", "{r}.quantite", _EFFECTIF)],
+    ),
+    "transactions": (
+        "COALESCE(strftime('%Y-%m', {r}.date_transaction), '')",
+        "COALESCE({r}.culture_nom, 'Général')",
+        [("recettes", "{r}.montant", "{r}.type_transaction = 'Recette'"),
+         ("depenses", "{r}.montant", "{r}.type_transaction = 'Dépense'")],
+    ),
+}
+
+
+def _instructions_delta(table, ligne, signe):
+    """Instructions SQL ajoutant (signe +1) ou retirant (signe -1) une ligne des agrégats."""
+    periode, culture, indicateurs = AGREGATS_MENSUELS[table]
+    periode, culture = periode.format(r=ligne), culture.format(r=ligne)
+    instructions = []
+    for indicateur, valeur, condition in indicateurs:
+        valeur, condition = valeur.format(r=ligne), condition.format(r=ligne)
+        instructions.append(f"""
+            INSERT INTO agregats_mensuels (periode, culture, indicateur, valeur, nb)
+            SELECT {periode}, {culture}, '{indicateur}', {signe} * COALESCE({valeur}, 0), {signe}
+            WHERE {condition}
+            ON CONFLICT (periode, culture, indicateur)
+            DO UPDATE SET valeur = valeur + excluded.valeur, nb = nb + excluded.nb;""")
+        if signe < 0:
+            instructions.append(f"""
+            DELETE FROM agregats_mensuels
+            WHERE periode = {periode} AND culture = {culture} AND indicateur = '{indicateur}' AND nb <= 0;""")
+    return "".join(instructions)
+
+
+def creer_declencheurs_agregats(conn):
+    """(Re)crée les triggers d'insertion, de modification et de suppression des agrégats."""
+    for table in AGREGATS_MENSUELS:
+        for evenement in ("INSERT", "UPDATE", "DELETE"):
+            nom = f"trg_agregats_{table}_{evenement.lower()}"
+            corps = ""
+            if evenement in ("UPDATE", "DELETE"):
+                corps += _instructions_delta(table, "OLD", -1)
+            if evenement in ("INSERT", "UPDATE"):
+                corps += _instructions_delta(table, "NEW", 1)
+            conn.execute(f"DROP TRIGGER IF EXISTS {nom}")
+            conn.execute(f"CREATE TRIGGER {nom} AFTER {evenement} ON {table} BEGIN {corps} END")
+
+
+def _annees_archivees(conn):
+    """
+    Années clôturées (voir Modules/archives.py), au format 'AAAA' ; liste vide
+    si la table campagnes_archivees n'existe pas encore (migrations).
+    """
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'campagnes_archivees'").fetchone():
+        return []
+    return [f"{int(ligne[0]):04d}" for ligne in conn.execute("SELECT annee FROM campagnes_archivees")]
+
+
+def reconstruire_agregats_mensuels(conn):
+    """
+    Recalcule les agrégats à partir des tables sources. Les périodes des années
+    archivées sont conservées telles quelles : leurs lignes ne sont plus dans
+    la base vivante, et les triggers y ont ajouté les lignes saisies après la
+    clôture. Sans archive, le recalcul est complet.
+    """
+    archivees = ", ".join(f"'{annee}'" for annee in _annees_archivees(conn))
+    conn.execute(f"DELETE FROM agregats_mensuels WHERE substr(periode, 1, 4) NOT IN ({archivees})")
+    for table, (periode, culture, indicateurs) in AGREGATS_MENSUELS.items():
+        periode, culture = periode.format(r=table), culture.format(r=table)
+        for indicateur, valeur, condition in indicateurs:
+            conn.execute(f"""
+                INSERT INTO agregats_mensuels (periode, culture, indicateur, valeur, nb)
+                SELECT {periode}, {culture}, '{indicateur}', SUM(COALESCE({valeur.format(r=table)}, 0)), COUNT(*)
+                FROM {table}
+                WHERE {condition.format(r=table)} AND substr({periode}, 1, 4) NOT IN ({archivees})
+                GROUP BY 1, 2
+            """)
+
+
+# Résumé par membre (total livré, total cotisé, dernières dates) maintenu par
+# triggers : l'espace membre lit une ligne par clé primaire au lieu d'agréger
+# tout l'historique du membre.
+# table -> (valeur, date, colonne total, colonne nombre, colonne dernière date)
+RESUME_MEMBRES = {
+    "productions": ("quantite", "date_livraison", "total_livre", "nb_livraisons", "derniere_livraison"),
+    "cotisations": ("montant", "date_paiement", "total_cotise", "nb_cotisations", "derniere_cotisation"),
+}
+
+
+def _instructions_resume(table, ligne, signe):
+    """Instructions SQL ajoutant (signe +1) ou retirant (signe -1) une ligne du résumé de son membre."""
+    valeur, date, total, nombre, derniere = RESUME_MEMBRES[table]
+    condition = f"{ligne}.id_membre IS NOT NULL AND " + _EFFECTIF.format(r=ligne)
+    if signe > 0:
+        return f"""
+            INSERT INTO resume_membres (id_membre, {total}, {nombre}, {derniere})
+            SELECT {ligne}.id_membre, COALESCE({ligne}.{valeur}, 0), 1, {ligne}.{date}
+            WHERE {condition}
+            ON CONFLICT (id_membre) DO UPDATE SET
+                {total} = {total} + excluded.{total},
+                {nombre} = {nombre} + 1,
+                {derniere} = CASE WHEN {derniere} IS NULL OR excluded.{derniere} > {derniere}
+                                  THEN excluded.{derniere} ELSE {derniere} END;"""
+    # Retrait : la dernière date est relue via l'index (id_membre, date) du membre
+    return f"""
+            UPDATE resume_membres SET
+                {total} = {total} - COALESCE({ligne}.{valeur}, 0),
+                {nombre} = {nombre} - 1,
+                {derniere} = (SELECT MAX({date}) FROM {table}
+                              WHERE id_membre = {ligne}.id_membre AND {_EFFECTIF.format(r=table)})
+            WHERE id_membre = {ligne}.id_membre AND {condition};"""
+
+
+def creer_declencheurs_resume_membres(conn):
+    """(Re)crée les triggers qui maintiennent resume_membres."""
+    for table in RESUME_MEMBRES:
+        for evenement in ("INSERT", "UPDATE", "DELETE"):
+            nom = f"trg_resume_{table}_{evenement.lower()}"
+            corps = ""
+            if evenement in ("UPDATE", "DELETE"):
+                corps += _instructions_resume(table, "OLD", -1)
+            if evenement in ("INSERT", "UPDATE"):
+                corps += _instructions_resume(table, "NEW", 1)
+            conn.execute(f"DROP TRIGGER IF EXISTS {nom}")
+            conn.execute(f"CREATE TRIGGER {nom} AFTER {evenement} ON {table} BEGIN {corps} END")
+    conn.execute("DROP TRIGGER IF EXISTS trg_resume_membres_delete")
+    conn.execute("""
+        CREATE TRIGGER trg_resume_membres_delete AFTER DELETE ON membres BEGIN
+            DELETE FROM resume_membres WHERE id_membre = OLD.id;
+            UPDATE utilisateurs SET id_membre = NULL WHERE id_membre = OLD.id;
+        END
+    """)
+
+
+def _sommes_membres(table):
+    """Requête (id_membre, total, nombre) des lignes effectives d'une table, par membre."""
+    valeur = RESUME_MEMBRES[table][0]
+    return f"""SELECT id_membre, SUM(COALESCE({valeur}, 0)) AS total, COUNT(*) AS nombre FROM {table}
+               WHERE id_membre IS NOT NULL AND {_EFFECTIF.format(r=table)} GROUP BY id_membre"""
+
+
+def reconstruire_resume_membres(conn):
+    """
+    Recalcule resume_membres à partir des productions et cotisations. Si des
+    campagnes sont archivées, la part des lignes archivées (résumé actuel moins
+    les lignes de la base vivante) est conservée et ajoutée au recalcul, avec
+    la dernière date connue : les totaux des membres incluent toujours les
+    années clôturées. Sans archive, le recalcul est complet.
+    """
+    archive = bool(_annees_archivees(conn))
+    if archive:
+        colonnes, jointures = ["r.id_membre"], []
+        for table, (_, _, total, nombre, derniere) in RESUME_MEMBRES.items():
+            colonnes += [f"r.{total} - COALESCE({table}.total, 0) AS {total}",
+                         f"r.{nombre} - COALESCE({table}.nombre, 0) AS {nombre}", f"r.{derniere}"]
+            jointures.append(f"LEFT JOIN ({_sommes_membres(table)}) AS {table} ON {table}.id_membre = r.id_membre")
+        conn.execute("DROP TABLE IF EXISTS temp.resume_archive")
+        conn.execute(f"CREATE TEMP TABLE resume_archive AS SELECT {', '.join(colonnes)} "
+                     f"FROM resume_membres AS r {' '.join(jointures)}")
+    conn.execute("DELETE FROM resume_membres")
+    for table, (valeur, date, total, nombre, derniere) in RESUME_MEMBRES.items():
+        conn.execute(f"""
+            INSERT INTO resume_membres (id_membre, {total}, {nombre}, {derniere})
+            SELECT id_membre, SUM(COALESCE({valeur}, 0)), COUNT(*), MAX({date})
+            FROM {table}
+            WHERE id_membre IS NOT NULL AND {_EFFECTIF.format(r=table)}
+            GROUP BY id_membre
+            ON CONFLICT (id_membre) DO UPDATE SET
+                {total} = excluded.{total}, {nombre} = excluded.{nombre}, {derniere} = excluded.{derniere}
+        """)
+    if archive:
+        for table, (_, _, total, nombre, derniere) in RESUME_MEMBRES.items():
+            conn.execute(f"""
+                INSERT INTO resume_membres (id_membre, {total}, {nombre}, {derniere})
+                SELECT id_membre, {total}, {nombre}, {derniere} FROM temp.resume_archive WHERE {nombre} > 0
+                ON CONFLICT (id_membre) DO UPDATE SET
+                    {total} = {total} + excluded.{total},
+                    {nombre} = {nombre} + excluded.{nombre},
+                    {derniere} = CASE WHEN {derniere} IS NULL OR excluded.{derniere} > {derniere}
+                                      THEN excluded.{derniere} ELSE {derniere} END
+            """)
+        conn.execute("DROP TABLE temp.resume_archive")
+
+
+# Vues des enregistrements effectifs lues par tous les agrégats (rapports,
+# analyses), et index partiels restreints à ces enregistrements.
+# vue -> (table, colonnes calculées)
+VUES_EFFECTIVES = {
+    "productions_effectives": ("productions", ""),
+    "cotisations_effectives": ("cotisations", ""),
+    "ventes_effectives": ("ventes", f", {MONTANT_VENTE.format(r='ventes')} AS montant"),
+}
+
+INDEX_EFFECTIFS = [
+    ("idx_productions_effectives_date", "productions", "date_livraison"),
+    ("idx_productions_effectives_membre", "productions", "id_membre, date_livraison"),
+    ("idx_cotisations_effectives_date", "cotisations", "date_paiement"),
+    ("idx_cotisations_effectives_membre", "cotisations", "id_membre, date_paiement"),
+    ("idx_ventes_effectives_date", "ventes", "date_vente"),
+    ("idx_ventes_effectives_culture", "ventes", "culture_nom"),
+]
+
+
+def creer_vues_effectives(conn):
+    """(Re)crée les vues *_effectives et leurs index partiels."""
+    for vue, (table, colonnes_calculees) in VUES_EFFECTIVES.items():
+        conn.execute(f"DROP VIEW IF EXISTS {vue}")
+        conn.execute(f"""
+            CREATE VIEW {vue} AS
+            SELECT {table}.*{colonnes_calculees} FROM {table}
+            WHERE {CONDITION_EFFECTIVE.format(r=table)}
+        """)
+    for nom, table, colonnes in INDEX_EFFECTIFS:
+        conn.execute(f"""
+            CREATE INDEX IF NOT EXISTS {nom} ON {table} ({colonnes})
+            WHERE {CONDITION_EFFECTIVE.format(r=table)}
+        """)
@@ -0,0 +1,127 @@
+# Modules/db_federation.py
+
+import os
+import pathlib
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+# Analyses consolidées de toutes les coopératives hébergées (niveau union /
+# fédération). Les bases sont lues en parallèle, en lecture seule, par un pool
+# de threads (SQLite libère le GIL pendant l'exécution des requêtes ; des
+# processus « spawn » réexécuteraient le script Streamlit, qui tient lieu de
+# __main__). Seuls les agrégats déjà maintenus par triggers (agregats_mensuels,
+# soldes_stock, resume_membres) sont lus, puis les résultats partiels, tous
+# additifs, sont fusionnés. La mise en cache du résultat fusionné est faite par
+# l'appelant (Modules/module_federation.py), avec signature() comme clé.
+# Module sans dépendance à Streamlit.
+
+LECTURES_SIMULTANEES = 8   # bases lues en parallèle
+
+# Erreur d'une base dont le schéma est antérieur aux agrégats (jamais ouverte depuis)
+ERREUR_SCHEMA = "schema"
+
+
+def creer_executeur(nb_threads=LECTURES_SIMULTANEES):
+    """Pool de threads de lecture des bases."""
+    return ThreadPoolExecutor(max_workers=nb_threads, thread_name_prefix="federation")
+
+
+def signature(chemin):
+    """Signature d'une base : date de modification et taille du fichier et de son journal WAL."""
+    elements = []
+    for fichier in (chemin, chemin + "-wal"):
+        try:
+            etat = os.stat(fichier)
+            elements.append((etat.st_mtime_ns, etat.st_size))
+        except OSError:
+            elements.append(None)
+    return tuple(elements)
+
+
+def agreger_base(chemin):
+    """
+    Agrégats partiels d'une base de coopérative, lue en lecture seule
+    (connexion propre à l'appel, hors du pool de l'application).
+    """
+    resultat = {"chemin": chemin, "agregats": [], "stocks": [], "nb_membres": 0,
+                "total_cotisations": 0.0, "erreur": None}
+    try:
+        conn = sqlite3.connect(pathlib.Path(chemin).absolute().as_uri() + "?mode=ro", uri=True, timeout=10)
+    except sqlite3.Error as e:
+        resultat["erreur"] = str(e)
+        return resultat
+    try:
+        tables = {ligne[0] for ligne in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if not {"agregats_mensuels", "soldes_stock", "resume_membres"} <= tables:
+            resultat["erreur"] = ERREUR_SCHEMA
+            return resultat
+        resultat["agregats"] = conn.execute("""
+            SELECT periode, culture, indicateur, valeur, nb FROM agregats_mensuels
+        """).fetchall()
+        resultat["stocks"] = conn.execute("""
+            SELECT culture_nom, SUM(quantite) FROM soldes_stock GROUP BY culture_nom
+        """).fetchall()
+        resultat["nb_membres"] = conn.execute("SELECT COUNT(*) FROM membres").fetchone()[0]
+        resultat["total_cotisations"] = conn.execute(
+            "SELECT COALESCE(SUM(total_cotise), 0) FROM resume_membres").fetchone()[0]
+    except sqlite3.Error as e:
+        resultat["erreur"] = str(e)
+    finally:
+        conn.close()
+    return resultat
+
+
+def consolider(chemins, executeur=None):
+    """
+    Agrégats partiels de chaque base (liste dans l'ordre de chemins), lues en
+    parallèle par executeur (voir creer_executeur), ou l'une après l'autre sans executeur.
+    """
+    if executeur is not None and len(chemins) > 1:
+        return list(executeur.map(agreger_base, chemins))
+    return [agreger_base(chemin) for chemin in chemins]
+
+
+def fusionner(resultats, noms=None):
+    """
+    Fusionne les agrégats partiels. Retourne un dict de listes de dicts :
+    - 'mensuel' : par période et culture (production, ventes, recettes, dépenses)
+    - 'stocks' : stock par culture
+    - 'cooperatives' : une ligne par base (totaux, trésorerie, erreur éventuelle)
+    noms : {chemin: nom affiché} facultatif.
+    """
+    noms = noms or {}
+    mensuel, stocks, cooperatives = {}, {}, []
+    for resultat in resultats:
+        totaux = {"production": 0.0, "nb_livraisons": 0, "ventes_montant": 0.0, "ventes_quantite": 0.0,
+                  "recettes": 0.0, "depenses": 0.0}
+        for periode, culture, indicateur, valeur, nb in resultat["agregats"]:
+            ligne = mensuel.setdefault((periode, culture), {
+                "periode": periode, "culture": culture, "production": 0.0, "nb_livraisons": 0,
+                "ventes_montant": 0.0, "ventes_quantite": 0.0, "recettes": 0.0, "depenses": 0.0})
+            ligne[indicateur] = ligne.get(indicateur, 0.0) + (valeur or 0.0)
+            totaux[indicateur] = totaux.get(indicateur, 0.0) + (valeur or 0.0)
+            if indicateur == "production":
+                ligne["nb_livraisons"] += nb
+                totaux["nb_livraisons"] += nb
+        stock_total = 0.0
+        for culture, quantite in resultat["stocks"]:
+            stocks[culture] = stocks.get(culture, 0.0) + (quantite or 0.0)
+            stock_total += quantite or 0.0
+        cooperatives.append({
+            "cooperative": noms.get(resultat["chemin"], os.path.basename(resultat["chemin"])),
+            "membres": resultat["nb_membres"],
+            "production": totaux["production"],
+            "ventes_montant": totaux["ventes_montant"],
+            "cotisations": resultat["total_cotisations"],
+            "recettes": totaux["recettes"],
+            "depenses": totaux["depenses"],
+            # Même solde que la comptabilité de chaque coopérative : recettes + ventes - dépenses
+            "tresorerie": totaux["recettes"] + totaux["ventes_montant"] - totaux["depenses"],
+            "stock": stock_total,
+            "erreur": resultat["erreur"],
+        })
+    return {
+        "mensuel": sorted(mensuel.values(), key=lambda l: (l["periode"], l["culture"])),
+        "stocks": [{"culture": culture, "quantite": quantite} for culture, quantite in sorted(stocks.items())],
+        "cooperatives": cooperatives,
+    }
@@ -0,0 +1,442 @@
+# Modules/db_migrations.py
+
+import sqlite3
+from datetime import datetime
+
+from Modules import db_agregats, db_stocks
+
+# Ce module ne dépend pas de Streamlit : il est utilisé par le pool de
+# connexions (Modules/db_pool.py) à l'ouverture d'une base, et peut aussi
+# être appelé depuis des scripts autonomes.
+
+
+def _colonnes(conn, table):
+    return {ligne[1] for ligne in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _ajouter_colonnes(conn, table, colonnes):
+    """Ajoute à une table les colonnes (nom, déclaration) qui n'existent pas encore."""
+    existantes = _colonnes(conn, table)
+    for nom, declaration in colonnes:
+        if nom not in existantes:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {nom} {declaration}")
+
+
+def _migration_tables_de_base(conn):
+    """Tables du modèle et tables créées auparavant par les modules au premier affichage."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS config (
+            id INTEGER PRIMARY KEY DEFAULT 1,
+            name TEXT,
+            slogan TEXT,
+            logo_path TEXT,
+            type_coop TEXT,
+            sigle TEXT,
+            date_creation TEXT,
+            immatriculation TEXT,
+            CONSTRAINT unique_config_row CHECK (id = 1)
+        )
+    ''')
+    if conn.execute("SELECT COUNT(*) FROM config").fetchone()[0] == 0:
+        conn.execute("INSERT INTO config (id, name, slogan, logo_path, type_coop, sigle, date_creation, immatriculation) VALUES (1, ?, ?, ?, ?, ?, ?, ?)",
+                     ('Ma Coopérative', 'Notre Slogan', None, '', '', '', ''))
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS membres (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nom TEXT NOT NULL,
+            numero_membre TEXT UNIQUE,
+            telephone TEXT,
+            adresse TEXT,
+            date_adhesion TEXT,
+            statut TEXT,
+            plantation_ha REAL,
+            nb_arbres INTEGER
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS productions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_membre INTEGER,
+            date_livraison TEXT,
+            quantite REAL,
+            qualite TEXT,
+            zone TEXT,
+            statut TEXT DEFAULT 'valide',
+            correction_id INTEGER,
+            FOREIGN KEY (id_membre) REFERENCES membres (id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS stocks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date_mouvement TEXT,
+            type TEXT,
+            produit TEXT,
+            quantite REAL,
+            commentaire TEXT,
+            statut TEXT DEFAULT 'valide',
+            correction_id INTEGER
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ventes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date_vente TEXT,
+            produit TEXT,
+            quantite REAL,
+            prix_unitaire REAL,
+            acheteur TEXT,
+            commentaire TEXT,
+            statut TEXT DEFAULT 'valide',
+            correction_id INTEGER
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cotisations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_membre INTEGER,
+            montant REAL,
+            date_paiement TEXT,
+            mode_paiement TEXT,
+            motif TEXT,
+            statut TEXT DEFAULT 'valide',
+            correction_id INTEGER,
+            FOREIGN KEY (id_membre) REFERENCES membres (id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS comptabilite (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date_operation TEXT,
+            type TEXT,
+            categorie TEXT,
+            montant REAL,
+            description TEXT,
+            statut TEXT DEFAULT 'valide',
+            correction_id INTEGER
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS utilisateurs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nom_prenoms TEXT NOT NULL,
+            role TEXT,
+            statut TEXT,
+            mot_de_passe TEXT NOT NULL,
+            salt TEXT NOT NULL,
+            gmail TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cultures (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nom_culture TEXT NOT NULL UNIQUE,
+            unite_mesure TEXT DEFAULT 'kg',
+            qualites_disponibles TEXT, -- JSON string des qualités
+            types_produits TEXT, -- JSON string des types de produits
+            actif INTEGER DEFAULT 1
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type_transaction TEXT,
+            montant REAL,
+            date_transaction TEXT,
+            description TEXT,
+            categorie TEXT,
+            culture_id INTEGER,
+            culture_nom TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS revenus_cultures (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            culture_id INTEGER,
+            culture_nom TEXT,
+            periode TEXT,
+            revenus_ventes REAL DEFAULT 0,
+            couts_production REAL DEFAULT 0,
+            autres_revenus REAL DEFAULT 0,
+            autres_charges REAL DEFAULT 0,
+            benefice_net REAL DEFAULT 0,
+            date_calcul DATE
+        )
+    ''')
+
+
+def _migration_colonnes_statut(conn):
+    """Colonnes de correction (statut / correction_id) ajoutées après coup aux anciennes bases."""
+    for table in ("productions", "cotisations", "stocks", "ventes", "comptabilite"):
+        _ajouter_colonnes(conn, table, [
+            ("statut", "TEXT DEFAULT 'valide'"),
+            ("correction_id", "INTEGER"),
+        ])
+
+
+def _migration_colonnes_multicultures(conn):
+    """Colonnes du système multi-cultures (anciennement ajoutées à chaque affichage)."""
+    _ajouter_colonnes(conn, "productions", [
+        ("culture_id", "INTEGER"),
+        ("culture_nom", "TEXT"),
+    ])
+    _ajouter_colonnes(conn, "stocks", [
+        ("culture_id", "INTEGER"),
+        ("culture_nom", "TEXT"),
+        ("type_produit", "TEXT DEFAULT 'brut'"),
+        ("qualite", "TEXT DEFAULT 'Standard'"),
+        ("observations", "TEXT"),
+        ("date_entree", "TEXT"),
+    ])
+    _ajouter_colonnes(conn, "ventes", [
+        ("culture_id", "INTEGER"),
+        ("culture_nom", "TEXT"),
+        ("type_produit", "TEXT DEFAULT 'brut'"),
+        ("prix_total", "REAL"),
+        ("client", "TEXT"),
+        ("mode_paiement", "TEXT"),
+        ("qualite", "TEXT"),
+        ("date_vente", "TEXT"),
+        ("observations", "TEXT"),
+    ])
+    _ajouter_colonnes(conn, "transactions", [
+        ("culture_id", "INTEGER"),
+        ("culture_nom", "TEXT"),
+        ("type_transaction", "TEXT"),
+        ("categorie", "TEXT"),
+        ("date_transaction", "TEXT"),
+    ])
+
+
+def _migration_index_principaux(conn):
+    """
+    Index secondaires des tables principales. Les requêtes qui doivent les
+    utiliser sont listées dans Modules/db_plans_requetes.py.
+    """
+    index = [
+        # Espace membre et historiques (jointure sur le membre, tri par date)
+        ("idx_productions_membre_date", "productions", "id_membre, date_livraison"),
+        ("idx_cotisations_membre_date", "cotisations", "id_membre, date_paiement"),
+        # Filtres par période : index couvrants pour les agrégats du tableau de bord et des rapports
+        ("idx_productions_date", "productions", "date_livraison, culture_nom, statut, quantite"),
+        ("idx_cotisations_date", "cotisations", "date_paiement, statut, montant"),
+        ("idx_ventes_date", "ventes", "date_vente, culture_nom"),
+        ("idx_transactions_date", "transactions", "date_transaction, type_transaction, culture_nom, montant"),
+        ("idx_comptabilite_date", "comptabilite", "date_operation, type"),
+        # Filtres par culture, type ou client
+        ("idx_ventes_culture", "ventes", "culture_nom"),
+        ("idx_ventes_client", "ventes", "client"),
+        ("idx_transactions_type_culture", "transactions", "type_transaction, culture_nom"),
+        ("idx_stocks_culture_type_qualite", "stocks", "culture_nom, type_produit, qualite"),
+        ("idx_membres_nom", "membres", "nom"),
+    ]
+    for nom, table, colonnes in index:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {nom} ON {table} ({colonnes})")
+
+
+def _migration_agregats_mensuels(conn):
+    """Table d'agrégats mensuels maintenue par triggers, initialisée à partir de l'existant."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS agregats_mensuels (
+            periode TEXT NOT NULL,     -- 'AAAA-MM'
+            culture TEXT NOT NULL,
+            indicateur TEXT NOT NULL,  -- production, ventes_montant, ventes_quantite, recettes, depenses
+            valeur REAL NOT NULL DEFAULT 0,
+            nb INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (periode, culture, indicateur)
+        ) WITHOUT ROWID
+    ''')
+    db_agregats.creer_declencheurs_agregats(conn)
+    db_agregats.reconstruire_agregats_mensuels(conn)
+
+
+def _migration_taches(conn):
+    """File des tâches de fond (rapports et exports lourds), voir Modules/taches.py."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS taches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL,
+            categorie TEXT,            -- écran d'origine (ex. historique_production)
+            titre TEXT,
+            parametres TEXT,           -- JSON
+            utilisateur TEXT,
+            statut TEXT NOT NULL DEFAULT 'en_attente',  -- en_attente, en_cours, terminee, echec
+            progression REAL NOT NULL DEFAULT 0,
+            message TEXT,
+            fichier_resultat TEXT,
+            nom_fichier TEXT,
+            mime TEXT,
+            jeton_processus TEXT,
+            date_creation TEXT,
+            date_debut TEXT,
+            date_fin TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_taches_utilisateur ON taches (utilisateur, categorie, id)")
+
+
+def _migration_parametres_hachage(conn):
+    """Algorithme et nombre d'itérations du hachage de chaque mot de passe (voir Modules/auth.py)."""
+    # Les mots de passe existants ont été hachés en PBKDF2-SHA256 à 100 000 itérations
+    _ajouter_colonnes(conn, "utilisateurs", [
+        ("algo_hash", "TEXT DEFAULT 'pbkdf2_sha256'"),
+        ("iterations", "INTEGER DEFAULT 100000"),
+    ])
+
+
+def _migration_lien_utilisateur_membre(conn):
+    """
+    Lien explicite utilisateur -> membre (utilisateurs.id_membre) et résumé par
+    membre maintenu par triggers (voir Modules/db_agregats.py).
+    """
+    _ajouter_colonnes(conn, "utilisateurs", [("id_membre", "INTEGER REFERENCES membres (id)")])
+    # Reprise des comptes existants : rattachement par nom seulement s'il est sans ambiguïté
+    conn.execute('''
+        UPDATE utilisateurs
+        SET id_membre = (SELECT m.id FROM membres m WHERE m.nom = utilisateurs.nom_prenoms)
+        WHERE id_membre IS NULL
+          AND (SELECT COUNT(*) FROM membres m WHERE m.nom = utilisateurs.nom_prenoms) = 1
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_utilisateurs_membre ON utilisateurs (id_membre)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_utilisateurs_gmail ON utilisateurs (gmail)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS resume_membres (
+            id_membre INTEGER PRIMARY KEY,
+            total_livre REAL NOT NULL DEFAULT 0,
+            nb_livraisons INTEGER NOT NULL DEFAULT 0,
+            derniere_livraison TEXT,
+            total_cotise REAL NOT NULL DEFAULT 0,
+            nb_cotisations INTEGER NOT NULL DEFAULT 0,
+            derniere_cotisation TEXT
+        )
+    ''')
+    db_agregats.creer_declencheurs_resume_membres(conn)
+    db_agregats.reconstruire_resume_membres(conn)
+
+
+def _migration_grand_livre_stocks(conn):
+    """
+    Grand livre des mouvements de stock (ajout seul) et soldes par produit
+    maintenus par triggers (voir Modules/db_stocks.py).
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS mouvements_stock (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date_mouvement TEXT NOT NULL,
+            sens TEXT NOT NULL CHECK (sens IN ('entree', 'sortie')),
+            culture_nom TEXT NOT NULL,
+            type_produit TEXT NOT NULL,
+            qualite TEXT NOT NULL,
+            quantite REAL NOT NULL CHECK (quantite > 0),
+            id_lot INTEGER REFERENCES stocks (id),
+            id_vente INTEGER REFERENCES ventes (id),
+            motif TEXT              -- entree, vente, reprise
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS soldes_stock (
+            culture_nom TEXT NOT NULL,
+            type_produit TEXT NOT NULL,
+            qualite TEXT NOT NULL,
+            quantite REAL NOT NULL DEFAULT 0,
+            date_maj TEXT,
+            PRIMARY KEY (culture_nom, type_produit, qualite)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_mouvements_stock_date ON mouvements_stock (date_mouvement, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_mouvements_stock_lot ON mouvements_stock (id_lot)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_mouvements_stock_vente ON mouvements_stock (id_vente)")
+    # Lots non épuisés d'un produit, dans l'ordre d'imputation FIFO
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_stocks_lots_fifo
+        ON stocks (culture_nom, type_produit, qualite, date_entree, id) WHERE quantite > 0
+    ''')
+    db_stocks.creer_declencheurs_soldes(conn)
+    db_stocks.reprendre_lots_existants(conn)
+    db_stocks.reconstruire_soldes(conn)
+
+
+def _migration_vues_effectives(conn):
+    """
+    Vues des enregistrements effectifs (hors lignes en erreur) et index partiels ;
+    triggers et agrégats recalculés avec la même condition et le même montant de vente.
+    """
+    db_agregats.creer_vues_effectives(conn)
+    db_agregats.creer_declencheurs_agregats(conn)
+    db_agregats.reconstruire_agregats_mensuels(conn)
+    db_agregats.creer_declencheurs_resume_membres(conn)
+    db_agregats.reconstruire_resume_membres(conn)
+
+
+def _migration_campagnes_archivees(conn):
+    """Registre des campagnes clôturées et archivées (voir Modules/archives.py)."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS campagnes_archivees (
+            annee INTEGER PRIMARY KEY,
+            fichier TEXT NOT NULL,          -- nom du fichier dans data/archives
+            date_archivage TEXT,
+            lignes_archivees TEXT           -- JSON {table: nombre de lignes}
+        )
+    ''')
+
+
+# Liste ordonnée des migrations : (version, description, fonction).
+# Une migration déjà appliquée ne doit jamais être modifiée : ajouter une
+# nouvelle entrée avec le numéro de version suivant.
+MIGRATIONS = [
+    (1, "Tables de base", _migration_tables_de_base),
+    (2, "Colonnes statut et correction_id", _migration_colonnes_statut),
+    (3, "Colonnes multi-cultures", _migration_colonnes_multicultures),
+    (4, "Index des tables principales", _migration_index_principaux),
+    (5, "Agrégats mensuels maintenus par triggers", _migration_agregats_mensuels),
+    (6, "File des tâches de fond", _migration_taches),
+    (7, "Paramètres de hachage des mots de passe", _migration_parametres_hachage),
+    (8, "Lien utilisateur-membre et résumé par membre", _migration_lien_utilisateur_membre),
+    (9, "Grand livre des stocks et soldes par produit", _migration_grand_livre_stocks),
+    (10, "Vues des enregistrements effectifs", _migration_vues_effectives),
+    (11, "Registre des campagnes archivées", _migration_campagnes_archivees),
+]
+
+VERSION_COURANTE = MIGRATIONS[-1][0]
+
+
+def version_schema(conn):
+    """Retourne la version de schéma enregistrée dans la base (0 si aucune)."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            date_application TEXT
+        )
+    ''')
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def appliquer_migrations(conn):
+    """
+    Applique les migrations en attente dans une seule transaction.
+    Retourne la liste des versions appliquées (vide si la base est à jour).
+    """
+    if version_schema(conn) >= VERSION_COURANTE:
+        return []
+
+    appliquees = []
+    if conn.in_transaction:
+        conn.commit()
+    # BEGIN IMMEDIATE sérialise les migrations si plusieurs processus ouvrent la base
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        courante = conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+        for version, description, migration in MIGRATIONS:
+            if version <= courante:
+                continue
+            migration(conn)
+            conn.execute("INSERT INTO schema_version (version, description, date_application) VALUES (?, ?, ?)",
+                         (version, description, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            appliquees.append(version)
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    return appliquees
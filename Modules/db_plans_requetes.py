@@ -0,0 +1,148 @@
+# Modules/db_plans_requetes.py
+
+import pathlib
+import sqlite3
+import sys
+
+# Requêtes fréquentes des modules (tableau de bord, espace membre, historiques,
+# rapports) et index que SQLite doit choisir pour chacune. Les requêtes sont
+# celles des modules eux-mêmes (constantes REQUETE_*, HISTORIQUE_* et
+# pagination.requete_filtree), avec des valeurs de filtres représentatives :
+# une requête modifiée dans un module est vérifiée telle quelle. Ajouter ici
+# toute nouvelle requête critique, après l'avoir exposée en constante dans son module.
+
+ANNEE = 2025
+BORNES_ANNEE = ("2025-01-01", "2026-01-01")
+
+
+def _historique(definition, table, conditions):
+    """(requête, paramètres) d'un historique paginé décrit par {'colonnes', 'source', 'ordre'}."""
+    from Modules.pagination import requete_filtree
+
+    return requete_filtree(definition["colonnes"], definition["source"].format(table=table),
+                           conditions, definition["ordre"])
+
+
+def requetes_critiques():
+    """
+    Liste des (nom, requête, paramètres, index attendus) : chaque index
+    attendu (chaîne ou tuple de chaînes) doit apparaître dans le plan.
+    Les modules sont importés ici : ils dépendent de Streamlit.
+    """
+    from Modules import auth, db_stocks
+    from Modules import module_comptabilite_multiculturel as comptabilite
+    from Modules import module_cotisation as cotisation
+    from Modules import module_interface_membre as interface_membre
+    from Modules import module_production_multiculturel as production
+    from Modules import module_stock_et_ventes_multiculturel as ventes
+    from Modules.module_rapport_synthèse import REQUETE_SYNTHESE
+    from Modules.pagination import bornes_annee, condition_annee, conditions_filtres
+
+    requetes = [
+        ("historique_productions",
+         *_historique(production.HISTORIQUE_PRODUCTIONS, "productions", []),
+         "idx_productions_date"),
+        ("historique_productions_annee",
+         *_historique(production.HISTORIQUE_PRODUCTIONS, "productions",
+                      conditions_filtres(production.HISTORIQUE_PRODUCTIONS, {"annee": bornes_annee(ANNEE)})),
+         "idx_productions_date"),
+        ("historique_productions_membre",
+         *_historique(production.HISTORIQUE_PRODUCTIONS, "productions",
+                      conditions_filtres(production.HISTORIQUE_PRODUCTIONS, {"membre": "Membre"})),
+         ("idx_membres_nom", "idx_productions_membre_date")),
+        ("historique_cotisations",
+         *_historique(cotisation.HISTORIQUE_COTISATIONS, "cotisations", []),
+         "idx_cotisations_date"),
+        ("historique_cotisations_annee",
+         *_historique(cotisation.HISTORIQUE_COTISATIONS, "cotisations",
+                      conditions_filtres(cotisation.HISTORIQUE_COTISATIONS, {"annee": bornes_annee(ANNEE)})),
+         "idx_cotisations_date"),
+        ("historique_ventes",
+         *_historique(ventes.HISTORIQUE_VENTES, "ventes", []),
+         "idx_ventes_date"),
+        ("historique_ventes_annee",
+         *_historique(ventes.HISTORIQUE_VENTES, "ventes",
+                      conditions_filtres(ventes.HISTORIQUE_VENTES, {"annee": bornes_annee(ANNEE)})),
+         "idx_ventes_date"),
+        ("lots_stock",
+         *_historique(ventes.LOTS_STOCK, "stocks", [("quantite > 0", ()), ("culture_nom = ?", "Hévéa"),
+                                                    ("type_produit = ?", "brut"), ("qualite = ?", "Standard")]),
+         "idx_stocks_lots_fifo"),
+        ("mouvements_stock",
+         *_historique(ventes.HISTORIQUE_MOUVEMENTS, "mouvements_stock", []),
+         "idx_mouvements_stock_date"),
+        ("lots_fifo", db_stocks.REQUETE_LOTS_FIFO, ("Hévéa", "brut", "Standard"), "idx_stocks_lots_fifo"),
+        ("historique_transactions", comptabilite.REQUETE_HISTORIQUE_TRANSACTIONS, (), "idx_transactions_date"),
+        ("rapport_annuel_transactions", comptabilite.REQUETE_RAPPORT_ANNUEL, BORNES_ANNEE, "idx_transactions_date"),
+        ("synthese_periode",
+         REQUETE_SYNTHESE.format(productions="productions_effectives", ventes="ventes_effectives",
+                                 cotisations="cotisations_effectives"),
+         {"debut": BORNES_ANNEE[0], "fin": BORNES_ANNEE[1]},
+         ("idx_productions_effectives_date", "idx_ventes_effectives_date",
+          "idx_cotisations_date", "idx_comptabilite_date")),
+        ("utilisateur_par_gmail", auth.USER_QUERY, ("membre@coop.com",), "idx_utilisateurs_gmail"),
+    ]
+    for table, colonne_date in interface_membre.HISTORIQUES_MEMBRE.items():
+        index_membre = f"idx_{table}_membre_date"
+        requetes += [
+            (f"annees_{table}_membre",
+             interface_membre.REQUETE_ANNEES_MEMBRE.format(table=table, colonne_date=colonne_date),
+             (1,), index_membre),
+            (f"mois_{table}_membre",
+             interface_membre.REQUETE_MOIS_MEMBRE.format(table=table, colonne_date=colonne_date),
+             (1,), index_membre),
+            (f"historique_{table}_membre_annee",
+             *_historique({"colonnes": ["*"], "source": "FROM {table}",
+                           "ordre": interface_membre.ORDRE_HISTORIQUE_MEMBRE.format(colonne_date=colonne_date)},
+                          table, [("id_membre = ?", 1), condition_annee(colonne_date, ANNEE)]),
+             index_membre),
+        ]
+    return requetes
+
+
+def plan_requete(conn, requete, parametres=()):
+    """Retourne les lignes 'detail' de EXPLAIN QUERY PLAN pour une requête."""
+    return [ligne[3] for ligne in conn.execute(f"EXPLAIN QUERY PLAN {requete}", parametres)]
+
+
+def verifier_plans_requetes(conn, requetes=None):
+    """
+    Vérifie que chaque requête critique utilise les index attendus.
+    Retourne la liste des anomalies (nom, plan) ; une liste vide signifie que tout est indexé.
+    """
+    anomalies = []
+    for nom, requete, parametres, index_attendus in requetes or requetes_critiques():
+        if isinstance(index_attendus, str):
+            index_attendus = (index_attendus,)
+        plan = plan_requete(conn, requete, parametres)
+        if not all(any(index in etape for etape in plan) for index in index_attendus):
+            anomalies.append((nom, plan))
+    return anomalies
+
+
+if __name__ == "__main__":
+    # Usage : python -m Modules.db_plans_requetes data/<base>.db
+    # La base est ouverte en lecture seule : elle doit être à jour (ouverte au moins une fois par l'application).
+    from Modules.db_migrations import VERSION_COURANTE, version_schema
+
+    if len(sys.argv) != 2:
+        print("Usage : python -m Modules.db_plans_requetes <chemin_base.db>")
+        sys.exit(2)
+
+    connexion = sqlite3.connect(pathlib.Path(sys.argv[1]).absolute().as_uri() + "?mode=ro", uri=True)
+    try:
+        version = version_schema(connexion)
+    except sqlite3.OperationalError:
+        version = 0  # table schema_version absente (création impossible en lecture seule)
+    if version < VERSION_COURANTE:
+        print(f"❌ Schéma en version {version} (attendue : {VERSION_COURANTE}) : "
+              "ouvrez la base dans l'application pour appliquer les migrations.")
+        sys.exit(2)
+    liste_requetes = requetes_critiques()
+    resultats = verifier_plans_requetes(connexion, liste_requetes)
+    connexion.close()
+
+    for nom_requete, plan_obtenu in resultats:
+        print(f"❌ {nom_requete} : {' | '.join(plan_obtenu)}")
+    print(f"{len(liste_requetes) - len(resultats)}/{len(liste_requetes)} requêtes utilisent l'index attendu.")
+    sys.exit(1 if resultats else 0)
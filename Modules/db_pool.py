@@ -0,0 +1,424 @@
+# Modules/db_pool.py
+
+import os
+import pathlib
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, InvalidStateError
+
+import streamlit as st
+
+from Modules import db_migrations
+
+# Pragmas appliqués à chaque nouvelle connexion ouverte par le pool
+PRAGMAS_CONNEXION = {
+    "journal_mode": "WAL",      # Les lectures ne bloquent pas l'écriture (et inversement)
+    "synchronous": "NORMAL",    # Sûr en WAL ; synchronisation disque au checkpoint
+    "busy_timeout": 10000,      # Attendre un verrou au lieu d'échouer immédiatement
+    "temp_store": "MEMORY",     # Tris et tables temporaires en mémoire
+    "cache_size": -8000,        # ~8 Mo de cache de pages par connexion
+    "mmap_size": 67108864,      # Lecture des pages via mmap (64 Mo)
+}
+
+# Pragmas du thread d'écriture, appliqués après PRAGMAS_CONNEXION : le journal
+# des SAVEPOINT (un par écriture d'un groupe) reste sur fichier temporaire. En
+# mémoire, un executemany de quelques milliers de lignes dans un SAVEPOINT
+# devient 15 à 50 fois plus lent (voir benchmark_ecriture.py).
+PRAGMAS_ECRITURE = {
+    "temp_store": "DEFAULT",
+}
+
+# Nombre maximum de connexions inactives conservées par base
+TAILLE_MAX_LIBRES = 8
+
+# Bases d'archives attachées en lecture seule à chaque connexion (SQLite en
+# autorise 10 par connexion) : les moins récemment demandées sont détachées.
+MAX_ARCHIVES_ATTACHEES = 8
+
+# File d'écriture : écritures validées ensemble dans une même transaction
+TAILLE_MAX_GROUPE = 200       # écritures au plus par transaction
+DELAI_ECRITURE = 30           # secondes d'attente maximum du résultat d'une écriture
+
+
+class ConnexionPool(sqlite3.Connection):
+    """Connexion SQLite gérée par le pool : close() la rend au pool au lieu de la fermer."""
+
+    pool = None
+    _changements_valides = 0
+    archives_attachees = None  # alias -> chemin
+
+    def commit(self):
+        super().commit()
+        # Toute écriture validée change la version des données de la base,
+        # ce qui invalide les caches de lecture (ex. tableau de bord).
+        if self.pool is not None and self.total_changes != self._changements_valides:
+            self._changements_valides = self.total_changes
+            self.pool.signaler_modification()
+
+    def close(self):
+        # Les modules appellent conn.close() en fin d'utilisation : la connexion
+        # reste ouverte et sera réutilisée par le prochain rendu du même thread.
+        pass
+
+    def fermer(self):
+        """Ferme réellement la connexion."""
+        super().close()
+
+
+class EcrivainBase:
+    """
+    Thread d'écriture unique d'une base. Les écritures (fonctions recevant la
+    connexion) sont mises en file ; le thread prend toutes celles en attente,
+    les exécute dans une seule transaction (un SAVEPOINT par écriture quand
+    elles sont plusieurs, pour qu'un échec n'annule que l'écriture concernée)
+    puis valide une seule fois.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._file = queue.Queue()
+        self._conn = None
+        self._thread = threading.Thread(target=self._boucle, name=f"ecriture-{os.path.basename(pool.db_path)}",
+                                        daemon=True)
+        self._thread.start()
+
+    def soumettre(self, fonction):
+        """Ajoute une écriture à la file ; retourne un Future portant le résultat de fonction(conn)."""
+        futur = Future()
+        self._file.put((fonction, futur))
+        return futur
+
+    def actif(self):
+        return self._thread.is_alive()
+
+    def arreter(self):
+        self._file.put(None)
+        self._thread.join(timeout=DELAI_ECRITURE)
+
+    def _boucle(self):
+        while True:
+            element = self._file.get()
+            if element is None:
+                break
+            groupe = [element]
+            arret = False
+            while len(groupe) < TAILLE_MAX_GROUPE:
+                try:
+                    suivant = self._file.get_nowait()
+                except queue.Empty:
+                    break
+                if suivant is None:
+                    arret = True
+                    break
+                groupe.append(suivant)
+            try:
+                self._executer_groupe(groupe)
+            except Exception as e:
+                # Transaction annulée par SQLite (disque plein, erreur d'E/S, interruption...) :
+                # tout le groupe échoue, le thread continue de servir les écritures suivantes
+                self._abandonner_groupe(groupe, e)
+            if arret:
+                break
+        if self._conn is not None:
+            self._conn.fermer()
+            self._conn = None
+
+    def _connexion(self):
+        if self._conn is None:
+            conn = self.pool._ouvrir()
+            for nom, valeur in PRAGMAS_ECRITURE.items():
+                conn.execute(f"PRAGMA {nom} = {valeur}")
+            # Transactions gérées explicitement (BEGIN IMMEDIATE / SAVEPOINT)
+            conn.isolation_level = None
+            self._conn = conn
+        return self._conn
+
+    def _abandonner_groupe(self, groupe, erreur):
+        """Termine en erreur les écritures non résolues d'un groupe et annule sa transaction."""
+        for _, futur in groupe:
+            try:
+                futur.set_exception(erreur)
+            except InvalidStateError:
+                pass  # écriture déjà résolue ou annulée par l'appelant
+        try:
+            if self._conn is not None and self._conn.in_transaction:
+                self._conn.rollback()
+        except sqlite3.Error:
+            # Connexion inutilisable : une nouvelle est ouverte à la prochaine écriture
+            try:
+                self._conn.fermer()
+            except sqlite3.Error:
+                pass
+            self._conn = None
+
+    def _executer_groupe(self, groupe):
+        resultats = []
+        try:
+            conn = self._connexion()
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error as e:
+            for _, futur in groupe:
+                futur.set_exception(e)
+            return
+
+        # Une écriture seule n'a pas besoin de SAVEPOINT : en cas d'échec, toute la transaction est annulée
+        if len(groupe) == 1:
+            fonction, futur = groupe[0]
+            if not futur.set_running_or_notify_cancel():
+                conn.rollback()
+                return
+            try:
+                resultat = fonction(conn)
+                conn.commit()
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.rollback()
+                futur.set_exception(e)
+                return
+            futur.set_result(resultat)
+            return
+
+        for fonction, futur in groupe:
+            if not futur.set_running_or_notify_cancel():
+                continue
+            conn.execute("SAVEPOINT ecriture")
+            try:
+                resultat = fonction(conn)
+                conn.execute("RELEASE ecriture")
+                resultats.append((futur, resultat, None))
+            except Exception as e:
+                if not conn.in_transaction:
+                    # SQLite a annulé toute la transaction : les écritures précédentes du groupe sont perdues
+                    raise
+                conn.execute("ROLLBACK TO ecriture")
+                conn.execute("RELEASE ecriture")
+                resultats.append((futur, None, e))
+
+        try:
+            conn.commit()
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.rollback()
+            for futur, _, _ in resultats:
+                futur.set_exception(e)
+            return
+        for futur, resultat, erreur in resultats:
+            if erreur is not None:
+                futur.set_exception(erreur)
+            else:
+                futur.set_result(resultat)
+
+
+class PoolConnexions:
+    """
+    Pool de connexions pour une base de coopérative.
+    Chaque thread (un rendu Streamlit) dispose de sa propre connexion ; les
+    connexions des threads terminés sont vérifiées puis réutilisées.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._verrou = threading.Lock()
+        self._verrou_schema = threading.Lock()
+        self._schema_a_jour = False
+        self._actives = {}  # thread -> connexion
+        self._libres = []
+        self._ecrivain = None
+        self._archives = OrderedDict()  # alias -> chemin des archives à attacher
+        self.version_donnees = 0
+
+    def _ouvrir(self):
+        # uri=True : les archives sont attachées par URI en mode lecture seule
+        conn = sqlite3.connect(pathlib.Path(self.db_path).absolute().as_uri(), check_same_thread=False,
+                               factory=ConnexionPool, uri=True)
+        for nom, valeur in PRAGMAS_CONNEXION.items():
+            conn.execute(f"PRAGMA {nom} = {valeur}")
+        self._migrer(conn)
+        conn.pool = self
+        conn._changements_valides = conn.total_changes
+        return conn
+
+    def signaler_modification(self):
+        """Incrémente la version des données après une écriture validée."""
+        with self._verrou:
+            self.version_donnees += 1
+
+    def _migrer(self, conn):
+        """Applique les migrations de schéma une seule fois par base (première ouverture)."""
+        if self._schema_a_jour:
+            return
+        with self._verrou_schema:
+            if not self._schema_a_jour:
+                db_migrations.appliquer_migrations(conn)
+                self._schema_a_jour = True
+
+    @staticmethod
+    def _est_saine(conn):
+        """Vérifie qu'une connexion réutilisée est encore exploitable."""
+        try:
+            if conn.in_transaction:
+                # Transaction laissée ouverte par un rendu interrompu
+                conn.rollback()
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _recycler(self):
+        """Récupère les connexions des threads terminés (reruns précédents)."""
+        for thread in [t for t in self._actives if not t.is_alive()]:
+            self._libres.append(self._actives.pop(thread))
+        while len(self._libres) > TAILLE_MAX_LIBRES:
+            self._libres.pop(0).fermer()
+
+    def attacher_archive(self, alias, chemin):
+        """
+        Demande l'attachement d'une base d'archive (lecture seule) aux connexions
+        de lecture du pool ; il est effectif à leur prochaine utilisation.
+        """
+        with self._verrou:
+            self._archives[alias] = chemin
+            self._archives.move_to_end(alias)
+            while len(self._archives) > MAX_ARCHIVES_ATTACHEES:
+                self._archives.popitem(last=False)
+
+    def synchroniser_archives(self, conn):
+        """Attache (ou détache) les archives demandées sur une connexion hors transaction."""
+        with self._verrou:
+            attendues = dict(self._archives)
+        actuelles = conn.archives_attachees or {}
+        if actuelles == attendues or conn.in_transaction:
+            return
+        attachees = dict(actuelles)
+        try:
+            for alias, chemin in actuelles.items():
+                if attendues.get(alias) != chemin:
+                    conn.execute(f"DETACH DATABASE {alias}")
+                    del attachees[alias]
+            for alias, chemin in attendues.items():
+                if alias not in attachees and os.path.exists(chemin):
+                    uri = pathlib.Path(chemin).absolute().as_uri() + "?mode=ro"
+                    conn.execute(f"ATTACH DATABASE ? AS {alias}", (uri,))
+                    attachees[alias] = chemin
+        except sqlite3.OperationalError:
+            # Base d'archive en cours d'utilisation par une requête : nouvel essai au prochain appel
+            pass
+        conn.archives_attachees = attachees
+
+    def connexion(self):
+        """Retourne la connexion du thread courant, en l'ouvrant si nécessaire."""
+        thread = threading.current_thread()
+        with self._verrou:
+            conn = self._actives.get(thread)
+            if conn is None:
+                self._recycler()
+                conn = self._libres.pop() if self._libres else None
+                nouvelle = True
+            else:
+                nouvelle = False
+        if not nouvelle:
+            self.synchroniser_archives(conn)
+            return conn
+
+        if conn is not None and not self._est_saine(conn):
+            try:
+                conn.fermer()
+            except sqlite3.Error:
+                pass
+            conn = None
+        if conn is None:
+            conn = self._ouvrir()
+
+        with self._verrou:
+            self._actives[thread] = conn
+        self.synchroniser_archives(conn)
+        return conn
+
+    def ecrivain(self):
+        """Thread d'écriture de la base, démarré à la première écriture (et redémarré s'il s'est arrêté)."""
+        with self._verrou:
+            if self._ecrivain is None or not self._ecrivain.actif():
+                self._ecrivain = EcrivainBase(self)
+            return self._ecrivain
+
+    def fermer_tout(self):
+        """Ferme toutes les connexions du pool (ex. avant suppression du fichier)."""
+        with self._verrou:
+            connexions = list(self._actives.values()) + self._libres
+            self._actives.clear()
+            self._libres = []
+            ecrivain, self._ecrivain = self._ecrivain, None
+        if ecrivain is not None:
+            ecrivain.arreter()
+        for conn in connexions:
+            try:
+                conn.fermer()
+            except sqlite3.Error:
+                pass
+
+
+@st.cache_resource(show_spinner=False)
+def _pool_pour_chemin(chemin_absolu):
+    return PoolConnexions(chemin_absolu)
+
+
+def get_pool(db_path):
+    """Retourne le pool partagé (entre sessions) associé à une base de coopérative."""
+    return _pool_pour_chemin(os.path.abspath(db_path))
+
+
+def version_donnees(db_path=None):
+    """
+    Retourne la version courante des données d'une base : elle change à chaque
+    écriture validée via le pool et sert de clé d'invalidation des caches.
+    """
+    db_path = db_path or st.session_state.get("db_path")
+    if not db_path:
+        return 0
+    return get_pool(db_path).version_donnees
+
+
+def get_connection(db_path=None):
+    """
+    Retourne une connexion poolée vers la base de la coopérative.
+    Utilise st.session_state["db_path"] si aucun chemin n'est fourni.
+    """
+    db_path = db_path or st.session_state.get("db_path")
+    if not db_path:
+        return None
+    return get_pool(db_path).connexion()
+
+
+def executer_ecriture(fonction, db_path=None):
+    """
+    Exécute fonction(conn) sur le thread d'écriture de la base et retourne son
+    résultat (ou relève son exception). La fonction ne doit pas appeler
+    commit() : la validation est faite par le thread, groupée avec les autres
+    écritures en attente. Les lectures restent faites avec get_connection().
+    Lève TimeoutError si l'écriture n'a pas commencé après DELAI_ECRITURE
+    secondes : elle est alors annulée et ne sera jamais exécutée.
+    """
+    db_path = db_path or st.session_state.get("db_path")
+    futur = get_pool(db_path).ecrivain().soumettre(fonction)
+    try:
+        return futur.result(timeout=DELAI_ECRITURE)
+    except TimeoutError:
+        if futur.cancel():
+            raise TimeoutError("Base occupée : l'écriture a été annulée, aucune donnée n'a été enregistrée.")
+        # Écriture déjà en cours : son issue (validée ou annulée) est attendue
+        return futur.result()
+
+
+def ecrire(requete, parametres=(), db_path=None):
+    """Exécute une requête d'écriture via le thread d'écriture ; retourne le nombre de lignes modifiées."""
+    return executer_ecriture(lambda conn: conn.execute(requete, parametres).rowcount, db_path)
+
+
+def ecrire_plusieurs(requetes, db_path=None):
+    """Exécute une liste de (requete, parametres) de façon atomique via le thread d'écriture."""
+    def executer(conn):
+        for requete, parametres in requetes:
+            conn.execute(requete, parametres)
+    return executer_ecriture(executer, db_path)
@@ -0,0 +1,153 @@
+# Modules/db_stocks.py
+
+from datetime import date
+
+# Grand livre des stocks : chaque entrée ou sortie est un mouvement ajouté à
+# mouvements_stock (jamais modifié), rattaché au lot concerné (table stocks,
+# dont quantite est le reste du lot). Les soldes par produit (culture × type ×
+# qualité) sont tenus dans soldes_stock par trigger : le formulaire de vente et
+# l'état des stocks lisent une ligne par produit au lieu de parcourir les lots.
+# Les ventes sont imputées aux lots les plus anciens (FIFO) dans une seule
+# transaction, par décrément conditionnel de chaque lot.
+# Module sans dépendance à Streamlit (utilisé par les migrations).
+
+# Valeurs retenues quand un lot ancien n'a pas de culture, de type ou de qualité
+CULTURE_DEFAUT = "Hévéa"
+TYPE_DEFAUT = "brut"
+QUALITE_DEFAUT = "Standard"
+
+# Tolérance sur les quantités (kg) : un reliquat inférieur est considéré nul
+EPSILON = 1e-9
+
+# Lots non épuisés d'un produit, dans l'ordre d'imputation FIFO (index idx_stocks_lots_fifo)
+REQUETE_LOTS_FIFO = """
+    SELECT id, quantite FROM stocks
+    WHERE culture_nom = ? AND type_produit = ? AND qualite = ? AND quantite > 0
+    ORDER BY date_entree, id
+"""
+
+
+def creer_declencheurs_soldes(conn):
+    """(Re)crée les triggers du grand livre : ajout seul et maintien de soldes_stock."""
+    conn.execute("DROP TRIGGER IF EXISTS trg_mouvements_stock_update")
+    conn.execute("""
+        CREATE TRIGGER trg_mouvements_stock_update BEFORE UPDATE ON mouvements_stock BEGIN
+            SELECT RAISE(ABORT, 'mouvements_stock : un mouvement ne peut pas être modifié');
+        END
+    """)
+    for evenement, signe in (("INSERT", "NEW"), ("DELETE", "OLD")):
+        # Une entrée ajoute au solde, une sortie retire ; la suppression d'un mouvement l'annule
+        facteur = "1" if evenement == "INSERT" else "-1"
+        conn.execute(f"DROP TRIGGER IF EXISTS trg_soldes_stock_{evenement.lower()}")
+        conn.execute(f"""
+            CREATE TRIGGER trg_soldes_stock_{evenement.lower()} AFTER {evenement} ON mouvements_stock BEGIN
+                INSERT INTO soldes_stock (culture_nom, type_produit, qualite, quantite, date_maj)
+                VALUES ({signe}.culture_nom, {signe}.type_produit, {signe}.qualite,
+                        {facteur} * CASE {signe}.sens WHEN 'entree' THEN {signe}.quantite ELSE -{signe}.quantite END,
+                        {signe}.date_mouvement)
+                ON CONFLICT (culture_nom, type_produit, qualite)
+                DO UPDATE SET quantite = quantite + excluded.quantite,
+                              date_maj = MAX(COALESCE(date_maj, ''), excluded.date_maj);
+                DELETE FROM soldes_stock
+                WHERE culture_nom = {signe}.culture_nom AND type_produit = {signe}.type_produit
+                  AND qualite = {signe}.qualite AND quantite <= {EPSILON};
+            END
+        """)
+
+
+def reconstruire_soldes(conn):
+    """Recalcule entièrement soldes_stock à partir du grand livre."""
+    conn.execute("DELETE FROM soldes_stock")
+    conn.execute(f"""
+        INSERT INTO soldes_stock (culture_nom, type_produit, qualite, quantite, date_maj)
+        SELECT culture_nom, type_produit, qualite,
+               SUM(CASE sens WHEN 'entree' THEN quantite ELSE -quantite END), MAX(date_mouvement)
+        FROM mouvements_stock
+        GROUP BY culture_nom, type_produit, qualite
+        HAVING SUM(CASE sens WHEN 'entree' THEN quantite ELSE -quantite END) > {EPSILON}
+    """)
+
+
+def reprendre_lots_existants(conn):
+    """
+    Migration : normalise les lots existants (valeurs par défaut affichées jusqu'ici)
+    et enregistre une entrée de reprise pour le reste de chaque lot.
+    """
+    conn.execute("""
+        UPDATE stocks SET
+            culture_nom = COALESCE(culture_nom, ?),
+            type_produit = COALESCE(type_produit, ?),
+            qualite = COALESCE(qualite, ?),
+            date_entree = COALESCE(date_entree, date_mouvement)
+    """, (CULTURE_DEFAUT, TYPE_DEFAUT, QUALITE_DEFAUT))
+    conn.execute("""
+        INSERT INTO mouvements_stock (date_mouvement, sens, culture_nom, type_produit, qualite, quantite, id_lot, motif)
+        SELECT COALESCE(date_entree, ?), 'entree', culture_nom, type_produit, qualite, quantite, id, 'reprise'
+        FROM stocks WHERE quantite > 0
+    """, (date.today().isoformat(),))
+
+
+def entrer_en_stock(conn, culture_id, culture_nom, type_produit, qualite, quantite, date_entree, observations=""):
+    """Crée un lot et son mouvement d'entrée (sans commit). Retourne l'id du lot."""
+    if quantite <= 0:
+        raise ValueError("La quantité doit être positive.")
+    date_entree = str(date_entree)
+    id_lot = conn.execute("""
+        INSERT INTO stocks (culture_id, culture_nom, type_produit, qualite, quantite, date_entree, observations)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (culture_id, culture_nom, type_produit, qualite, quantite, date_entree, observations)).lastrowid
+    conn.execute("""
+        INSERT INTO mouvements_stock (date_mouvement, sens, culture_nom, type_produit, qualite, quantite, id_lot, motif)
+        VALUES (?, 'entree', ?, ?, ?, ?, ?, 'entree')
+    """, (date_entree, culture_nom, type_produit, qualite, quantite, id_lot))
+    return id_lot
+
+
+def vendre_fifo(conn, culture_nom, type_produit, qualite, quantite, vente):
+    """
+    Enregistre une vente et l'impute aux lots du produit, du plus ancien au plus
+    récent (sans commit). vente : dict des autres colonnes de ventes (prix_unitaire,
+    prix_total, client, date_vente, mode_paiement, observations, culture_id).
+    Retourne (id de la vente, [(id_lot, quantité prélevée), ...]).
+    Lève ValueError si le stock du produit est insuffisant : l'appelant (thread
+    d'écriture, voir db_pool.executer_ecriture) annule alors toute l'opération.
+    """
+    if quantite <= 0:
+        raise ValueError("La quantité doit être positive.")
+    date_vente = str(vente.get("date_vente") or date.today())
+    id_vente = conn.execute("""
+        INSERT INTO ventes (culture_id, culture_nom, type_produit, qualite, quantite,
+                            prix_unitaire, prix_total, client, date_vente, mode_paiement, observations)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (vente.get("culture_id"), culture_nom, type_produit, qualite, quantite,
+          vente.get("prix_unitaire"), vente.get("prix_total"), vente.get("client"), date_vente,
+          vente.get("mode_paiement"), vente.get("observations"))).lastrowid
+
+    reste = quantite
+    imputations = []
+    lots = conn.execute(REQUETE_LOTS_FIFO, (culture_nom, type_produit, qualite))
+    for id_lot, disponible in lots.fetchall():
+        prelevement = min(disponible, reste)
+        # Décrément conditionnel : ne jamais rendre un lot négatif
+        if conn.execute("UPDATE stocks SET quantite = quantite - ? WHERE id = ? AND quantite >= ?",
+                        (prelevement, id_lot, prelevement)).rowcount == 0:
+            continue
+        conn.execute("""
+            INSERT INTO mouvements_stock (date_mouvement, sens, culture_nom, type_produit, qualite, quantite,
+                                          id_lot, id_vente, motif)
+            VALUES (?, 'sortie', ?, ?, ?, ?, ?, ?, 'vente')
+        """, (date_vente, culture_nom, type_produit, qualite, prelevement, id_lot, id_vente))
+        imputations.append((id_lot, prelevement))
+        reste -= prelevement
+        if reste <= EPSILON:
+            return id_vente, imputations
+
+    disponible_total = quantite - reste
+    raise ValueError(f"Stock insuffisant : {disponible_total:g} kg disponibles pour {quantite:g} kg demandés.")
+
+
+def vider_stocks(conn):
+    """Supprime tous les lots, le grand livre et les soldes (réinitialisation)."""
+    conn.execute("DELETE FROM mouvements_stock")
+    conn.execute("DELETE FROM soldes_stock")
+    conn.execute("DELETE FROM stocks")
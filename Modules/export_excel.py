@@ -0,0 +1,124 @@
+# Modules/export_excel.py
+
+from datetime import date, datetime
+
+import pandas as pd
+import xlsxwriter
+
+# Écriture des classeurs Excel en mode constant_memory : chaque ligne est
+# écrite sur disque dès qu'elle est complète, directement depuis le curseur
+# SQLite, sans construire de DataFrame pour la totalité de l'historique.
+
+TAILLE_LOT_CURSEUR = 1000   # lignes lues par fetchmany()
+LARGEUR_MAX_COLONNE = 50    # largeur maximale (en caractères) d'une colonne
+LIGNES_MESUREES = 1000      # lignes utilisées pour estimer la largeur des colonnes
+
+
+def _lignes_source(source, conn):
+    """
+    Retourne (entêtes, itérateur de lignes) pour une requête {'sql', 'params'}
+    exécutée sur conn, ou pour un DataFrame.
+    """
+    if isinstance(source, pd.DataFrame):
+        return [str(c) for c in source.columns], source.itertuples(index=False, name=None)
+
+    curseur = conn.execute(source["sql"], source["params"])
+    entetes = [description[0] for description in curseur.description]
+
+    def lignes():
+        while True:
+            lot = curseur.fetchmany(TAILLE_LOT_CURSEUR)
+            if not lot:
+                break
+            yield from lot
+    return entetes, lignes()
+
+
+def _date_iso(valeur):
+    """Convertit une date texte ISO ('AAAA-MM-JJ' ou 'AAAA-MM-JJ HH:MM:SS') ; None sinon."""
+    if isinstance(valeur, (datetime, date)):
+        return valeur
+    if isinstance(valeur, str) and len(valeur) >= 10 and valeur[4] == '-' and valeur[7] == '-':
+        try:
+            return datetime.fromisoformat(valeur)
+        except ValueError:
+            return None
+    return None
+
+
+def _ecrire_feuille(feuille, entetes, lignes, formats, progression=None):
+    """Écrit une feuille ligne par ligne (ordre imposé par le mode constant_memory)."""
+    colonnes_dates = {i for i, nom in enumerate(entetes) if nom.lower().startswith('date')}
+    largeurs = [len(nom) for nom in entetes]
+
+    feuille.write_row(0, 0, entetes, formats["entete"])
+    feuille.freeze_panes(1, 0)
+
+    numero = 0
+    for numero, ligne in enumerate(lignes, start=1):
+        mesurer = numero <= LIGNES_MESUREES
+        if progression and numero % TAILLE_LOT_CURSEUR == 0:
+            progression(numero)
+        for colonne, valeur in enumerate(ligne):
+            if valeur is None or valeur != valeur:  # None, NaN, NaT
+                continue
+            if isinstance(valeur, pd.Timestamp):
+                valeur = valeur.to_pydatetime()
+            if colonne in colonnes_dates or isinstance(valeur, (datetime, date)):
+                valeur_date = _date_iso(valeur)
+                if valeur_date is not None:
+                    a_heure = isinstance(valeur_date, datetime) and (valeur_date.hour or valeur_date.minute or valeur_date.second)
+                    feuille.write_datetime(numero, colonne, valeur_date,
+                                           formats["date_heure"] if a_heure else formats["date"])
+                    if mesurer:
+                        largeurs[colonne] = max(largeurs[colonne], 16 if a_heure else 10)
+                    continue
+            if isinstance(valeur, bool):
+                feuille.write_boolean(numero, colonne, valeur)
+            elif isinstance(valeur, (int, float)) or hasattr(valeur, "dtype"):
+                feuille.write_number(numero, colonne, float(valeur))
+                if mesurer:
+                    largeurs[colonne] = max(largeurs[colonne], len(str(valeur)))
+            else:
+                texte = str(valeur)
+                feuille.write_string(numero, colonne, texte)
+                if mesurer:
+                    largeurs[colonne] = max(largeurs[colonne], len(texte))
+
+    for colonne, largeur in enumerate(largeurs):
+        feuille.set_column(colonne, colonne, min(largeur + 2, LARGEUR_MAX_COLONNE))
+    if entetes:
+        feuille.autofilter(0, 0, max(numero, 1), len(entetes) - 1)
+    return numero
+
+
+def ecrire_classeur(chemin, feuilles, conn=None, progression=None):
+    """
+    Écrit un classeur Excel sur disque en mode constant_memory.
+
+    - feuilles : liste de (nom de feuille, source) ; source est une requête
+      {'sql', 'params'} lue par lots sur conn, ou un DataFrame (ex. un résumé)
+    - les colonnes date* contenant des dates ISO sont écrites comme des dates
+      Excel, les valeurs numériques comme des nombres
+    - progression : fonction appelée avec le nombre de lignes écrites (par lot)
+
+    Retourne le nombre de lignes de données écrites par feuille.
+    """
+    classeur = xlsxwriter.Workbook(chemin, {'constant_memory': True, 'strings_to_numbers': False})
+    formats = {
+        "entete": classeur.add_format({'bold': True, 'bg_color': '#4F81BD', 'font_color': '#FFFFFF', 'border': 1}),
+        "date": classeur.add_format({'num_format': 'dd/mm/yyyy'}),
+        "date_heure": classeur.add_format({'num_format': 'dd/mm/yyyy hh:mm'}),
+    }
+    nb_lignes = {}
+    try:
+        for nom_feuille, source in feuilles:
+            # Excel limite les noms de feuille à 31 caractères
+            feuille = classeur.add_worksheet(nom_feuille[:31])
+            entetes, lignes = _lignes_source(source, conn)
+            deja_ecrites = sum(nb_lignes.values())
+            suivi = (lambda n, d=deja_ecrites: progression(d + n)) if progression else None
+            nb_lignes[nom_feuille] = _ecrire_feuille(feuille, entetes, lignes, formats, suivi)
+    finally:
+        classeur.close()
+    return nb_lignes
@@ -0,0 +1,167 @@
+# Modules/exports.py
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+import pandas as pd
+import streamlit as st
+
+from Modules import db_pool, export_excel
+
+# Les fichiers d'export ne sont générés qu'au clic sur le bouton de
+# téléchargement (données passées à st.download_button sous forme de
+# fonction), puis conservés sur disque : un second clic avec les mêmes
+# filtres et les mêmes données ne régénère rien.
+
+MIME_EXCEL = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+MIME_PDF = 'application/pdf'
+
+DOSSIER_CACHE_EXPORTS = os.path.join(tempfile.gettempdir(), "coop_exports")
+DUREE_CACHE_EXPORTS = 3600       # secondes avant suppression d'un fichier généré
+TAILLE_LOT_EXPORT = 5000         # lignes lues par lot pour les exports PDF
+
+# La version des données (db_pool.version_donnees) repart de zéro à chaque
+# démarrage : le jeton de processus évite de servir un fichier d'une exécution
+# précédente pour une version identique mais des données différentes.
+_JETON_PROCESSUS = uuid.uuid4().hex
+_verrous_generation = {}  # chemin -> [verrou, générations en cours ou en attente]
+_verrou_global = threading.Lock()
+
+
+def _empreinte_source(source):
+    """Empreinte stable d'une source d'export : requête {'sql', 'params'} ou DataFrame."""
+    if isinstance(source, pd.DataFrame):
+        contenu = pd.util.hash_pandas_object(source, index=False).values.tobytes()
+        return hashlib.sha256(contenu + repr(list(source.columns)).encode()).hexdigest()
+    return json.dumps([source["sql"], list(source["params"])], default=str)
+
+
+def _chemin_cache(format_export, empreinte, titre, db_path):
+    cle = json.dumps([
+        format_export, titre, empreinte,
+        os.path.abspath(db_path) if db_path else None,
+        db_pool.version_donnees(db_path) if db_path else None,
+        _JETON_PROCESSUS,
+    ])
+    return os.path.join(DOSSIER_CACHE_EXPORTS, hashlib.sha256(cle.encode()).hexdigest() + "." + format_export)
+
+
+def _purger_cache():
+    """Supprime les fichiers d'export plus anciens que DUREE_CACHE_EXPORTS."""
+    limite = time.time() - DUREE_CACHE_EXPORTS
+    try:
+        for nom in os.listdir(DOSSIER_CACHE_EXPORTS):
+            chemin = os.path.join(DOSSIER_CACHE_EXPORTS, nom)
+            if os.path.getmtime(chemin) < limite:
+                os.remove(chemin)
+    except OSError:
+        pass
+
+
+def _lire_source(source, db_path, taille_lot=None):
+    """
+    Lit les données à exporter. Une requête est exécutée sur une connexion du
+    pool ouverte dans le thread de génération ; avec taille_lot, retourne un
+    itérateur de DataFrames pour ne jamais charger tout l'historique d'un coup.
+    """
+    if isinstance(source, pd.DataFrame):
+        return [source] if taille_lot else source
+    conn = db_pool.get_pool(db_path).connexion()
+    return pd.read_sql_query(source["sql"], conn, params=source["params"], chunksize=taille_lot)
+
+
+def _generer_fichier(chemin, generer):
+    """Génère le fichier dans un fichier temporaire puis le renomme (un fichier en cache est toujours complet)."""
+    os.makedirs(DOSSIER_CACHE_EXPORTS, exist_ok=True)
+    _purger_cache()
+    # Le fichier temporaire garde l'extension du fichier final
+    racine, extension = os.path.splitext(chemin)
+    temporaire = f"{racine}.{uuid.uuid4().hex}.tmp{extension}"
+    try:
+        generer(temporaire)
+        os.replace(temporaire, chemin)
+    finally:
+        if os.path.exists(temporaire):
+            os.remove(temporaire)
+
+
+def _fichier_en_cache(chemin, generer):
+    """Retourne le contenu du fichier en cache, en le générant une seule fois si nécessaire."""
+    with _verrou_global:
+        entree = _verrous_generation.setdefault(chemin, [threading.Lock(), 0])
+        entree[1] += 1
+    try:
+        for tentative in range(2):
+            with entree[0]:
+                if not os.path.exists(chemin):
+                    _generer_fichier(chemin, generer)
+            try:
+                with open(chemin, "rb") as fichier:
+                    return fichier.read()
+            except FileNotFoundError:
+                # Fichier expiré supprimé par la purge d'une autre session entre la
+                # vérification et la lecture : il est régénéré (une seule fois)
+                if tentative:
+                    raise
+    finally:
+        # Le verrou d'un fichier n'est conservé que tant qu'une session l'utilise
+        with _verrou_global:
+            entree[1] -= 1
+            if not entree[1]:
+                del _verrous_generation[chemin]
+
+
+def _ecrire_excel(feuilles, db_path, chemin):
+    """Écrit le classeur directement sur disque depuis le curseur SQLite (mode constant_memory)."""
+    requetes = [src for _, src in feuilles if not isinstance(src, pd.DataFrame)]
+    conn = db_pool.get_pool(db_path).connexion() if requetes else None
+    export_excel.ecrire_classeur(chemin, feuilles, conn)
+
+
+def bouton_export_excel(label, source, file_name, nom_feuille="Export", feuilles_supplementaires=None,
+                        key=None, db_path=None):
+    """
+    Bouton de téléchargement Excel dont le fichier n'est généré qu'au clic.
+    source : requête {'sql', 'params'} (ex. celle retournée par requete_paginee) ou DataFrame.
+    feuilles_supplementaires : {nom de feuille: source} pour les classeurs à plusieurs feuilles.
+    """
+    db_path = db_path or st.session_state.get("db_path")
+    feuilles = [(nom_feuille, source)] + list((feuilles_supplementaires or {}).items())
+    cle = hashlib.sha256("|".join(nom + _empreinte_source(src) for nom, src in feuilles).encode()).hexdigest()
+    chemin = _chemin_cache("xlsx", cle, nom_feuille, db_path)
+
+    def generer():
+        return _fichier_en_cache(chemin, lambda cible: _ecrire_excel(feuilles, db_path, cible))
+
+    return st.download_button(label=label, data=generer, file_name=file_name, mime=MIME_EXCEL,
+                              key=key, on_click="ignore")
+
+
+def bouton_export_pdf(label, source, file_name, generer_pdf, titre=None, key=None, db_path=None):
+    """
+    Bouton de téléchargement PDF dont le document n'est généré qu'au clic.
+    generer_pdf(donnees, titre, db_path) doit retourner le contenu du PDF (bytes) ;
+    pour une requête, donnees est un itérateur de lots de lignes (DataFrames).
+    """
+    db_path = db_path or st.session_state.get("db_path")
+    chemin = _chemin_cache("pdf", _empreinte_source(source), titre or file_name, db_path)
+
+    def ecrire_pdf(cible):
+        contenu = generer_pdf(_lire_source(source, db_path, TAILLE_LOT_EXPORT), titre, db_path)
+        if hasattr(contenu, "getvalue"):
+            contenu = contenu.getvalue()
+        if not contenu:
+            raise ValueError("La génération du PDF n'a produit aucun contenu")
+        with open(cible, "wb") as fichier:
+            fichier.write(contenu)
+
+    def generer():
+        return _fichier_en_cache(chemin, ecrire_pdf)
+
+    return st.download_button(label=label, data=generer, file_name=file_name, mime=MIME_PDF,
+                              key=key, on_click="ignore")
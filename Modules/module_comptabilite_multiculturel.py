@@ -2,18 +2,18 @@ import streamlit as st
 import sqlite3
 import pandas as pd
 from datetime import date, datetime
-from io import BytesIO
+from Modules import db_pool
+from Modules.exports import bouton_export_excel, bouton_export_pdf
+from Modules.taches import afficher_taches, bouton_tache, requete_export, soumettre_tache, type_tache
 
 # Import conditionnel des modules
 try:
-    from Modules.module_cultures import get_cultures_actives, initialize_cultures_table
+    from Modules.module_cultures import get_cultures_actives
 except ImportError as e:
     st.error(f"Erreur d'import module_cultures: {e}")
     # Fonctions de fallback
     def get_cultures_actives():
         return [{"id": 1, "nom_culture": "Hévéa"}]
-    def initialize_cultures_table():
-        pass
 
 try:
     from Modules.download_button_styles import apply_download_button_styles
@@ -21,16 +21,9 @@ except ImportError:
     def apply_download_button_styles():
         pass
 
-# ReportLab imports avec gestion d'erreur
-try:
-    from reportlab.lib import colors
-    from reportlab.lib.pagesizes import letter
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-    from reportlab.lib.styles import getSampleStyleSheet
-    from reportlab.lib.units import inch
-    REPORTLAB_AVAILABLE = True
-except ImportError:
-    REPORTLAB_AVAILABLE = False
+# Export PDF (ReportLab optionnel)
+from Modules.rapport_pdf import REPORTLAB_AVAILABLE, generer_pdf
+if not REPORTLAB_AVAILABLE:
     st.warning("⚠️ ReportLab n'est pas installé. L'export PDF ne sera pas disponible.")
 
 def get_connection():
@@ -39,7 +32,7 @@ def get_connection():
         if not db_path:
             st.error("❌ Aucune base de données sélectionnée. Veuillez retourner à l'accueil pour sélectionner une coopérative.")
             st.stop()
-        return sqlite3.connect(db_path, check_same_thread=False)
+        return db_pool.get_connection(db_path)
     except sqlite3.Error as e:
         st.error(f"Erreur de connexion à la base de données : {e}")
         return None
@@ -48,144 +41,85 @@ def get_connection():
         return None
 
 def initialize_multicultural_accounting():
-    """Initialise les tables de comptabilité multiculturelle"""
-    conn = get_connection()
-    c = conn.cursor()
-    
-    # Créer la table transactions si elle n'existe pas
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            type_transaction TEXT,
-            montant REAL,
-            date_transaction TEXT,
-            description TEXT,
-            categorie TEXT,
-            culture_id INTEGER,
-            culture_nom TEXT
-        )
-    ''')
-    
-    # Vérifier et ajouter les colonnes culture aux tables existantes
-    try:
-        c.execute("PRAGMA table_info(transactions)")
-        columns_transactions = [column[1] for column in c.fetchall()]
-        
-        if 'culture_id' not in columns_transactions:
-            c.execute("ALTER TABLE transactions ADD COLUMN culture_id INTEGER")
-        if 'culture_nom' not in columns_transactions:
-            c.execute("ALTER TABLE transactions ADD COLUMN culture_nom TEXT")
-        if 'type_transaction' not in columns_transactions:
-            c.execute("ALTER TABLE transactions ADD COLUMN type_transaction TEXT")
-        if 'categorie' not in columns_transactions:
-            c.execute("ALTER TABLE transactions ADD COLUMN categorie TEXT")
-        if 'date_transaction' not in columns_transactions:
-            c.execute("ALTER TABLE transactions ADD COLUMN date_transaction TEXT")
-    except Exception as e:
-        print(f"Erreur lors de la modification de la table transactions: {e}")
-    
-    # Créer une table pour les revenus par culture
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS revenus_cultures (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            culture_id INTEGER,
-            culture_nom TEXT,
-            periode TEXT,
-            revenus_ventes REAL DEFAULT 0,
-            couts_production REAL DEFAULT 0,
-            autres_revenus REAL DEFAULT 0,
-            autres_charges REAL DEFAULT 0,
-            benefice_net REAL DEFAULT 0,
-            date_calcul DATE
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    """
+    Conservée pour compatibilité : les tables transactions et revenus_cultures
+    sont créées par les migrations de schéma (Modules/db_migrations.py).
+    """
+    get_connection()
 
-def export_df_to_pdf_bytes(df, title="Export Comptabilité"):
-    """Exporte un DataFrame en PDF avec titre"""
-    if not REPORTLAB_AVAILABLE:
-        st.error("ReportLab n'est pas installé. Impossible d'exporter en PDF.")
-        return None
-    
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=0.5*inch, leftMargin=0.5*inch, topMargin=0.5*inch, bottomMargin=0.5*inch)
-    story = []
-    
-    # Ajouter un titre
-    styles = getSampleStyleSheet()
-    title_style = styles['Title']
-    story.append(Paragraph(title, title_style))
-    story.append(Spacer(1, 12))
+# Mise en page PDF des états comptables (exports immédiats et en arrière-plan)
+OPTIONS_PDF = {
+    "largeurs_colonnes": {'type_transaction': 1.2, 'description': 2.0, 'periode': 0.8,
+                          'revenus_ventes': 1.0, 'couts_production': 1.0, 'benefice_net': 1.0},
+    "colonnes_numeriques": ['montant', 'revenus_ventes', 'couts_production', 'benefice_net'],
+}
 
-    headers = df.columns.tolist()
-    data_list = df.values.tolist()
-    
-    data_for_table = [headers] + [[str(cell) if cell is not None else '' for cell in row] for row in data_list]
+# Rapport annuel par culture (bornes [1er janvier, 1er janvier suivant))
+REQUETE_RAPPORT_ANNUEL = '''
+    SELECT COALESCE(culture_nom, 'Général') as culture,
+           SUM(CASE WHEN type_transaction = 'Recette' THEN montant ELSE 0 END) as recettes,
+           SUM(CASE WHEN type_transaction = 'Dépense' THEN montant ELSE 0 END) as depenses,
+           SUM(CASE WHEN type_transaction = 'Recette' THEN montant ELSE -montant END) as solde
+    FROM transactions
+    WHERE date_transaction >= ? AND date_transaction < ?
+    GROUP BY culture_nom
+    ORDER BY solde DESC
+'''
+requete_export("rapport_annuel_transactions", {"sql": REQUETE_RAPPORT_ANNUEL})
 
-    page_width, _ = letter
-    available_width = page_width - 1*inch
-    num_cols = len(headers)
-    
-    col_widths_map = {
-        'id': 0.4*inch,
-        'culture': 1.0*inch,
-        'type_transaction': 1.2*inch,
-        'montant': 1.0*inch,
-        'date_transaction': 1.0*inch,
-        'description': 2.0*inch,
-        'periode': 0.8*inch,
-        'revenus_ventes': 1.0*inch,
-        'couts_production': 1.0*inch,
-        'benefice_net': 1.0*inch
-    }
-    
-    actual_col_widths = []
-    default_col_width = (available_width / num_cols) if num_cols > 0 else 1*inch
-    
-    for header in headers:
-        actual_col_widths.append(col_widths_map.get(header, default_col_width))
-    
-    current_total_width = sum(actual_col_widths)
-    if current_total_width > available_width and current_total_width > 0:
-        scale_factor = available_width / current_total_width
-        actual_col_widths = [w * scale_factor for w in actual_col_widths]
-    elif num_cols > 0 and not actual_col_widths:
-        actual_col_widths = [default_col_width] * num_cols
+# Historique des transactions
+REQUETE_HISTORIQUE_TRANSACTIONS = '''
+    SELECT id, type_transaction, COALESCE(culture_nom, 'Général') as culture,
+           montant, date_transaction, categorie, description
+    FROM transactions
+    ORDER BY date_transaction DESC
+'''
 
-    table = Table(data_for_table, colWidths=actual_col_widths if actual_col_widths and num_cols > 0 else None)
+def bornes_annee(annee):
+    return f"{int(annee):04d}-01-01", f"{int(annee) + 1:04d}-01-01"
 
-    style_commands = [
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#4F81BD")),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 9),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 6),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor("#DCE6F1")),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('LEFTPADDING', (0,0), (-1,-1), 3),
-        ('RIGHTPADDING', (0,0), (-1,-1), 3),
-    ]
-    
-    # Alignement des colonnes numériques
-    numeric_cols = ['montant', 'revenus_ventes', 'couts_production', 'benefice_net']
-    for col_name in numeric_cols:
-        try:
-            col_idx = headers.index(col_name)
-            style_commands.append(('ALIGN', (col_idx, 1), (col_idx, -1), 'RIGHT'))
-        except ValueError:
-            pass
-        
-    table.setStyle(TableStyle(style_commands))
-    story.append(table)
-    doc.build(story)
-    return buffer.getvalue()
+def export_df_to_pdf_bytes(df, title="Export Comptabilité", db_path=None):
+    """Exporte un DataFrame (ou des lots de lignes) en PDF avec titre"""
+    return generer_pdf(df, titre=title, db_path=db_path, **OPTIONS_PDF)
+
+def calculer_revenus_cultures(conn, periode_debut, periode_fin):
+    """
+    Recalcule revenus_cultures pour les périodes 'AAAA-MM' de periode_debut à periode_fin
+    (incluses), pour toutes les cultures actives, à partir des agrégats mensuels.
+    Retourne le nombre de lignes écrites.
+    """
+    lignes = conn.execute('''
+        SELECT cu.id, cu.nom_culture, a.periode,
+               SUM(CASE WHEN a.indicateur IN ('ventes_montant', 'recettes') THEN a.valeur ELSE 0 END) AS revenus,
+               SUM(CASE WHEN a.indicateur = 'depenses' THEN a.valeur ELSE 0 END) AS couts
+        FROM agregats_mensuels a
+        JOIN cultures cu ON cu.nom_culture = a.culture AND cu.actif = 1
+        WHERE a.periode BETWEEN ? AND ?
+          AND a.indicateur IN ('ventes_montant', 'recettes', 'depenses')
+        GROUP BY cu.id, cu.nom_culture, a.periode
+    ''', (periode_debut, periode_fin)).fetchall()
+
+    date_calcul = date.today()
+    valeurs = [(culture_id, culture_nom, periode, revenus, couts, revenus - couts, date_calcul)
+               for culture_id, culture_nom, periode, revenus, couts in lignes]
+
+    def remplacer(conn_ecriture):
+        # Remplacer les anciens calculs de la plage dans une seule transaction
+        conn_ecriture.execute("DELETE FROM revenus_cultures WHERE periode BETWEEN ? AND ?", (periode_debut, periode_fin))
+        conn_ecriture.executemany('''
+            INSERT INTO revenus_cultures 
+            (culture_id, culture_nom, periode, revenus_ventes, couts_production, benefice_net, date_calcul)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', valeurs)
+
+    db_pool.executer_ecriture(remplacer, conn.pool.db_path)
+    return len(valeurs)
+
+@type_tache("revenus_cultures")
+def _tache_revenus_cultures(conn, parametres, base_fichier, progression):
+    """Recalcul des revenus par culture exécuté par la file de tâches."""
+    nb_lignes = calculer_revenus_cultures(conn, parametres["periode_debut"], parametres["periode_fin"])
+    return {"message": f"{nb_lignes} ligne(s) calculée(s) de {parametres['periode_debut']} à {parametres['periode_fin']}"}
 
 def gestion_comptabilite():
     """Interface de gestion de la comptabilité multiculturelle"""
@@ -196,10 +130,6 @@ def gestion_comptabilite():
     
     st.header("📊 Comptabilité Multi-Cultures")
     
-    # Initialiser les tables
-    initialize_cultures_table()
-    initialize_multicultural_accounting()
-    
     # Onglets
     onglets = st.tabs([
         "💰 Transactions", 
@@ -258,11 +188,10 @@ def gestion_comptabilite():
                         culture_id = culture_info['id'] if culture_info else None
                         culture_nom = culture_selectionnee
                     
-                    c.execute('''
+                    db_pool.ecrire('''
                         INSERT INTO transactions (type_transaction, montant, date_transaction, description, categorie, culture_id, culture_nom)
                         VALUES (?, ?, ?, ?, ?, ?, ?)
                     ''', (type_transaction, montant, date_transaction, description, categorie, culture_id, culture_nom))
-                    conn.commit()
                     st.success("✅ Transaction enregistrée avec succès!")
                     st.rerun()
                 else:
@@ -272,12 +201,7 @@ def gestion_comptabilite():
             st.subheader("📋 Historique des transactions")
             
             # Récupérer les transactions
-            df_transactions = pd.read_sql_query('''
-                SELECT id, type_transaction, COALESCE(culture_nom, 'Général') as culture,
-                       montant, date_transaction, categorie, description
-                FROM transactions
-                ORDER BY date_transaction DESC
-            ''', conn)
+            df_transactions = pd.read_sql_query(REQUETE_HISTORIQUE_TRANSACTIONS, conn)
             
             if not df_transactions.empty:
                 # Convertir la date
@@ -336,33 +260,17 @@ def gestion_comptabilite():
                         
                         st.dataframe(df, use_container_width=True)
                         
-                        # Export
+                        # Export (fichiers générés uniquement au clic)
                         col1, col2 = st.columns(2)
                         with col1:
-                            output_transactions = BytesIO()
-                            with pd.ExcelWriter(output_transactions, engine='xlsxwriter') as writer:
-                                df.to_excel(writer, index=False, sheet_name='Transactions')
-                            
-                            st.download_button(
-                                label="📥 Exporter en Excel",
-                                data=output_transactions.getvalue(),
-                                file_name='transactions_multiculturelles.xlsx',
-                                mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-                            )
+                            bouton_export_excel("📥 Exporter en Excel", df, 'transactions_multiculturelles.xlsx',
+                                                nom_feuille='Transactions', key='excel_download_transactions')
                         
                         with col2:
                             if REPORTLAB_AVAILABLE:
-                                try:
-                                    pdf_data = export_df_to_pdf_bytes(df, "Historique des Transactions")
-                                    if pdf_data:
-                                        st.download_button(
-                                            label="📄 Exporter en PDF",
-                                            data=pdf_data,
-                                            file_name='transactions_multiculturelles.pdf',
-                                            mime='application/pdf'
-                                        )
-                                except Exception as e:
-                                    st.error(f"Erreur PDF : {e}")
+                                bouton_export_pdf("📄 Exporter en PDF", df, 'transactions_multiculturelles.pdf',
+                                                  export_df_to_pdf_bytes, titre="Historique des Transactions",
+                                                  key='pdf_download_transactions')
                             else:
                                 st.info("📄 Export PDF non disponible (ReportLab non installé)")
                     else:
@@ -379,6 +287,16 @@ def gestion_comptabilite():
     with onglets[1]:
         st.subheader("📈 Analyse des revenus par culture")
         
+        # Plage de périodes à (re)calculer
+        periodes_disponibles = [ligne[0] for ligne in c.execute(
+            "SELECT DISTINCT periode FROM agregats_mensuels WHERE periode <> '' ORDER BY periode"
+        ).fetchall()] or [datetime.now().strftime("%Y-%m")]
+        col_debut, col_fin = st.columns(2)
+        with col_debut:
+            periode_debut = st.selectbox("📅 Période de début", periodes_disponibles, index=0, key="revenus_periode_debut")
+        with col_fin:
+            periode_fin = st.selectbox("📅 Période de fin", periodes_disponibles, index=len(periodes_disponibles) - 1, key="revenus_periode_fin")
+        
         # Boutons d'action
         col1, col2 = st.columns(2)
         
@@ -388,81 +306,22 @@ def gestion_comptabilite():
         with col2:
             reinitialiser_revenus = st.button("🗑️ Réinitialiser les données", type="secondary")
         
-        # Calculer automatiquement les revenus par culture
+        # Calculer les revenus par culture et par mois sur la plage choisie
         if calculer_revenus:
-            try:
-                # Récupérer les ventes par culture
-                ventes_par_culture = pd.read_sql_query('''
-                    SELECT COALESCE(culture_nom, 'Hévéa') as culture, SUM(prix_total) as revenus_ventes
-                    FROM ventes
-                    GROUP BY culture_nom
-                ''', conn)
-                
-                # Récupérer les dépenses par culture
-                depenses_par_culture = pd.read_sql_query('''
-                    SELECT COALESCE(culture_nom, 'Général') as culture, SUM(montant) as couts
-                    FROM transactions
-                    WHERE type_transaction = 'Dépense'
-                    GROUP BY culture_nom
-                ''', conn)
-                
-                # Calculer et sauvegarder
-                periode_actuelle = datetime.now().strftime("%Y-%m")
-                cultures_actives = get_cultures_actives()
-                
-                # Supprimer les anciens calculs pour cette période
-                c.execute("DELETE FROM revenus_cultures WHERE periode = ?", (periode_actuelle,))
-                
-                for culture in cultures_actives:
-                    culture_nom = culture['nom_culture']
-                    
-                    # Revenus des ventes (de la table ventes)
-                    revenus_ventes_row = ventes_par_culture[ventes_par_culture['culture'] == culture_nom]
-                    revenus_ventes = revenus_ventes_row['revenus_ventes'].iloc[0] if not revenus_ventes_row.empty else 0
-                    # S'assurer que ce n'est pas None
-                    revenus_ventes = revenus_ventes if revenus_ventes is not None else 0
-                    
-                    # Revenus des transactions (recettes)
-                    recettes_transactions = pd.read_sql_query('''
-                        SELECT SUM(montant) as recettes
-                        FROM transactions
-                        WHERE type_transaction = 'Recette' AND COALESCE(culture_nom, 'Général') = ?
-                    ''', conn, params=(culture_nom,))
-                    
-                    recettes_montant = recettes_transactions['recettes'].iloc[0] if not recettes_transactions.empty else 0
-                    recettes_montant = recettes_montant if recettes_montant is not None else 0
-                    
-                    # Total des revenus (ventes + recettes)
-                    total_revenus = revenus_ventes + recettes_montant
-                    
-                    # Coûts de production
-                    couts_production_row = depenses_par_culture[depenses_par_culture['culture'] == culture_nom]
-                    couts_production = couts_production_row['couts'].iloc[0] if not couts_production_row.empty else 0
-                    # S'assurer que ce n'est pas None
-                    couts_production = couts_production if couts_production is not None else 0
-                    
-                    # Bénéfice net
-                    benefice_net = total_revenus - couts_production
-                    
-                    # Sauvegarder (utiliser total_revenus au lieu de revenus_ventes)
-                    c.execute('''
-                        INSERT INTO revenus_cultures 
-                        (culture_id, culture_nom, periode, revenus_ventes, couts_production, benefice_net, date_calcul)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)
-                    ''', (culture['id'], culture_nom, periode_actuelle, total_revenus, couts_production, benefice_net, date.today()))
-                
-                conn.commit()
-                st.success("✅ Calcul des revenus terminé!")
-                
-                # Marquer que le calcul est terminé et s'assurer que le flag de réinitialisation est à False
-                st.session_state["calcul_termine"] = True
-                st.session_state["confirm_reinit_revenus"] = False  # Reset le flag de réinitialisation
-                
-                                
-            except Exception as e:
-                st.error(f"Erreur lors du calcul: {e}")
-                st.write("Détails de l'erreur:", str(e))
-                return  # Arrêter l'exécution en cas d'erreur
+            if periode_debut > periode_fin:
+                st.error("❌ La période de début doit précéder la période de fin.")
+            else:
+                try:
+                    # Calcul exécuté par la file de tâches : la session reste utilisable
+                    soumettre_tache("revenus_cultures", f"Revenus par culture de {periode_debut} à {periode_fin}",
+                                    {"periode_debut": periode_debut, "periode_fin": periode_fin},
+                                    categorie="revenus_cultures")
+                    st.success(f"✅ Calcul des revenus de {periode_debut} à {periode_fin} lancé en arrière-plan.")
+                    st.session_state["confirm_reinit_revenus"] = False  # Reset le flag de réinitialisation
+                except Exception as e:
+                    st.error(f"Erreur lors du lancement du calcul: {e}")
+        
+        afficher_taches("revenus_cultures", titre="📋 Calculs en cours et récents")
         
         # Réinitialiser les données de revenus
         if reinitialiser_revenus:
@@ -477,8 +336,7 @@ def gestion_comptabilite():
                 col_confirm1, col_confirm2 = st.columns(2)
                 with col_confirm1:
                     if st.button("✅ Confirmer la suppression", type="primary", key="confirm_delete_revenus"):
-                        c.execute("DELETE FROM revenus_cultures")
-                        conn.commit()
+                        db_pool.ecrire("DELETE FROM revenus_cultures")
                         st.success("✅ Toutes les données de revenus ont été supprimées.")
                         st.session_state.confirm_reinit_revenus = False
                         st.rerun()
@@ -493,14 +351,9 @@ def gestion_comptabilite():
             df_revenus = pd.read_sql_query('''
                 SELECT culture_nom as culture, periode, revenus_ventes, couts_production, benefice_net, date_calcul
                 FROM revenus_cultures
-                ORDER BY date_calcul DESC, culture_nom
+                ORDER BY periode DESC, culture_nom
             ''', conn)
             
-            # Afficher un message si le calcul vient d'être terminé
-            if st.session_state.get("calcul_termine", False):
-                st.success("✅ Données mises à jour avec succès!")
-                st.session_state["calcul_termine"] = False  # Reset le flag
-            
             if not df_revenus.empty:
                 st.subheader("📊 Données des revenus par culture")
                 st.dataframe(df_revenus, use_container_width=True)
@@ -524,7 +377,7 @@ def gestion_comptabilite():
         df_revenus = pd.read_sql_query('''
             SELECT culture_nom as culture, periode, revenus_ventes, couts_production, benefice_net, date_calcul
             FROM revenus_cultures
-            ORDER BY date_calcul DESC, culture_nom
+            ORDER BY periode DESC, culture_nom
         ''', conn)
     
     # Onglet 3: Tableau de bord
@@ -535,9 +388,13 @@ def gestion_comptabilite():
         col1, col2, col3, col4 = st.columns(4)
         
         # Calculs généraux
-        total_recettes = c.execute("SELECT SUM(montant) FROM transactions WHERE type_transaction = 'Recette'").fetchone()[0] or 0
-        total_depenses = c.execute("SELECT SUM(montant) FROM transactions WHERE type_transaction = 'Dépense'").fetchone()[0] or 0
-        total_ventes = c.execute("SELECT SUM(prix_total) FROM ventes").fetchone()[0] or 0
+        total_recettes, total_depenses, total_ventes = c.execute('''
+            SELECT COALESCE(SUM(CASE WHEN indicateur = 'recettes' THEN valeur END), 0),
+                   COALESCE(SUM(CASE WHEN indicateur = 'depenses' THEN valeur END), 0),
+                   COALESCE(SUM(CASE WHEN indicateur = 'ventes_montant' THEN valeur END), 0)
+            FROM agregats_mensuels
+            WHERE indicateur IN ('recettes', 'depenses', 'ventes_montant')
+        ''').fetchone()
         nb_cultures = len(get_cultures_actives())
         
         with col1:
@@ -597,19 +454,12 @@ def gestion_comptabilite():
                 if not rapport_data.empty:
                     st.dataframe(rapport_data, use_container_width=True)
                     
-                    # Export du rapport
+                    # Export du rapport (généré au clic)
                     if REPORTLAB_AVAILABLE:
-                        try:
-                            pdf_data = export_df_to_pdf_bytes(rapport_data, f"Rapport Mensuel - {mois_rapport:02d}/{annee_rapport}")
-                            if pdf_data:
-                                st.download_button(
-                                    label="📄 Télécharger le rapport PDF",
-                                    data=pdf_data,
-                                    file_name=f'rapport_mensuel_{mois_rapport:02d}_{annee_rapport}.pdf',
-                                    mime='application/pdf'
-                                )
-                        except Exception as e:
-                            st.error(f"Erreur PDF : {e}")
+                        titre_mensuel = f"Rapport Mensuel - {mois_rapport:02d}/{annee_rapport}"
+                        bouton_export_pdf("📄 Télécharger le rapport PDF", rapport_data,
+                                          f'rapport_mensuel_{mois_rapport:02d}_{annee_rapport}.pdf',
+                                          export_df_to_pdf_bytes, titre=titre_mensuel, key='pdf_rapport_mensuel')
                     else:
                         st.info("📄 Export PDF non disponible (ReportLab non installé)")
                 else:
@@ -621,40 +471,35 @@ def gestion_comptabilite():
             
             if st.button("📄 Générer rapport annuel"):
                 # Générer le rapport annuel
-                debut_annee = f"{annee_rapport_annuel}-01-01"
-                fin_annee = f"{annee_rapport_annuel}-12-31"
-                
-                rapport_annuel = pd.read_sql_query('''
-                    SELECT COALESCE(culture_nom, 'Général') as culture,
-                           SUM(CASE WHEN type_transaction = 'Recette' THEN montant ELSE 0 END) as recettes,
-                           SUM(CASE WHEN type_transaction = 'Dépense' THEN montant ELSE 0 END) as depenses,
-                           SUM(CASE WHEN type_transaction = 'Recette' THEN montant ELSE -montant END) as solde
-                    FROM transactions
-                    WHERE date_transaction BETWEEN ? AND ?
-                    GROUP BY culture_nom
-                    ORDER BY solde DESC
-                ''', conn, params=(debut_annee, fin_annee))
+                rapport_annuel = pd.read_sql_query(REQUETE_RAPPORT_ANNUEL, conn,
+                                                   params=bornes_annee(annee_rapport_annuel))
                 
                 if not rapport_annuel.empty:
                     st.dataframe(rapport_annuel, use_container_width=True)
                     
-                    # Export du rapport annuel
+                    # Export du rapport annuel (généré au clic)
                     if REPORTLAB_AVAILABLE:
-                        try:
-                            pdf_data = export_df_to_pdf_bytes(rapport_annuel, f"Rapport Annuel - {annee_rapport_annuel}")
-                            if pdf_data:
-                                st.download_button(
-                                    label="📄 Télécharger le rapport annuel PDF",
-                                    data=pdf_data,
-                                    file_name=f'rapport_annuel_{annee_rapport_annuel}.pdf',
-                                    mime='application/pdf'
-                                )
-                        except Exception as e:
-                            st.error(f"Erreur PDF : {e}")
+                        titre_annuel = f"Rapport Annuel - {annee_rapport_annuel}"
+                        bouton_export_pdf("📄 Télécharger le rapport annuel PDF", rapport_annuel,
+                                          f'rapport_annuel_{annee_rapport_annuel}.pdf',
+                                          export_df_to_pdf_bytes, titre=titre_annuel, key='pdf_rapport_annuel')
                     else:
                         st.info("📄 Export PDF non disponible (ReportLab non installé)")
                 else:
                     st.info("Aucune donnée pour cette année.")
+            
+            # Rapport annuel détaillé généré par la file de tâches
+            if REPORTLAB_AVAILABLE:
+                bouton_tache("⏳ Préparer le rapport annuel PDF en arrière-plan", "export_pdf",
+                             f"Rapport Annuel - {annee_rapport_annuel}",
+                             {"requete": "rapport_annuel_transactions",
+                              "params": list(bornes_annee(annee_rapport_annuel)),
+                              "titre": f"Rapport Annuel - {annee_rapport_annuel}",
+                              "nom_fichier": f"rapport_annuel_{annee_rapport_annuel}",
+                              "options_pdf": OPTIONS_PDF},
+                             categorie="rapports_comptables", key="tache_rapport_annuel")
+        
+        afficher_taches("rapports_comptables", titre="📋 Rapports en cours et récents")
     
     # Onglet 5: Réinitialisation
     with onglets[4]:
@@ -673,8 +518,7 @@ def gestion_comptabilite():
             else:
                 st.warning("⚠️ Cette action supprimera **toutes les transactions** de manière irréversible.")
                 if st.button("✅ Confirmer la suppression", type="primary"):
-                    c.execute("DELETE FROM transactions")
-                    conn.commit()
+                    db_pool.ecrire("DELETE FROM transactions")
                     st.success("✅ Toutes les transactions ont été supprimées.")
                     st.session_state.confirm_suppression_comptabilite = False
                     st.rerun()
@@ -685,8 +529,7 @@ def gestion_comptabilite():
         with col2:
             st.subheader("🗑️ Supprimer les calculs de revenus")
             if st.button("🗑️ Supprimer les calculs de revenus", type="secondary"):
-                c.execute("DELETE FROM revenus_cultures")
-                conn.commit()
+                db_pool.ecrire("DELETE FROM revenus_cultures")
                 st.success("✅ Tous les calculs de revenus ont été supprimés.")
                 st.rerun()
     
@@ -1,105 +1,48 @@
 import streamlit as st
-import sqlite3
+from Modules import archives, db_pool
 from Modules.download_button_styles import apply_download_button_styles
+from Modules.exports import bouton_export_excel, bouton_export_pdf
+from Modules.taches import exports_arriere_plan, requete_export
+from Modules.pagination import requete_paginee, bornes_annee, conditions_filtres, expression_annee, valeurs_distinctes
+from Modules.db_agregats import CONDITION_EFFECTIVE
 
 import pandas as pd
 from datetime import date
-from io import BytesIO
 
-# ReportLab imports
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
-from reportlab.lib.units import inch
+# Export PDF
+from Modules.rapport_pdf import generer_pdf
 
 # Note: Session state initialization is handled by App_gestion.py
 # Removed global session state initialization to avoid conflicts
 
+# Historique des cotisations (requete_paginee) ; {table} : table vivante ou d'archive
+HISTORIQUE_COTISATIONS = requete_export("historique_cotisations", {
+    "colonnes": ["c.id", "c.id_membre", "m.nom AS membre", "c.montant", "c.date_paiement",
+                 "c.mode_paiement", "c.motif", "c.statut", "c.correction_id"],
+    "source": "FROM {table} c JOIN membres m ON c.id_membre = m.id",
+    "ordre": "c.date_paiement DESC, c.id DESC",
+    "table": "cotisations",
+    "filtres": {
+        "mois": "CAST(strftime('%m', c.date_paiement) AS INTEGER) = ?",
+        "annee": expression_annee("c.date_paiement"),
+        "membre": "m.nom = ?",
+    },
+})
+
 # Connexion dynamique à la base de données sélectionnée
 def get_connection():
-    return sqlite3.connect(st.session_state["db_path"], check_same_thread=False)
+    return db_pool.get_connection(st.session_state["db_path"])
 
-# Function to export DataFrame to PDF bytes using ReportLab
-def export_df_to_pdf_bytes(df):
-    buffer = BytesIO()
-    # Using letter paper size, and 0.5 inch margins
-    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=0.5*inch, leftMargin=0.5*inch, topMargin=0.5*inch, bottomMargin=0.5*inch)
-    story = []
+# Export PDF via le moteur commun (Modules/rapport_pdf.py)
+# Mise en page PDF propre aux cotisations (exports immédiats et en arrière-plan)
+OPTIONS_PDF = {
+    "largeurs_colonnes": {'id': 0.5, 'montant': 0.75, 'mode_paiement': 1.0, 'motif': 1.5,
+                          'statut': 0.75, 'correction_id': 1.0},
+    "colonnes_numeriques": ['montant'],
+}
 
-    headers = df.columns.tolist()
-    data_list = df.values.tolist()
-    
-    # Convert all data to string to avoid ReportLab errors with mixed types (e.g., date objects)
-    # and ensure None is handled as an empty string for PDF.
-    data_for_table = [headers] + [[str(cell) if cell is not None else '' for cell in row] for row in data_list]
-
-    # Define column widths
-    page_width, _ = letter
-    available_width = page_width - 1*inch # Total margin width (left + right)
-    num_cols = len(headers)
-    
-    # Adjusted col_widths_map for cotisations module
-    col_widths_map = {
-        'id': 0.5*inch,
-        'id_membre': 0.7*inch,
-        'membre': 1.5*inch,
-        'montant': 0.75*inch,
-        'date_paiement': 1.0*inch,
-        'mode_paiement': 1.0*inch,
-        'motif': 1.5*inch,
-        'statut': 0.75*inch,
-        'correction_id': 1.0*inch
-    }
-    
-    actual_col_widths = []
-    default_col_width = (available_width / num_cols) if num_cols > 0 else 1*inch
-    
-    for header in headers:
-        actual_col_widths.append(col_widths_map.get(header, default_col_width))
-    
-    current_total_width = sum(actual_col_widths)
-    if current_total_width > available_width and current_total_width > 0: # Scale if too wide
-        scale_factor = available_width / current_total_width
-        actual_col_widths = [w * scale_factor for w in actual_col_widths]
-    elif num_cols > 0 and not actual_col_widths: # Fallback if actual_col_widths is empty
-        actual_col_widths = [default_col_width] * num_cols
-
-    table = Table(data_for_table, colWidths=actual_col_widths if actual_col_widths and num_cols > 0 else None)
-
-    style_commands = [
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#4F81BD")),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 9),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 6),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor("#DCE6F1")),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('LEFTPADDING', (0,0), (-1,-1), 3),
-        ('RIGHTPADDING', (0,0), (-1,-1), 3),
-    ]
-    
-    # Specific alignments for certain columns if they exist
-    try:
-        montant_idx = headers.index('montant')
-        style_commands.append(('ALIGN', (montant_idx, 1), (montant_idx, -1), 'RIGHT'))
-    except ValueError:
-        pass
-    
-    try:
-        motif_idx = headers.index('motif') # Assuming 'motif' might be longer text
-        style_commands.append(('ALIGN', (motif_idx, 1), (motif_idx, -1), 'LEFT'))
-    except ValueError:
-        pass
-        
-    table.setStyle(TableStyle(style_commands))
-    story.append(table)
-    doc.build(story)
-    return buffer.getvalue()
+def export_df_to_pdf_bytes(df, title="Historique des cotisations", db_path=None):
+    return generer_pdf(df, titre=title, db_path=db_path, **OPTIONS_PDF)
 
 
 
@@ -115,16 +58,6 @@ def gestion_cotisations():
 
     st.header("💳 Suivi des Cotisations")
 
-    try:
-        c.execute("ALTER TABLE cotisations ADD COLUMN statut TEXT DEFAULT 'valide'")
-    except:
-        pass
-    try:
-        c.execute("ALTER TABLE cotisations ADD COLUMN correction_id INTEGER")
-    except:
-        pass
-    conn.commit()
-
     onglets = st.tabs(["➕ Nouvelle cotisation", "📖 Historique", "🧹 Réinitialisation"])
 
     # --- Onglet 1 : Nouvelle cotisation ---
@@ -138,38 +71,35 @@ def gestion_cotisations():
             motif = st.text_input("Motif", value="Cotisation ordinaire")
 
             if st.button("Enregistrer la cotisation"):
-                c.execute('''INSERT INTO cotisations (id_membre, montant, date_paiement, mode_paiement, motif, statut)
-                             VALUES (?, ?, ?, ?, ?, ?)''',
-                          (membre_selection[0], montant, date_paiement.strftime('%Y-%m-%d'), mode_paiement, motif, "valide"))
-                conn.commit()
+                db_pool.ecrire('''INSERT INTO cotisations (id_membre, montant, date_paiement, mode_paiement, motif, statut)
+                                  VALUES (?, ?, ?, ?, ?, ?)''',
+                               (membre_selection[0], montant, date_paiement.strftime('%Y-%m-%d'), mode_paiement, motif, "valide"))
                 st.success("Cotisation enregistrée.")
 
     # --- Onglet 2 : Historique ---
     with onglets[1]:
         st.subheader("Historique des cotisations")
         
-        # Récupérer toutes les cotisations pour les filtres
-        df_all = pd.read_sql_query('''
-            SELECT c.id, c.id_membre, m.nom AS membre, c.montant, c.date_paiement, c.mode_paiement, c.motif, c.statut, c.correction_id
-            FROM cotisations c
-            JOIN membres m ON c.id_membre = m.id
-            ORDER BY c.date_paiement DESC
-        ''', conn)
-        
-        if not df_all.empty:
-            # Convertir la date pour les filtres
-            df_all['date_paiement'] = pd.to_datetime(df_all['date_paiement'])
-            
-            # Filtres
+        campagnes_archivees = archives.annees_archivees(conn)
+        table_cotisations = "cotisations"
+        if c.execute("SELECT EXISTS(SELECT 1 FROM cotisations)").fetchone()[0] or campagnes_archivees:
+            # Filtres (options lues par requêtes DISTINCT, sans charger la table)
             col1, col2, col3 = st.columns(3)
             with col1:
-                months = ['Sélectionner un mois...'] + sorted(df_all['date_paiement'].dt.month.unique()) + ['Tous']
+                mois_disponibles = [int(m) for m in valeurs_distinctes(conn, "SELECT DISTINCT strftime('%m', date_paiement) FROM cotisations ORDER BY 1")]
+                months = ['Sélectionner un mois...'] + mois_disponibles + ['Tous']
                 filtre_mois = st.selectbox("Filtrer par mois", months, key="filtre_mois_cotisations")
             with col2:
-                years = ['Sélectionner une année...'] + sorted(df_all['date_paiement'].dt.year.unique()) + ['Tous']
+                # Années de la base et campagnes archivées (lues dans leur base d'archive)
+                annees = sorted({int(a) for a in valeurs_distinctes(conn, "SELECT DISTINCT substr(date_paiement, 1, 4) FROM cotisations")}
+                                | set(campagnes_archivees))
+                years = ['Sélectionner une année...'] + annees + ['Tous']
                 filtre_annee = st.selectbox("Filtrer par année", years, key="filtre_annee_cotisations")
             with col3:
-                membres_options = ['Sélectionner un membre...'] + sorted(df_all['membre'].unique()) + ['Tous']
+                membres_cotisants = valeurs_distinctes(conn, """
+                    SELECT DISTINCT m.nom FROM cotisations c JOIN membres m ON c.id_membre = m.id ORDER BY 1
+                """)
+                membres_options = ['Sélectionner un membre...'] + membres_cotisants + ['Tous']
                 filtre_membre = st.selectbox("Filtrer par membre", membres_options, key="filtre_membre_cotisations")
             
             # Afficher le dataframe seulement si un filtre est sélectionné
@@ -177,46 +107,40 @@ def gestion_cotisations():
                 filtre_annee != 'Sélectionner une année...' or 
                 filtre_membre != 'Sélectionner un membre...'):
                 
-                df = df_all.copy()
-                
-                # Appliquer les filtres
-                if filtre_mois != 'Tous' and filtre_mois != 'Sélectionner un mois...':
-                    df = df[df['date_paiement'].dt.month == filtre_mois]
-                if filtre_annee != 'Tous' and filtre_annee != 'Sélectionner une année...':
-                    df = df[df['date_paiement'].dt.year == filtre_annee]
-                if filtre_membre != 'Tous' and filtre_membre != 'Sélectionner un membre...':
-                    df = df[df['membre'] == filtre_membre]
+                # Filtres appliqués en SQL ; seule la page visible est chargée
+                table_cotisations = archives.source_annee(conn, "cotisations", filtre_annee)
+                if table_cotisations != "cotisations":
+                    st.caption(f"🗄️ Campagne {filtre_annee} archivée : consultation seule.")
+                filtres = {
+                    "mois": None if filtre_mois in ('Sélectionner un mois...', 'Tous') else filtre_mois,
+                    "annee": bornes_annee(None if filtre_annee in ('Sélectionner une année...', 'Tous') else filtre_annee),
+                    "membre": None if filtre_membre in ('Sélectionner un membre...', 'Tous') else filtre_membre,
+                }
+                df, totaux, requete = requete_paginee(
+                    conn, "historique_cotisations",
+                    colonnes=HISTORIQUE_COTISATIONS["colonnes"],
+                    source=HISTORIQUE_COTISATIONS["source"].format(table=table_cotisations),
+                    conditions=conditions_filtres(HISTORIQUE_COTISATIONS, filtres),
+                    ordre=HISTORIQUE_COTISATIONS["ordre"],
+                    agregats={"montant_total": f"COALESCE(SUM(CASE WHEN {CONDITION_EFFECTIVE.format(r='c')} THEN c.montant END), 0)"},
+                )
                 
                 st.dataframe(df)
-
-                # Boutons d'export seulement si des données sont affichées
-                output = BytesIO()
-                with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                    df.to_excel(writer, index=False, sheet_name='Cotisations')
-                    processed_data = output.getvalue()
-
-                st.download_button(
-                    label="📥 Exporter les cotisations (Excel)",
-                    data=processed_data,
-                    file_name='cotisations.xlsx',
-                    mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-                )
-
-                # PDF Export
-                if not df.empty:
-                    try:
-                        pdf_export_buffer_cotisations = export_df_to_pdf_bytes(df.copy())
-                        st.download_button(
-                            label="📥 Exporter les cotisations (PDF)",
-                            data=pdf_export_buffer_cotisations,
-                            file_name='cotisations.pdf',
-                            mime='application/pdf',
-                            key='pdf_download_cotisations'
-                        )
-                    except Exception as e:
-                        st.error(f"Erreur lors de la génération du PDF : {e}")
+                st.caption(f"{totaux['nb_lignes']} cotisation(s) — montant total hors erreurs : {totaux['montant_total']:,.0f} FCFA")
+
+                # Boutons d'export seulement si des données sont affichées ;
+                # les fichiers portent sur toutes les lignes filtrées et ne sont générés qu'au clic
+                if totaux["nb_lignes"]:
+                    bouton_export_excel("📥 Exporter les cotisations (Excel)", requete, 'cotisations.xlsx',
+                                        nom_feuille='Cotisations', key='excel_download_cotisations')
+                    bouton_export_pdf("📥 Exporter les cotisations (PDF)", requete, 'cotisations.pdf',
+                                      export_df_to_pdf_bytes, titre="Historique des cotisations",
+                                      key='pdf_download_cotisations')
+                    exports_arriere_plan("historique_cotisations", "historique_cotisations", table_cotisations, filtres,
+                                         "cotisations", "Historique des cotisations", nom_feuille="Cotisations",
+                                         options_pdf=OPTIONS_PDF)
                 else:
-                    st.caption("Aucune donnée à exporter en PDF.")
+                    st.caption("Aucune donnée à exporter.")
             else:
                 st.info("Veuillez sélectionner un filtre pour afficher l'historique des cotisations.")
                 df = pd.DataFrame()  # DataFrame vide pour éviter les erreurs dans la section suivante
@@ -224,8 +148,8 @@ def gestion_cotisations():
             st.info("Aucune cotisation enregistrée.")
             df = pd.DataFrame()
 
-        # Section des corrections - seulement si des données sont affichées
-        if not df.empty:
+        # Section des corrections - pour les cotisations de la page affichée (hors archives)
+        if not df.empty and table_cotisations == "cotisations":
             for index, row in df.iterrows():
                 with st.expander(f"Cotisation #{row['id']} - {row['membre']} ({row['statut']})"):
                     st.write(f"Montant : {row['montant']} FCFA")
@@ -245,11 +169,12 @@ def gestion_cotisations():
                         mode_corrige = st.selectbox("Nouveau mode", ["Espèces", "Mobile money", "Virement"], key=f"mode_corrige_{row['id']}")
                         motif_corrige = st.text_input("Nouveau motif", key=f"motif_corrige_{row['id']}")
                         if st.button(f"Corriger cotisation #{row['id']}"):
-                            c.execute("UPDATE cotisations SET statut = 'erreur' WHERE id = ?", (row["id"],))
-                            c.execute('''INSERT INTO cotisations (id_membre, montant, date_paiement, mode_paiement, motif, statut, correction_id)
-                                         VALUES (?, ?, ?, ?, ?, 'correction', ?)''',
-                                      (row['id_membre'], montant_corrige, date_corrigee.strftime('%Y-%m-%d'), mode_corrige, motif_corrige, row["id"]))
-                            conn.commit()
+                            db_pool.ecrire_plusieurs([
+                                ("UPDATE cotisations SET statut = 'erreur' WHERE id = ?", (row["id"],)),
+                                ('''INSERT INTO cotisations (id_membre, montant, date_paiement, mode_paiement, motif, statut, correction_id)
+                                     VALUES (?, ?, ?, ?, ?, 'correction', ?)''',
+                                 (row['id_membre'], montant_corrige, date_corrigee.strftime('%Y-%m-%d'), mode_corrige, motif_corrige, row["id"])),
+                            ])
                             st.success(f"Cotisation #{row['id']} corrigée avec succès.")
                             st.rerun()
 
@@ -266,8 +191,7 @@ def gestion_cotisations():
             st.warning("⚠️ Cette action supprimera **toutes les cotisations** de manière irréversible.")
             col1, col2 = st.columns(2)
             if col1.button("Confirmer la suppression"):
-                c.execute("DELETE FROM cotisations")
-                conn.commit()
+                db_pool.ecrire("DELETE FROM cotisations")
                 st.success("Toutes les cotisations ont été supprimées.")
                 st.session_state.confirm_suppression_cotisations = False
                 st.rerun()
@@ -3,50 +3,18 @@ import sqlite3
 import pandas as pd
 from datetime import date
 from io import BytesIO
+from Modules import db_pool
 
 def get_connection():
-    return sqlite3.connect(st.session_state["db_path"], check_same_thread=False)
+    return db_pool.get_connection(st.session_state["db_path"])
 
 def initialize_cultures_table():
-    """Initialise la table des cultures si elle n'existe pas"""
-    conn = get_connection()
-    c = conn.cursor()
-    
-    # Table des cultures disponibles pour la coopérative
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS cultures (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nom_culture TEXT NOT NULL UNIQUE,
-            unite_mesure TEXT DEFAULT 'kg',
-            qualites_disponibles TEXT, -- JSON string des qualités
-            types_produits TEXT, -- JSON string des types de produits
-            actif INTEGER DEFAULT 1
-        )
-    ''')
-    
-    # Modifier la table productions pour inclure la culture
-    try:
-        c.execute("ALTER TABLE productions ADD COLUMN culture_id INTEGER")
-        c.execute("ALTER TABLE productions ADD COLUMN culture_nom TEXT")
-    except:
-        pass
-    
-    # Modifier la table stocks pour inclure la culture
-    try:
-        c.execute("ALTER TABLE stocks ADD COLUMN culture_id INTEGER")
-        c.execute("ALTER TABLE stocks ADD COLUMN culture_nom TEXT")
-    except:
-        pass
-    
-    # Modifier la table ventes pour inclure la culture
-    try:
-        c.execute("ALTER TABLE ventes ADD COLUMN culture_id INTEGER")
-        c.execute("ALTER TABLE ventes ADD COLUMN culture_nom TEXT")
-    except:
-        pass
-    
-    conn.commit()
-    conn.close()
+    """
+    Conservée pour compatibilité : la table des cultures et les colonnes culture_*
+    sont créées par les migrations de schéma (Modules/db_migrations.py),
+    appliquées une seule fois à l'ouverture de la base.
+    """
+    get_connection()
 
 def ajouter_culture_par_defaut():
     """Ajoute l'hévéa comme culture par défaut si aucune culture n'existe"""
@@ -62,12 +30,10 @@ def ajouter_culture_par_defaut():
         qualites_hevea = json.dumps(["Bonne", "Moyenne", "Mauvaise"])
         types_hevea = json.dumps(["brut", "transformé"])
         
-        c.execute('''
+        db_pool.ecrire('''
             INSERT INTO cultures (nom_culture, unite_mesure, qualites_disponibles, types_produits, actif)
             VALUES (?, ?, ?, ?, ?)
         ''', ("Hévéa", "kg", qualites_hevea, types_hevea, 1))
-        
-        conn.commit()
     
     conn.close()
 
@@ -75,8 +41,7 @@ def gestion_cultures():
     """Interface de gestion des cultures"""
     st.header("🌱 Gestion des Cultures")
     
-    # Initialiser les tables
-    initialize_cultures_table()
+    # Ajouter la culture par défaut si nécessaire
     ajouter_culture_par_defaut()
     
     conn = get_connection()
@@ -117,8 +82,7 @@ def gestion_cultures():
                     
                     # Bouton pour désactiver
                     if st.button(f"Désactiver {culture['nom_culture']}", key=f"desactiver_{culture['id']}"):
-                        c.execute("UPDATE cultures SET actif = 0 WHERE id = ?", (culture['id'],))
-                        conn.commit()
+                        db_pool.ecrire("UPDATE cultures SET actif = 0 WHERE id = ?", (culture['id'],))
                         st.success(f"Culture {culture['nom_culture']} désactivée")
                         st.rerun()
         else:
@@ -204,11 +168,10 @@ def gestion_cultures():
                         types_json = json.dumps(types_selectionnes)
                         
                         try:
-                            c.execute('''
+                            db_pool.ecrire('''
                                 INSERT INTO cultures (nom_culture, unite_mesure, qualites_disponibles, types_produits, actif)
                                 VALUES (?, ?, ?, ?, ?)
                             ''', (nom_culture.strip(), unite_mesure, qualites_json, types_json, 1))
-                            conn.commit()
                             st.success(f"Culture '{nom_culture}' ajoutée avec succès!")
                             st.rerun()
                         except sqlite3.IntegrityError:
@@ -230,31 +193,16 @@ def gestion_cultures():
         """)
         
         if st.button("Migrer les données existantes vers Hévéa"):
-            # Migrer les productions
-            c.execute("""
-                UPDATE productions 
-                SET culture_id = (SELECT id FROM cultures WHERE nom_culture = 'Hévéa' LIMIT 1),
-                    culture_nom = 'Hévéa'
-                WHERE culture_id IS NULL
-            """)
-            
-            # Migrer les stocks
-            c.execute("""
-                UPDATE stocks 
-                SET culture_id = (SELECT id FROM cultures WHERE nom_culture = 'Hévéa' LIMIT 1),
-                    culture_nom = 'Hévéa'
-                WHERE culture_id IS NULL
-            """)
-            
-            # Migrer les ventes
-            c.execute("""
-                UPDATE ventes 
-                SET culture_id = (SELECT id FROM cultures WHERE nom_culture = 'Hévéa' LIMIT 1),
-                    culture_nom = 'Hévéa'
-                WHERE culture_id IS NULL
-            """)
-            
-            conn.commit()
+            # Migrer les productions, les stocks et les ventes en une seule transaction
+            db_pool.ecrire_plusieurs([
+                (f"""
+                    UPDATE {table}
+                    SET culture_id = (SELECT id FROM cultures WHERE nom_culture = 'Hévéa' LIMIT 1),
+                        culture_nom = 'Hévéa'
+                    WHERE culture_id IS NULL
+                """, ())
+                for table in ("productions", "stocks", "ventes")
+            ])
             st.success("Migration terminée! Toutes les données existantes sont maintenant associées à l'Hévéa.")
     
     conn.close()
@@ -266,6 +214,36 @@ def get_cultures_actives():
     conn.close()
     return cultures.to_dict('records')
 
+def get_referentiel_cultures():
+    """
+    Charge en une seule requête les métadonnées de toutes les cultures
+    (id, qualités, types de produits), indexées par nom de culture.
+    """
+    import json
+    conn = get_connection()
+    lignes = conn.execute(
+        "SELECT id, nom_culture, unite_mesure, qualites_disponibles, types_produits, actif FROM cultures"
+    ).fetchall()
+    conn.close()
+
+    def _liste_json(valeur, defaut):
+        try:
+            return json.loads(valeur) if valeur else defaut
+        except (ValueError, TypeError):
+            return defaut
+
+    return {
+        nom_culture: {
+            'id': culture_id,
+            'nom_culture': nom_culture,
+            'unite_mesure': unite_mesure,
+            'qualites': _liste_json(qualites, ["Bonne", "Moyenne", "Mauvaise"]),
+            'types_produits': _liste_json(types_produits, ["brut", "transformé"]),
+            'actif': actif
+        }
+        for culture_id, nom_culture, unite_mesure, qualites, types_produits, actif in lignes
+    }
+
 def get_qualites_culture(culture_id):
     """Retourne les qualités disponibles pour une culture"""
     conn = get_connection()
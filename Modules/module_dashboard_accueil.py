@@ -1,7 +1,7 @@
 import streamlit as st
-import sqlite3
 import pandas as pd
 from datetime import datetime, timedelta
+from Modules import db_pool
 
 # Import conditionnel de plotly et numpy
 try:
@@ -20,86 +20,117 @@ def get_connection():
         db_path = st.session_state.get("db_path")
         if not db_path:
             return None
-        return sqlite3.connect(db_path, check_same_thread=False)
+        return db_pool.get_connection(db_path)
     except Exception:
         return None
 
+# Durée de vie maximale (secondes) des agrégats en cache ; toute écriture
+# validée via le pool les invalide immédiatement (version des données).
+DUREE_CACHE_DASHBOARD = 300
+
+@st.cache_data(ttl=DUREE_CACHE_DASHBOARD, show_spinner=False)
+def _calculer_donnees_dashboard(db_path, version_donnees):
+    """
+    Calcule en une passe, sur une seule connexion, tous les agrégats du tableau de bord.
+    version_donnees ne sert qu'à la clé du cache.
+    """
+    conn = db_pool.get_connection(db_path)
+
+    # Production par mois et par culture (table agregats_mensuels maintenue par triggers)
+    df_production = pd.read_sql_query('''
+    SELECT 
+        periode,
+        culture,
+        valeur as quantite_totale,
+        nb as nb_livraisons,
+        valeur / nb as quantite_moyenne
+    FROM agregats_mensuels
+    WHERE indicateur = 'production'
+    ORDER BY periode
+    ''', conn)
+
+    # Recettes par mois (transactions + ventes)
+    df_transactions = pd.read_sql_query('''
+    SELECT 
+        periode,
+        culture,
+        SUM(CASE WHEN indicateur = 'recettes' THEN valeur ELSE 0 END) as recettes_transactions,
+        SUM(CASE WHEN indicateur = 'depenses' THEN valeur ELSE 0 END) as depenses
+    FROM agregats_mensuels
+    WHERE indicateur IN ('recettes', 'depenses')
+    GROUP BY periode, culture
+    ''', conn)
+
+    df_ventes = pd.read_sql_query('''
+    SELECT 
+        periode,
+        culture,
+        SUM(CASE WHEN indicateur = 'ventes_montant' THEN valeur ELSE 0 END) as recettes_ventes,
+        SUM(CASE WHEN indicateur = 'ventes_quantite' THEN valeur ELSE 0 END) as quantite_vendue
+    FROM agregats_mensuels
+    WHERE indicateur IN ('ventes_montant', 'ventes_quantite')
+    GROUP BY periode, culture
+    ''', conn)
+
+    # Métriques de résumé dérivées des mêmes agrégats (pas de nouveau parcours des tables)
+    total_livraisons = int(df_production['nb_livraisons'].sum())
+    production_totale = float(df_production['quantite_totale'].fillna(0).sum())
+    recettes_transactions = float(df_transactions['recettes_transactions'].fillna(0).sum())
+    total_depenses = float(df_transactions['depenses'].fillna(0).sum())
+    total_recettes = recettes_transactions + float(df_ventes['recettes_ventes'].fillna(0).sum())
+    metrics = {
+        'total_livraisons': total_livraisons,
+        'production_totale': production_totale,
+        'production_moyenne': production_totale / total_livraisons if total_livraisons else 0.0,
+        'nb_cultures': int(df_production['culture'].nunique()),
+        'total_recettes': total_recettes,
+        'total_depenses': total_depenses,
+        'benefice_net': total_recettes - total_depenses,
+        'quantite_vendue': float(df_ventes['quantite_vendue'].fillna(0).sum())
+    }
+
+    # Fusionner les données de recettes
+    df_recettes = pd.merge(df_transactions, df_ventes, on=['periode', 'culture'], how='outer')
+    df_recettes = df_recettes.fillna(0)
+    df_recettes['recettes_totales'] = df_recettes['recettes_transactions'] + df_recettes['recettes_ventes']
+    df_recettes['benefice_net'] = df_recettes['recettes_totales'] - df_recettes['depenses']
+
+    # Les lignes sans date (période vide) comptent dans les totaux mais pas dans les graphiques
+    return {
+        'production': df_production[df_production['periode'] != ''].reset_index(drop=True),
+        'recettes': df_recettes[df_recettes['periode'] != ''].reset_index(drop=True),
+        'metrics': metrics
+    }
+
+def get_dashboard_data():
+    """
+    Retourne les agrégats du tableau de bord de la coopérative courante,
+    mis en cache par base et par version des données.
+    """
+    vide = {'production': pd.DataFrame(), 'recettes': pd.DataFrame(), 'metrics': {}}
+    db_path = st.session_state.get("db_path")
+    if not db_path:
+        return vide
+    try:
+        return _calculer_donnees_dashboard(db_path, db_pool.version_donnees(db_path))
+    except Exception:
+        return vide
+
 def get_production_evolution_data():
     """Récupère les données d'évolution de la production"""
-    conn = get_connection()
-    if not conn:
-        return pd.DataFrame()
-    
-    try:
-        # Récupérer les données de production par mois et par culture
-        query = '''
-        SELECT 
-            strftime('%Y-%m', date_livraison) as periode,
-            COALESCE(culture_nom, 'Hévéa') as culture,
-            SUM(quantite) as quantite_totale,
-            COUNT(*) as nb_livraisons,
-            AVG(quantite) as quantite_moyenne
-        FROM productions 
-        WHERE statut != 'erreur'
-        GROUP BY strftime('%Y-%m', date_livraison), culture_nom
-        ORDER BY periode
-        '''
-        df = pd.read_sql_query(query, conn)
-        conn.close()
-        return df
-    except Exception as e:
-        conn.close()
-        return pd.DataFrame()
+    return get_dashboard_data()['production']
 
 def get_revenue_evolution_data():
     """Récupère les données d'évolution des recettes"""
-    conn = get_connection()
-    if not conn:
-        return pd.DataFrame()
-    
-    try:
-        # Récupérer les recettes par mois (transactions + ventes)
-        query_transactions = '''
-        SELECT 
-            strftime('%Y-%m', date_transaction) as periode,
-            COALESCE(culture_nom, 'Général') as culture,
-            SUM(CASE WHEN type_transaction = 'Recette' THEN montant ELSE 0 END) as recettes_transactions,
-            SUM(CASE WHEN type_transaction = 'Dépense' THEN montant ELSE 0 END) as depenses
-        FROM transactions
-        GROUP BY strftime('%Y-%m', date_transaction), culture_nom
-        '''
-        
-        query_ventes = '''
-        SELECT 
-            strftime('%Y-%m', date_vente) as periode,
-            COALESCE(culture_nom, 'Hévéa') as culture,
-            SUM(prix_total) as recettes_ventes,
-            SUM(quantite) as quantite_vendue
-        FROM ventes
-        GROUP BY strftime('%Y-%m', date_vente), culture_nom
-        '''
-        
-        df_transactions = pd.read_sql_query(query_transactions, conn)
-        df_ventes = pd.read_sql_query(query_ventes, conn)
-        
-        # Fusionner les données
-        df = pd.merge(df_transactions, df_ventes, on=['periode', 'culture'], how='outer')
-        df = df.fillna(0)
-        df['recettes_totales'] = df['recettes_transactions'] + df['recettes_ventes']
-        df['benefice_net'] = df['recettes_totales'] - df['depenses']
-        
-        conn.close()
-        return df
-    except Exception as e:
-        conn.close()
-        return pd.DataFrame()
+    return get_dashboard_data()['recettes']
 
-def create_production_charts():
+def create_production_charts(df=None):
     """Crée les graphiques d'évolution de la production"""
     if not PLOTLY_AVAILABLE:
-        return create_simple_production_charts()
+        return create_simple_production_charts(df)
     
-    df = get_production_evolution_data()
+    if df is None:
+        df = get_production_evolution_data()
     
     if df.empty:
         st.info("📊 Aucune donnée de production disponible pour générer les graphiques.")
@@ -149,9 +180,10 @@ def create_production_charts():
     
     return fig1, fig2, fig3
 
-def create_simple_production_charts():
+def create_simple_production_charts(df=None):
     """Version simplifiée des graphiques de production utilisant les graphiques Streamlit natifs"""
-    df = get_production_evolution_data()
+    if df is None:
+        df = get_production_evolution_data()
     
     if df.empty:
         st.info("📊 Aucune donnée de production disponible pour générer les graphiques.")
@@ -177,12 +209,13 @@ def create_simple_production_charts():
     
     return None
 
-def create_revenue_charts():
+def create_revenue_charts(df=None):
     """Crée les graphiques d'évolution des recettes"""
     if not PLOTLY_AVAILABLE:
-        return create_simple_revenue_charts()
+        return create_simple_revenue_charts(df)
     
-    df = get_revenue_evolution_data()
+    if df is None:
+        df = get_revenue_evolution_data()
     
     if df.empty:
         st.info("💰 Aucune donnée de recettes disponible pour générer les graphiques.")
@@ -248,9 +281,10 @@ def create_revenue_charts():
     
     return fig1, fig2, fig3
 
-def create_simple_revenue_charts():
+def create_simple_revenue_charts(df=None):
     """Version simplifiée des graphiques de recettes utilisant les graphiques Streamlit natifs"""
-    df = get_revenue_evolution_data()
+    if df is None:
+        df = get_revenue_evolution_data()
     
     if df.empty:
         st.info("💰 Aucune donnée de recettes disponible pour générer les graphiques.")
@@ -284,62 +318,7 @@ def create_simple_revenue_charts():
 
 def get_summary_metrics():
     """Calcule les métriques de résumé pour le tableau de bord"""
-    conn = get_connection()
-    if not conn:
-        return {}
-    
-    try:
-        # Métriques de production
-        production_query = '''
-        SELECT 
-            COUNT(*) as total_livraisons,
-            SUM(quantite) as production_totale,
-            AVG(quantite) as production_moyenne,
-            COUNT(DISTINCT culture_nom) as nb_cultures
-        FROM productions 
-        WHERE statut != 'erreur'
-        '''
-        
-        # Métriques financières
-        finance_query = '''
-        SELECT 
-            SUM(CASE WHEN type_transaction = 'Recette' THEN montant ELSE 0 END) as recettes_transactions,
-            SUM(CASE WHEN type_transaction = 'Dépense' THEN montant ELSE 0 END) as depenses_transactions
-        FROM transactions
-        '''
-        
-        ventes_query = '''
-        SELECT 
-            SUM(prix_total) as recettes_ventes,
-            SUM(quantite) as quantite_vendue
-        FROM ventes
-        '''
-        
-        production_metrics = pd.read_sql_query(production_query, conn).iloc[0]
-        finance_metrics = pd.read_sql_query(finance_query, conn).iloc[0]
-        ventes_metrics = pd.read_sql_query(ventes_query, conn).iloc[0]
-        
-        # Calculer les totaux
-        total_recettes = (finance_metrics['recettes_transactions'] or 0) + (ventes_metrics['recettes_ventes'] or 0)
-        total_depenses = finance_metrics['depenses_transactions'] or 0
-        benefice_net = total_recettes - total_depenses
-        
-        metrics = {
-            'total_livraisons': int(production_metrics['total_livraisons'] or 0),
-            'production_totale': float(production_metrics['production_totale'] or 0),
-            'production_moyenne': float(production_metrics['production_moyenne'] or 0),
-            'nb_cultures': int(production_metrics['nb_cultures'] or 0),
-            'total_recettes': float(total_recettes),
-            'total_depenses': float(total_depenses),
-            'benefice_net': float(benefice_net),
-            'quantite_vendue': float(ventes_metrics['quantite_vendue'] or 0)
-        }
-        
-        conn.close()
-        return metrics
-    except Exception as e:
-        conn.close()
-        return {}
+    return get_dashboard_data()['metrics']
 
 def display_dashboard_accueil():
     """Affiche le tableau de bord dans l'accueil"""
@@ -388,8 +367,13 @@ def display_dashboard_accueil():
     st.markdown('<div class="dashboard-container">', unsafe_allow_html=True)
     st.markdown('<h2 class="dashboard-title">📊 Tableau de Bord - Vue d\'Ensemble</h2>', unsafe_allow_html=True)
     
+    # Tous les agrégats sont calculés une seule fois pour ce rendu
+    donnees = get_dashboard_data()
+    df_prod = donnees['production']
+    df_rev = donnees['recettes']
+
     # Métriques de résumé
-    metrics = get_summary_metrics()
+    metrics = donnees['metrics']
     
     if metrics:
         # Affichage des métriques principales
@@ -465,7 +449,7 @@ def display_dashboard_accueil():
         st.subheader("📈 Analyse de la Production")
         
         # Créer les graphiques de production
-        production_charts = create_production_charts()
+        production_charts = create_production_charts(df_prod.copy())
         
         if PLOTLY_AVAILABLE and production_charts:
             fig1, fig2, fig3 = production_charts
@@ -481,7 +465,6 @@ def display_dashboard_accueil():
                 st.plotly_chart(fig2, use_container_width=True)
                 
                 # Ajouter un graphique en secteurs pour la répartition par culture
-                df_prod = get_production_evolution_data()
                 if not df_prod.empty:
                     production_par_culture = df_prod.groupby('culture')['quantite_totale'].sum().reset_index()
                     fig_pie = px.pie(production_par_culture, values='quantite_totale', names='culture',
@@ -496,7 +479,7 @@ def display_dashboard_accueil():
         st.subheader("💰 Analyse des Recettes")
         
         # Créer les graphiques de recettes
-        revenue_charts = create_revenue_charts()
+        revenue_charts = create_revenue_charts(df_rev.copy())
         
         if PLOTLY_AVAILABLE and revenue_charts:
             fig1, fig2, fig3 = revenue_charts
@@ -512,7 +495,6 @@ def display_dashboard_accueil():
                 st.plotly_chart(fig2, use_container_width=True)
                 
                 # Ajouter un graphique en secteurs pour la répartition des recettes
-                df_rev = get_revenue_evolution_data()
                 if not df_rev.empty:
                     recettes_par_culture = df_rev.groupby('culture')['recettes_totales'].sum().reset_index()
                     recettes_par_culture = recettes_par_culture[recettes_par_culture['recettes_totales'] > 0]
@@ -530,9 +512,6 @@ def display_dashboard_accueil():
     st.subheader("🔍 Analyse Comparative")
     
     # Graphique combiné production vs recettes
-    df_prod = get_production_evolution_data()
-    df_rev = get_revenue_evolution_data()
-    
     if not df_prod.empty and not df_rev.empty:
         # Fusionner les données par période et culture
         df_combined = pd.merge(
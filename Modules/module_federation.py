@@ -0,0 +1,139 @@
+# Modules/module_federation.py
+
+import time
+
+import pandas as pd
+import streamlit as st
+
+from Modules import db_federation, db_pool, registre_coops, session
+
+# Tableau de bord de la fédération : totaux de toutes les coopératives
+# hébergées, calculés en parallèle (Modules/db_federation.py) à partir des
+# agrégats de chaque base. Accès réservé aux comptes désignés par le serveur
+# (voir session.acces_federation), pas aux administrateurs des coopératives.
+
+
+@st.cache_resource(show_spinner=False)
+def _executeur():
+    return db_federation.creer_executeur()
+
+
+# Chaque écriture dans une base change la clé du cache : seuls les derniers
+# résultats sont conservés, la mémoire ne croît pas avec l'activité des coopératives.
+@st.cache_data(show_spinner=False, max_entries=4)
+def _consolidation(cooperatives):
+    """
+    Résultat fusionné pour un ensemble de bases ; cooperatives : tuple de
+    (chemin, nom, signature du fichier). La signature fait partie de la clé du
+    cache : toute modification d'une base entraîne un nouveau calcul.
+    """
+    debut = time.perf_counter()
+    resultats = db_federation.consolider([c[0] for c in cooperatives], _executeur())
+    fusion = db_federation.fusionner(resultats, {c[0]: c[1] for c in cooperatives})
+    fusion["duree"] = time.perf_counter() - debut
+    fusion["schema_ancien"] = [r["chemin"] for r in resultats if r["erreur"] == db_federation.ERREUR_SCHEMA]
+    return fusion
+
+
+def tableau_federation():
+    st.header("🌐 Fédération des coopératives")
+    utilisateur = session.session_courante()
+    if not utilisateur or not session.acces_federation(utilisateur.get("gmail")):
+        st.error("⛔ Accès réservé aux comptes de la fédération désignés par l'exploitant du serveur.")
+        return
+    st.caption("Totaux consolidés de toutes les coopératives hébergées (production, ventes, trésorerie, stocks).")
+
+    if st.button("🔄 Actualiser la liste des coopératives"):
+        ajoutees, retirees = registre_coops.synchroniser_registre()
+        st.success(f"Registre actualisé : {ajoutees} ajoutée(s), {retirees} retirée(s).")
+
+    cooperatives = tuple(
+        (coop["chemin"], coop["nom"], db_federation.signature(coop["chemin"]))
+        for coop in registre_coops.lister_cooperatives()
+    )
+    if not cooperatives:
+        st.info("Aucune coopérative enregistrée.")
+        return
+
+    with st.spinner(f"Consolidation de {len(cooperatives)} coopérative(s)..."):
+        fusion = _consolidation(cooperatives)
+
+    if fusion["schema_ancien"]:
+        st.warning(f"⚠️ {len(fusion['schema_ancien'])} base(s) jamais ouverte(s) depuis l'ajout des agrégats : "
+                   "elles ne sont pas comptées.")
+        if st.button("🛠️ Mettre à jour ces bases"):
+            for chemin in fusion["schema_ancien"]:
+                # L'ouverture par le pool applique les migrations en attente
+                db_pool.get_pool(chemin).connexion()
+            st.rerun()
+
+    df_coops = pd.DataFrame(fusion["cooperatives"])
+    df_mensuel = pd.DataFrame(fusion["mensuel"])
+    df_stocks = pd.DataFrame(fusion["stocks"])
+
+    annees = sorted({p[:4] for p in df_mensuel["periode"] if p}, reverse=True) if not df_mensuel.empty else []
+    annee = st.selectbox("📅 Période", ["Toutes les années"] + annees, key="annee_federation")
+    if annee != "Toutes les années" and not df_mensuel.empty:
+        df_mensuel = df_mensuel[df_mensuel["periode"].str.startswith(annee)]
+
+    col1, col2, col3, col4, col5 = st.columns(5)
+    with col1:
+        st.metric("🏢 Coopératives", len(df_coops))
+    with col2:
+        st.metric("👥 Membres", int(df_coops["membres"].sum()))
+    with col3:
+        st.metric("🌾 Production", f"{df_mensuel['production'].sum() if not df_mensuel.empty else 0:,.0f} kg")
+    with col4:
+        st.metric("🛒 Ventes", f"{df_mensuel['ventes_montant'].sum() if not df_mensuel.empty else 0:,.0f} FCFA")
+    with col5:
+        st.metric("💰 Trésorerie totale", f"{df_coops['tresorerie'].sum():,.0f} FCFA")
+    st.caption(f"{len(cooperatives)} base(s) consolidée(s) en {fusion['duree']:.2f} s.")
+
+    onglets = st.tabs(["🏢 Par coopérative", "🌾 Production", "🛒 Ventes", "💰 Trésorerie", "📦 Stocks"])
+
+    with onglets[0]:
+        st.dataframe(df_coops.rename(columns={
+            "cooperative": "Coopérative", "membres": "Membres", "production": "Production (kg)",
+            "ventes_montant": "Ventes (FCFA)", "cotisations": "Cotisations (FCFA)", "recettes": "Recettes (FCFA)",
+            "depenses": "Dépenses (FCFA)", "tresorerie": "Trésorerie (FCFA)", "stock": "Stock (kg)",
+            "erreur": "Erreur",
+        }), use_container_width=True)
+
+    if df_mensuel.empty:
+        for onglet in onglets[1:4]:
+            with onglet:
+                st.info("ℹ️ Aucune donnée pour la période sélectionnée.")
+    else:
+        # Les lignes sans date (période vide) comptent dans les totaux mais pas dans les graphiques
+        df_dates = df_mensuel[df_mensuel["periode"] != ""]
+        with onglets[1]:
+            production = df_dates.pivot_table(index="periode", columns="culture", values="production",
+                                              aggfunc="sum", fill_value=0)
+            st.line_chart(production)
+            st.dataframe(df_mensuel.groupby("culture")[["production", "nb_livraisons"]].sum()
+                         .rename(columns={"production": "Production (kg)", "nb_livraisons": "Livraisons"}),
+                         use_container_width=True)
+        with onglets[2]:
+            ventes = df_dates.pivot_table(index="periode", columns="culture", values="ventes_montant",
+                                          aggfunc="sum", fill_value=0)
+            st.bar_chart(ventes)
+            st.dataframe(df_mensuel.groupby("culture")[["ventes_quantite", "ventes_montant"]].sum()
+                         .rename(columns={"ventes_quantite": "Quantité (kg)", "ventes_montant": "Montant (FCFA)"}),
+                         use_container_width=True)
+        with onglets[3]:
+            tresorerie = df_dates.groupby("periode")[["recettes", "ventes_montant", "depenses"]].sum()
+            tresorerie["solde"] = tresorerie["recettes"] + tresorerie["ventes_montant"] - tresorerie["depenses"]
+            tresorerie["solde_cumule"] = tresorerie["solde"].cumsum()
+            st.line_chart(tresorerie[["solde", "solde_cumule"]])
+            st.dataframe(tresorerie.rename(columns={
+                "recettes": "Recettes (FCFA)", "ventes_montant": "Ventes (FCFA)", "depenses": "Dépenses (FCFA)",
+                "solde": "Solde (FCFA)", "solde_cumule": "Solde cumulé (FCFA)",
+            }), use_container_width=True)
+
+    with onglets[4]:
+        if df_stocks.empty:
+            st.info("ℹ️ Aucun stock enregistré.")
+        else:
+            st.bar_chart(df_stocks.set_index("culture")["quantite"])
+            st.dataframe(df_stocks.rename(columns={"culture": "Culture", "quantite": "Stock (kg)"}),
+                         use_container_width=True)
@@ -0,0 +1,389 @@
+# Modules/module_import.py
+
+import codecs
+import csv
+import io
+import itertools
+import unicodedata
+from datetime import date, datetime
+
+import streamlit as st
+
+from Modules import db_pool
+
+# Lecture des classeurs Excel ligne par ligne (mode read_only)
+try:
+    import openpyxl
+    OPENPYXL_DISPONIBLE = True
+except ImportError:
+    OPENPYXL_DISPONIBLE = False
+
+# Import en masse de membres, livraisons et cotisations depuis un fichier CSV
+# ou XLSX (pesées des points de collecte en début de campagne). Le fichier est
+# lu en flux, par lots : chaque ligne est validée contre les membres et les
+# cultures chargés une seule fois en mémoire, les lignes valides sont insérées
+# par executemany dans une transaction par lot, et les lignes rejetées sont
+# listées avec leur numéro et le motif du rejet.
+
+TAILLE_LOT = 5000            # lignes insérées par transaction
+MAX_ERREURS_AFFICHEES = 1000 # erreurs conservées pour le rapport (toutes sont comptées)
+FORMATS_DATE = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d", "%d/%m/%y")
+# Encodage des CSV qui ne sont pas en UTF-8 (fichiers enregistrés par Excel sous Windows)
+ENCODAGE_REPLI = "cp1252"
+TAILLE_BLOC_ENCODAGE = 1 << 20
+
+
+# Connexion dynamique à la base de données sélectionnée
+def get_connection():
+    return db_pool.get_connection(st.session_state["db_path"])
+
+
+def _cle(texte):
+    """Clé de rapprochement d'un nom : minuscules, sans accents ni espaces superflus."""
+    texte = unicodedata.normalize("NFKD", str(texte or ""))
+    texte = "".join(c for c in texte if not unicodedata.combining(c))
+    return " ".join(texte.lower().split())
+
+
+def _texte(valeur):
+    if valeur is None:
+        return ""
+    if isinstance(valeur, float) and valeur.is_integer():
+        # Numéros lus comme nombres dans Excel (ex. 1042.0)
+        valeur = int(valeur)
+    return str(valeur).strip()
+
+
+def _nombre(valeur):
+    """Nombre (float) ; accepte la virgule décimale et les espaces de milliers."""
+    if isinstance(valeur, (int, float)):
+        return float(valeur)
+    texte = _texte(valeur).replace(" ", "").replace("\u00a0", "").replace(",", ".")
+    try:
+        return float(texte)
+    except ValueError:
+        raise ValueError(f"nombre invalide « {_texte(valeur)} »") from None
+
+
+def _date(valeur):
+    """Date au format ISO (AAAA-MM-JJ)."""
+    if isinstance(valeur, datetime):
+        return valeur.date().isoformat()
+    if isinstance(valeur, date):
+        return valeur.isoformat()
+    texte = _texte(valeur)
+    for format_date in FORMATS_DATE:
+        try:
+            return datetime.strptime(texte[:10] if format_date == "%Y-%m-%d" else texte, format_date).date().isoformat()
+        except ValueError:
+            continue
+    raise ValueError(f"date invalide « {texte} »")
+
+
+# --- Lecture en flux ---
+
+def _encodage(fichier):
+    """
+    Encodage d'un CSV : UTF-8 (avec ou sans BOM) si tout le fichier se décode,
+    sinon ENCODAGE_REPLI. Le fichier est parcouru par blocs puis rembobiné :
+    l'encodage est connu avant la première ligne importée.
+    """
+    decodeur = codecs.getincrementaldecoder("utf-8-sig")()
+    try:
+        while True:
+            bloc = fichier.read(TAILLE_BLOC_ENCODAGE)
+            decodeur.decode(bloc, final=not bloc)
+            if not bloc:
+                return "utf-8-sig"
+    except UnicodeDecodeError:
+        return ENCODAGE_REPLI
+    finally:
+        fichier.seek(0)
+
+
+def lire_csv(fichier):
+    """
+    Générateur de (numéro de ligne, {colonne: valeur}) depuis un CSV (UTF-8,
+    avec ou sans BOM, ou Windows-1252 ; séparateur ';' ou ',' détecté sur
+    l'en-tête). Le numéro est celui de la première ligne physique de
+    l'enregistrement dans le fichier (l'en-tête est la ligne 1).
+    """
+    texte = io.TextIOWrapper(fichier, encoding=_encodage(fichier), newline="")
+    entete = texte.readline()
+    separateur = ";" if entete.count(";") > entete.count(",") else ","
+    colonnes = [_cle(c).replace(" ", "_") for c in next(csv.reader([entete], delimiter=separateur))]
+    lecteur = csv.reader(texte, delimiter=separateur)
+    while True:
+        # line_num compte les lignes lues après l'en-tête (un champ entre guillemets peut en couvrir plusieurs)
+        numero = lecteur.line_num + 2
+        valeurs = next(lecteur, None)
+        if valeurs is None:
+            break
+        if any(v.strip() for v in valeurs):
+            yield numero, dict(zip(colonnes, valeurs))
+    texte.detach()
+
+
+def lire_xlsx(fichier):
+    """Générateur de (numéro de ligne, dictionnaire) depuis la première feuille d'un classeur XLSX (lecture seule)."""
+    classeur = openpyxl.load_workbook(fichier, read_only=True, data_only=True)
+    try:
+        lignes = classeur.worksheets[0].iter_rows(values_only=True)
+        entete = next(lignes, None)
+        if entete is None:
+            return
+        colonnes = [_cle(c).replace(" ", "_") for c in entete]
+        for numero, valeurs in enumerate(lignes, start=2):
+            if any(v not in (None, "") for v in valeurs):
+                yield numero, dict(zip(colonnes, valeurs))
+    finally:
+        classeur.close()
+
+
+def lire_fichier(fichier, nom_fichier):
+    """Lecteur adapté à l'extension du fichier."""
+    if nom_fichier.lower().endswith(".xlsx"):
+        if not OPENPYXL_DISPONIBLE:
+            raise ValueError("La lecture des fichiers Excel nécessite openpyxl (pip install openpyxl).")
+        return lire_xlsx(fichier)
+    return lire_csv(fichier)
+
+
+# --- Référentiels chargés une fois par import ---
+
+class _Referentiel:
+    """Membres et cultures de la base, indexés pour la validation des lignes."""
+
+    def __init__(self, conn):
+        self.membres_par_id = set()
+        self.membres_par_numero = {}
+        self.membres_par_nom = {}
+        noms_en_double = set()
+        for id_membre, numero, nom in conn.execute("SELECT id, numero_membre, nom FROM membres"):
+            self.membres_par_id.add(id_membre)
+            if numero:
+                self.membres_par_numero[_texte(numero)] = id_membre
+            cle = _cle(nom)
+            if cle in self.membres_par_nom:
+                noms_en_double.add(cle)
+            self.membres_par_nom[cle] = id_membre
+        # Un nom porté par plusieurs membres ne permet pas d'identifier le producteur
+        for cle in noms_en_double:
+            self.membres_par_nom.pop(cle)
+        self.noms_en_double = noms_en_double
+
+        self.cultures = {
+            _cle(nom): (id_culture, nom)
+            for id_culture, nom in conn.execute("SELECT id, nom_culture FROM cultures")
+        }
+
+    def membre(self, ligne):
+        """id du membre désigné par id_membre, numero_membre ou nom ; ValueError sinon."""
+        id_membre = _texte(ligne.get("id_membre"))
+        if id_membre:
+            try:
+                if int(float(id_membre)) in self.membres_par_id:
+                    return int(float(id_membre))
+            except ValueError:
+                pass
+            raise ValueError(f"membre introuvable (id {id_membre})")
+        numero = _texte(ligne.get("numero_membre"))
+        if numero:
+            if numero in self.membres_par_numero:
+                return self.membres_par_numero[numero]
+            raise ValueError(f"membre introuvable (numéro {numero})")
+        nom = _cle(ligne.get("nom") or ligne.get("membre"))
+        if nom in self.membres_par_nom:
+            return self.membres_par_nom[nom]
+        if nom in self.noms_en_double:
+            raise ValueError(f"plusieurs membres portent le nom « {_texte(ligne.get('nom') or ligne.get('membre'))} » : "
+                             "indiquez le numéro de membre")
+        raise ValueError("membre introuvable (renseignez id_membre, numero_membre ou nom)")
+
+    def culture(self, ligne):
+        """(id, nom) de la culture ; ValueError si elle n'est pas configurée."""
+        saisie = _texte(ligne.get("culture") or ligne.get("culture_nom"))
+        if not saisie:
+            raise ValueError("culture manquante")
+        if _cle(saisie) not in self.cultures:
+            raise ValueError(f"culture « {saisie} » non configurée")
+        return self.cultures[_cle(saisie)]
+
+
+# --- Conversion d'une ligne en valeurs à insérer ---
+
+def _ligne_production(ligne, referentiel):
+    id_membre = referentiel.membre(ligne)
+    id_culture, nom_culture = referentiel.culture(ligne)
+    quantite = _nombre(ligne.get("quantite"))
+    if quantite <= 0:
+        raise ValueError("quantité nulle ou négative")
+    return (id_membre, _date(ligne.get("date_livraison") or ligne.get("date")), quantite,
+            _texte(ligne.get("qualite")) or "Standard", _texte(ligne.get("zone")),
+            "valide", id_culture, nom_culture)
+
+
+def _ligne_cotisation(ligne, referentiel):
+    id_membre = referentiel.membre(ligne)
+    montant = _nombre(ligne.get("montant"))
+    if montant <= 0:
+        raise ValueError("montant nul ou négatif")
+    return (id_membre, montant, _date(ligne.get("date_paiement") or ligne.get("date")),
+            _texte(ligne.get("mode_paiement")) or "Espèces", _texte(ligne.get("motif")), "valide")
+
+
+def _ligne_membre(ligne, referentiel):
+    nom = _texte(ligne.get("nom"))
+    if not nom:
+        raise ValueError("nom manquant")
+    numero = _texte(ligne.get("numero_membre")) or None
+    if numero is not None:
+        if numero in referentiel.membres_par_numero:
+            raise ValueError(f"numéro de membre {numero} déjà utilisé")
+        # Réservé pour détecter les doublons à l'intérieur du fichier
+        referentiel.membres_par_numero[numero] = None
+    date_adhesion = ligne.get("date_adhesion")
+    plantation_ha = ligne.get("plantation_ha")
+    nb_arbres = ligne.get("nb_arbres")
+    return (nom, numero, _texte(ligne.get("telephone")), _texte(ligne.get("adresse")),
+            _date(date_adhesion) if _texte(date_adhesion) else date.today().isoformat(),
+            _texte(ligne.get("statut")) or "Membre",
+            _nombre(plantation_ha) if _texte(plantation_ha) else 0.0,
+            int(_nombre(nb_arbres)) if _texte(nb_arbres) else 0)
+
+
+# Types d'import : colonnes attendues, conversion et requête d'insertion
+TYPES_IMPORT = {
+    "productions": {
+        "libelle": "🌾 Livraisons",
+        "colonnes": "numero_membre (ou id_membre / nom), culture, date_livraison, quantite, qualite, zone",
+        "convertir": _ligne_production,
+        "requete": """INSERT INTO productions (id_membre, date_livraison, quantite, qualite, zone, statut, culture_id, culture_nom)
+                      VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+    },
+    "cotisations": {
+        "libelle": "💳 Cotisations",
+        "colonnes": "numero_membre (ou id_membre / nom), montant, date_paiement, mode_paiement, motif",
+        "convertir": _ligne_cotisation,
+        "requete": """INSERT INTO cotisations (id_membre, montant, date_paiement, mode_paiement, motif, statut)
+                      VALUES (?, ?, ?, ?, ?, ?)""",
+    },
+    "membres": {
+        "libelle": "👥 Membres",
+        "colonnes": "nom, numero_membre, telephone, adresse, date_adhesion, statut, plantation_ha, nb_arbres",
+        "convertir": _ligne_membre,
+        "requete": """INSERT INTO membres (nom, numero_membre, telephone, adresse, date_adhesion, statut, plantation_ha, nb_arbres)
+                      VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+    },
+}
+
+
+def importer(conn, type_import, lignes, taille_lot=TAILLE_LOT, simulation=False, progression=None):
+    """
+    Valide et insère les lignes (itérable de (numéro de ligne, dictionnaire),
+    voir lire_fichier) par lots de taille_lot, chaque lot dans sa propre
+    transaction (db_pool.executer_ecriture). En simulation, rien n'est écrit.
+    progression(nb_lues) est appelée après chaque lot.
+    Retourne {'lues', 'inserees', 'nb_erreurs', 'erreurs': [(ligne, motif), ...], 'interruption'}.
+    Si la lecture ou un lot échoue, l'import s'arrête et le rapport partiel est
+    retourné : 'interruption' contient alors le motif, et 'inserees' les lignes
+    des lots déjà validés (restées en base).
+    """
+    definition = TYPES_IMPORT[type_import]
+    convertir, requete = definition["convertir"], definition["requete"]
+    referentiel = _Referentiel(conn)
+    rapport = {"lues": 0, "inserees": 0, "nb_erreurs": 0, "erreurs": [], "interruption": None}
+
+    lignes = iter(lignes)
+    try:
+        while True:
+            lot = list(itertools.islice(lignes, taille_lot))
+            if not lot:
+                break
+            valeurs = []
+            for numero_ligne, ligne in lot:
+                try:
+                    valeurs.append(convertir(ligne, referentiel))
+                except (ValueError, TypeError) as e:
+                    rapport["nb_erreurs"] += 1
+                    if len(rapport["erreurs"]) < MAX_ERREURS_AFFICHEES:
+                        rapport["erreurs"].append((numero_ligne, str(e) or "valeur invalide"))
+
+            if valeurs and not simulation:
+                # Un lot = une transaction, sur le thread d'écriture de la base
+                db_pool.executer_ecriture(lambda c: c.executemany(requete, valeurs), conn.pool.db_path)
+                rapport["inserees"] += len(valeurs)
+            rapport["lues"] += len(lot)
+            if progression:
+                progression(rapport["lues"])
+    except Exception as e:
+        rapport["interruption"] = str(e) or e.__class__.__name__
+    return rapport
+
+
+# --- Interface ---
+
+def _rapport_erreurs_csv(erreurs):
+    sortie = io.StringIO()
+    ecrivain = csv.writer(sortie, delimiter=";")
+    ecrivain.writerow(["ligne", "motif"])
+    ecrivain.writerows(erreurs)
+    return sortie.getvalue().encode("utf-8-sig")
+
+
+def import_en_masse():
+    st.header("📥 Import en masse")
+    st.caption("Chargez un fichier CSV ou Excel (.xlsx) : les lignes sont validées puis enregistrées par lots.")
+
+    type_import = st.selectbox("Données à importer", list(TYPES_IMPORT),
+                               format_func=lambda t: TYPES_IMPORT[t]["libelle"])
+    st.info(f"Colonnes attendues (première ligne du fichier) : {TYPES_IMPORT[type_import]['colonnes']}")
+    if not OPENPYXL_DISPONIBLE:
+        st.warning("⚠️ openpyxl n'est pas installé : seuls les fichiers CSV peuvent être importés.")
+
+    fichier = st.file_uploader("Fichier à importer", type=["csv", "xlsx"])
+    simulation = st.checkbox("Vérifier seulement (aucune écriture)", value=False)
+    if fichier is None or not st.button("📥 Lancer l'import", type="primary"):
+        return
+
+    conn = get_connection()
+    barre = st.progress(0.0, text="Lecture du fichier...")
+    taille = max(fichier.size, 1)
+
+    def progression(nb_lues):
+        # Position approximative dans le fichier (la lecture est en flux)
+        barre.progress(min(fichier.tell() / taille, 0.99), text=f"{nb_lues} lignes traitées...")
+
+    try:
+        rapport = importer(conn, type_import, lire_fichier(fichier, fichier.name),
+                           simulation=simulation, progression=progression)
+    except Exception as e:
+        barre.empty()
+        st.error(f"❌ Erreur lors de l'import : {e}")
+        return
+    barre.progress(1.0, text=f"{rapport['lues']} lignes traitées.")
+    if rapport["interruption"]:
+        st.error(f"❌ Import interrompu après {rapport['lues']} ligne(s) traitée(s) : {rapport['interruption']}")
+        if rapport["inserees"]:
+            st.warning(f"⚠️ {rapport['inserees']} ligne(s) des lots précédents ont déjà été importées : "
+                       "retirez-les du fichier avant de le recharger.")
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Lignes lues", rapport["lues"])
+    col2.metric("Lignes valides" if simulation else "Lignes importées",
+                rapport["lues"] - rapport["nb_erreurs"] if simulation else rapport["inserees"])
+    col3.metric("Lignes rejetées", rapport["nb_erreurs"])
+
+    if rapport["nb_erreurs"]:
+        st.warning(f"⚠️ {rapport['nb_erreurs']} ligne(s) rejetée(s).")
+        if rapport["nb_erreurs"] > len(rapport["erreurs"]):
+            st.caption(f"Seules les {len(rapport['erreurs'])} premières erreurs sont listées.")
+        st.dataframe([{"Ligne": n, "Motif": m} for n, m in rapport["erreurs"]], use_container_width=True)
+        st.download_button("📄 Télécharger le rapport d'erreurs", _rapport_erreurs_csv(rapport["erreurs"]),
+                           file_name=f"erreurs_import_{type_import}.csv", mime="text/csv")
+    elif rapport["interruption"]:
+        pass
+    elif simulation:
+        st.success("✅ Toutes les lignes sont valides.")
+    else:
+        st.success(f"✅ {rapport['inserees']} ligne(s) importée(s).")
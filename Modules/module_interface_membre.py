@@ -2,19 +2,73 @@
 
 import streamlit as st
 import pandas as pd
-import sqlite3
-import os
 from datetime import date
 import Modules.module_settings as module_settings
+from Modules import archives, db_pool, session
+from Modules.pagination import condition_annee, requete_paginee, valeurs_distinctes
 
 # Note: Session state initialization is handled by App_gestion.py
 # Removed global session state initialization to avoid conflicts
 
 def get_connection():
     if st.session_state.get("db_path"):
-        return sqlite3.connect(st.session_state["db_path"], check_same_thread=False)
+        return db_pool.get_connection(st.session_state["db_path"])
     return None
 
+# Historiques de l'espace membre : table -> colonne de date (index id_membre, date)
+HISTORIQUES_MEMBRE = {"productions": "date_livraison", "cotisations": "date_paiement"}
+# Années et mois proposés dans les filtres, et ordre de l'historique ({table}, {colonne_date})
+REQUETE_ANNEES_MEMBRE = ("SELECT DISTINCT CAST(substr({colonne_date}, 1, 4) AS INTEGER) FROM {table} "
+                         "WHERE id_membre = ? AND {colonne_date} IS NOT NULL ORDER BY 1")
+REQUETE_MOIS_MEMBRE = ("SELECT DISTINCT CAST(substr({colonne_date}, 6, 2) AS INTEGER) FROM {table} "
+                       "WHERE id_membre = ? AND {colonne_date} IS NOT NULL ORDER BY 1")
+ORDRE_HISTORIQUE_MEMBRE = "{colonne_date} DESC, id DESC"
+
+def historique_membre(conn, cle, table, colonne_date, id_membre, libelle):
+    """
+    Historique d'un membre filtré par année / mois côté SQL (index id_membre, date)
+    et paginé. Retourne False si le membre n'a aucune ligne dans la table.
+    """
+    annees = valeurs_distinctes(conn, REQUETE_ANNEES_MEMBRE.format(table=table, colonne_date=colonne_date), (id_membre,))
+    # Campagnes archivées : proposées si le résumé du membre montre un historique
+    if conn.execute("SELECT EXISTS(SELECT 1 FROM resume_membres WHERE id_membre = ?)", (id_membre,)).fetchone()[0]:
+        annees = sorted(set(annees) | set(archives.annees_archivees(conn)))
+    if not annees:
+        return False
+    mois_disponibles = valeurs_distinctes(conn, REQUETE_MOIS_MEMBRE.format(table=table, colonne_date=colonne_date), (id_membre,))
+
+    col1, col2 = st.columns(2)
+    with col1:
+        annee = st.selectbox(f"Filtrer par année ({libelle})", ['Sélectionner une année...'] + annees + ['Tous'], key=f"year_{cle}")
+    with col2:
+        mois = st.selectbox(f"Filtrer par mois ({libelle})", ['Sélectionner un mois...'] + mois_disponibles + ['Tous'], key=f"month_{cle}")
+
+    # Afficher les données seulement si un filtre est sélectionné
+    if annee == 'Sélectionner une année...' and mois == 'Sélectionner un mois...':
+        st.info(f"Veuillez sélectionner un filtre pour afficher les données ({libelle.lower()}).")
+        return True
+
+    annee = annee if isinstance(annee, int) else None
+    mois = mois if isinstance(mois, int) else None
+    conditions = [("id_membre = ?", id_membre)]
+    if annee and mois:
+        debut = date(annee, mois, 1)
+        fin = date(annee + 1, 1, 1) if mois == 12 else date(annee, mois + 1, 1)
+        conditions.append((f"{colonne_date} >= ? AND {colonne_date} < ?", (debut.isoformat(), fin.isoformat())))
+    elif annee:
+        conditions.append(condition_annee(colonne_date, annee))
+    elif mois:
+        conditions.append((f"substr({colonne_date}, 6, 2) = ?", f"{mois:02d}"))
+
+    source = archives.source_annee(conn, table, annee)
+    df, _, _ = requete_paginee(conn, f"membre_{cle}", ["*"], f"FROM {source}", conditions,
+                               ORDRE_HISTORIQUE_MEMBRE.format(colonne_date=colonne_date))
+    if df.empty:
+        st.info("Aucune donnée pour les filtres sélectionnés.")
+    else:
+        st.dataframe(df.drop(columns=['id_membre']).style.format(na_rep='N/A'))
+    return True
+
 def display_interface_membre():
     st.header("💳 Interface Membre")
 
@@ -24,7 +78,6 @@ def display_interface_membre():
         st.stop()
 
     user_role = st.session_state.get("user_role")
-    user_name = st.session_state.get("name")
     membre_selection = None
 
     # Admin can see all members and select one
@@ -45,12 +98,14 @@ def display_interface_membre():
         )
     # Other users can only see their own information
     else:
-        if not user_name:
+        # Membre lié résolu une fois à l'ouverture de la session (Modules/session.py)
+        session_utilisateur = session.session_courante()
+        if not session_utilisateur:
             st.warning("Impossible d'identifier l'utilisateur connecté.")
             st.stop()
         
-        query = "SELECT id, nom, numero_membre, date_adhesion, statut FROM membres WHERE nom = ?"
-        membre_df = pd.read_sql_query(query, conn, params=(user_name,))
+        query = "SELECT id, nom, numero_membre, date_adhesion, statut FROM membres WHERE id = ?"
+        membre_df = pd.read_sql_query(query, conn, params=(session_utilisateur["id_membre"],))
         
         if membre_df.empty:
             st.info("Aucune information de membre trouvée pour votre compte. Veuillez contacter l'administrateur.")
@@ -69,25 +124,21 @@ def display_interface_membre():
             logo_path_card = None
             
             try:
+                # Configuration et logo servis depuis le cache de module_settings
                 coop_info_card = module_settings.load_cooperative_info()
                 if coop_info_card:
-                    logo_path_card = coop_info_card.get('logo_path')  # Corrected key name
+                    logo_path_card = coop_info_card.get('logo_path')
                     
-                # If no logo in database, try to find one in the default logos directory
-                if not logo_path_card or not os.path.exists(logo_path_card):
-                    logos_dir = "data/assets/logos"
-                    if os.path.exists(logos_dir):
-                        # Look for any logo file in the logos directory
-                        for file in os.listdir(logos_dir):
-                            if file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                                logo_path_card = os.path.join(logos_dir, file)
-                                break
+                # If no logo in database, use the first one found in the default logos directory
+                if not module_settings.load_logo_bytes(logo_path_card):
+                    logo_path_card = module_settings.find_default_logo()
                     
             except Exception:
                 # Fallback to session state
                 if "config_df" in st.session_state and not st.session_state.config_df.empty:
-                    if "logo" in st.session_state.config_df.columns and pd.notna(st.session_state.config_df["logo"].iloc[0]):
-                        logo_path_card = st.session_state.config_df["logo"].iloc[0]
+                    if "logo_path" in st.session_state.config_df.columns and pd.notna(st.session_state.config_df["logo_path"].iloc[0]):
+                        logo_path_card = st.session_state.config_df["logo_path"].iloc[0]
+            logo_card = module_settings.load_logo_bytes(logo_path_card) if logo_path_card else None
             
             st.markdown("""
                 <style>
@@ -138,8 +189,8 @@ def display_interface_membre():
             
             col1, col2 = st.columns([1, 4])
             with col1:
-                if logo_path_card and os.path.exists(logo_path_card):
-                    st.image(logo_path_card, width=150)
+                if logo_card:
+                    st.image(logo_card, width=150)
             
             with col2:
                 st.markdown(f'<h3>{coop_name_card}</h3>', unsafe_allow_html=True)
@@ -174,64 +225,24 @@ def display_interface_membre():
             else:
                 st.info("Cochez la case ci-dessus pour afficher les informations personnelles.")
 
+            # Résumé précalculé (table resume_membres maintenue par triggers)
+            resume = conn.execute("""
+                SELECT total_livre, nb_livraisons, derniere_livraison, total_cotise, nb_cotisations
+                FROM resume_membres WHERE id_membre = ?
+            """, (membre_selection.id,)).fetchone() or (0, 0, None, 0, 0)
+            st.write("#### Résumé")
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Total livré", f"{resume[0]:,.0f} kg")
+            col2.metric("Livraisons", f"{resume[1]}")
+            col3.metric("Dernière livraison", resume[2][:10] if resume[2] else "N/A")
+            col4.metric("Total cotisé", f"{resume[3]:,.0f} FCFA")
+
             # Informations de production
             st.write("#### Production")
-            production_details_query = "SELECT * FROM productions WHERE id_membre = ?"
-            production_details = pd.read_sql_query(production_details_query, conn, params=(membre_selection.id,))
-
-            if not production_details.empty:
-                production_details['date_livraison'] = pd.to_datetime(production_details['date_livraison'])
-                
-                # Filtres pour la production
-                col1, col2 = st.columns(2)
-                with col1:
-                    years_prod = ['Sélectionner une année...'] + sorted(production_details['date_livraison'].dt.year.unique()) + ['Tous']
-                    year_filter_prod = st.selectbox("Filtrer par année (Production)", years_prod, key="year_prod")
-                with col2:
-                    months_prod = ['Sélectionner un mois...'] + sorted(production_details['date_livraison'].dt.month.unique()) + ['Tous']
-                    month_filter_prod = st.selectbox("Filtrer par mois (Production)", months_prod, key="month_prod")
-
-                # Afficher le dataframe seulement si un filtre est sélectionné
-                if year_filter_prod != 'Sélectionner une année...' or month_filter_prod != 'Sélectionner un mois...':
-                    filtered_prod = production_details.copy()
-                    if year_filter_prod != 'Tous' and year_filter_prod != 'Sélectionner une année...':
-                        filtered_prod = filtered_prod[filtered_prod['date_livraison'].dt.year == year_filter_prod]
-                    if month_filter_prod != 'Tous' and month_filter_prod != 'Sélectionner un mois...':
-                        filtered_prod = filtered_prod[filtered_prod['date_livraison'].dt.month == month_filter_prod]
-
-                    st.dataframe(filtered_prod.drop(columns=['id_membre']).style.format(na_rep='N/A'))
-                else:
-                    st.info("Veuillez sélectionner un filtre pour afficher les données de production.")
-            else:
+            if not historique_membre(conn, "prod", "productions", HISTORIQUES_MEMBRE["productions"], membre_selection.id, "Production"):
                 st.info("Aucune donnée de production pour ce membre.")
 
             # Informations sur les cotisations
             st.write("#### Cotisations")
-            cotisations_details_query = "SELECT * FROM cotisations WHERE id_membre = ?"
-            cotisations_details = pd.read_sql_query(cotisations_details_query, conn, params=(membre_selection.id,))
-
-            if not cotisations_details.empty:
-                cotisations_details['date_paiement'] = pd.to_datetime(cotisations_details['date_paiement'])
-
-                # Filtres pour les cotisations
-                col3, col4 = st.columns(2)
-                with col3:
-                    years_cotis = ['Sélectionner une année...'] + sorted(cotisations_details['date_paiement'].dt.year.unique()) + ['Tous']
-                    year_filter_cotis = st.selectbox("Filtrer par année (Cotisations)", years_cotis, key="year_cotis")
-                with col4:
-                    months_cotis = ['Sélectionner un mois...'] + sorted(cotisations_details['date_paiement'].dt.month.unique()) + ['Tous']
-                    month_filter_cotis = st.selectbox("Filtrer par mois (Cotisations)", months_cotis, key="month_cotis")
-
-                # Afficher le dataframe seulement si un filtre est sélectionné
-                if year_filter_cotis != 'Sélectionner une année...' or month_filter_cotis != 'Sélectionner un mois...':
-                    filtered_cotis = cotisations_details.copy()
-                    if year_filter_cotis != 'Tous' and year_filter_cotis != 'Sélectionner une année...':
-                        filtered_cotis = filtered_cotis[filtered_cotis['date_paiement'].dt.year == year_filter_cotis]
-                    if month_filter_cotis != 'Tous' and month_filter_cotis != 'Sélectionner un mois...':
-                        filtered_cotis = filtered_cotis[filtered_cotis['date_paiement'].dt.month == month_filter_cotis]
-                    
-                    st.dataframe(filtered_cotis.drop(columns=['id_membre']).style.format(na_rep='N/A'))
-                else:
-                    st.info("Veuillez sélectionner un filtre pour afficher les données de cotisations.")
-            else:
-                st.info("Aucune donnée de cotisation pour ce membre.")
\ No newline at end of file
+            if not historique_membre(conn, "cotis", "cotisations", HISTORIQUES_MEMBRE["cotisations"], membre_selection.id, "Cotisations"):
+                st.info("Aucune donnée de cotisation pour ce membre.")
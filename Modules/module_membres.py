@@ -2,98 +2,31 @@ import streamlit as st
 import sqlite3
 import os # Added for os.path.exists
 import Modules.module_settings as module_settings # Added for cooperative info
+from Modules import db_pool
 from Modules.download_button_styles import apply_download_button_styles
+from Modules.exports import bouton_export_excel, bouton_export_pdf
 
 import pandas as pd
 from datetime import date
-from io import BytesIO
 
-# ReportLab imports
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
-from reportlab.lib.units import inch
+# Export PDF
+from Modules.rapport_pdf import generer_pdf
 
 # Note: Session state initialization is handled by App_gestion.py
 # Removed global session state initialization to avoid conflicts
 
 # Connexion dynamique à la base de données sélectionnée
 def get_connection():
-    return sqlite3.connect(st.session_state["db_path"], check_same_thread=False)
+    return db_pool.get_connection(st.session_state["db_path"])
 
-# Function to export DataFrame to PDF bytes using ReportLab
-def export_df_to_pdf_bytes(df):
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=0.5*inch, leftMargin=0.5*inch, topMargin=0.5*inch, bottomMargin=0.5*inch)
-    story = []
-
-    headers = df.columns.tolist()
-    data_list = df.values.tolist()
-    
-    data_for_table = [headers] + [[str(cell) if cell is not None else '' for cell in row] for row in data_list]
-
-    page_width, _ = letter
-    available_width = page_width - 1*inch
-    num_cols = len(headers)
-    
-    # Adjusted col_widths_map for membres module
-    col_widths_map = {
-        'id': 0.4*inch,
-        'nom': 1.5*inch,
-        'numero_membre': 1.0*inch,
-        'telephone': 1.0*inch,
-        'adresse': 1.5*inch,
-        'date_adhesion': 0.8*inch,
-        'statut': 0.6*inch,
-        'plantation_ha': 0.7*inch,
-        'nb_arbres': 0.7*inch
-    }
-    
-    actual_col_widths = []
-    default_col_width = (available_width / num_cols) if num_cols > 0 else 1*inch
-    
-    for header in headers:
-        actual_col_widths.append(col_widths_map.get(header, default_col_width))
-    
-    current_total_width = sum(actual_col_widths)
-    if current_total_width > available_width and current_total_width > 0:
-        scale_factor = available_width / current_total_width
-        actual_col_widths = [w * scale_factor for w in actual_col_widths]
-    elif num_cols > 0 and not actual_col_widths:
-        actual_col_widths = [default_col_width] * num_cols
-
-    table = Table(data_for_table, colWidths=actual_col_widths if actual_col_widths and num_cols > 0 else None)
-
-    style_commands = [
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#4F81BD")),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'), # Default to left align for member data
-        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 9),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 6),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor("#DCE6F1")),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('LEFTPADDING', (0,0), (-1,-1), 3),
-        ('RIGHTPADDING', (0,0), (-1,-1), 3),
-    ]
-    
-    # Specific alignments for numeric columns if they exist
-    numeric_cols = ['plantation_ha', 'nb_arbres']
-    for col_name in numeric_cols:
-        try:
-            col_idx = headers.index(col_name)
-            style_commands.append(('ALIGN', (col_idx, 1), (col_idx, -1), 'RIGHT'))
-        except ValueError:
-            pass
-        
-    table.setStyle(TableStyle(style_commands))
-    story.append(table)
-    doc.build(story)
-    return buffer.getvalue()
+# Export PDF via le moteur commun (Modules/rapport_pdf.py)
+def export_df_to_pdf_bytes(df, title="Liste des membres", db_path=None):
+    return generer_pdf(
+        df, titre=title, db_path=db_path,
+        largeurs_colonnes={'numero_membre': 1.0, 'telephone': 1.0, 'adresse': 1.5,
+                           'date_adhesion': 0.8, 'statut': 0.6, 'plantation_ha': 0.7, 'nb_arbres': 0.7},
+        colonnes_numeriques=['plantation_ha', 'nb_arbres'],
+    )
 
 
             ## Création de la table des membres
@@ -124,10 +57,9 @@ def gestion_membres():
 
         if st.button("Enregistrer le membre"):
             try:
-                c.execute('''INSERT INTO membres (nom, numero_membre, telephone, adresse, date_adhesion, statut, plantation_ha, nb_arbres)
-                             VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-                          (nom, numero_membre, telephone, adresse, date_adhesion.strftime('%Y-%m-%d'), statut, plantation_ha, nb_arbres))
-                conn.commit()
+                db_pool.ecrire('''INSERT INTO membres (nom, numero_membre, telephone, adresse, date_adhesion, statut, plantation_ha, nb_arbres)
+                                  VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                               (nom, numero_membre, telephone, adresse, date_adhesion.strftime('%Y-%m-%d'), statut, plantation_ha, nb_arbres))
                 st.success("Membre ajouté avec succès.")
                 st.rerun()
             except sqlite3.IntegrityError:
@@ -141,40 +73,22 @@ def gestion_membres():
         # Afficher le dataframe seulement si un filtre est sélectionné
         if filtre_statut != "Sélectionner un filtre...":
             if filtre_statut == "Tous":
-                df = pd.read_sql_query("SELECT * FROM membres", conn)
+                requete = {"sql": "SELECT * FROM membres", "params": []}
             else:
-                df = pd.read_sql_query("SELECT * FROM membres WHERE statut = ?", conn, params=(filtre_statut,))
+                requete = {"sql": "SELECT * FROM membres WHERE statut = ?", "params": [filtre_statut]}
+            df = pd.read_sql_query(requete["sql"], conn, params=requete["params"])
             
             st.dataframe(df)
 
-            # Boutons d'export seulement si des données sont affichées
-            output = BytesIO()
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                df.to_excel(writer, index=False, sheet_name='Membres')
-                processed_data = output.getvalue()
-
-            st.download_button(
-                label="📥 Exporter en Excel",
-                data=processed_data,
-                file_name='membres.xlsx',
-                mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-
-            # PDF Export
+            # Boutons d'export seulement si des données sont affichées (fichiers générés au clic)
             if not df.empty:
-                try:
-                    pdf_export_buffer_membres = export_df_to_pdf_bytes(df.copy())
-                    st.download_button(
-                        label="📥 Exporter en PDF",
-                        data=pdf_export_buffer_membres,
-                        file_name='membres.pdf',
-                        mime='application/pdf',
-                        key='pdf_download_membres'
-                    )
-                except Exception as e:
-                    st.error(f"Erreur lors de la génération du PDF : {e}")
+                bouton_export_excel("📥 Exporter en Excel", requete, 'membres.xlsx',
+                                    nom_feuille='Membres', key='excel_download_membres')
+                bouton_export_pdf("📥 Exporter en PDF", requete, 'membres.pdf',
+                                  export_df_to_pdf_bytes, titre=f"Liste des membres ({filtre_statut})",
+                                  key='pdf_download_membres')
             else:
-                st.caption("Aucune donnée à exporter en PDF.")
+                st.caption("Aucune donnée à exporter.")
         else:
             st.info("Veuillez sélectionner un filtre pour afficher la liste des membres.")
 
@@ -212,11 +126,10 @@ def gestion_membres():
                     nb_arbres_modif = st.number_input("Nombre d'arbres", min_value=0, value=int(membre_selection_modif.nb_arbres or 0), key="modif_nb_arbres")
 
                     if st.button("Mettre à jour le membre"):
-                        c.execute('''UPDATE membres SET nom = ?, numero_membre = ?, telephone = ?, adresse = ?, date_adhesion = ?, statut = ?, plantation_ha = ?, nb_arbres = ?
-                                     WHERE id = ?''',
-                                  (nom_modif, numero_modif, telephone_modif, adresse_modif, date_adhesion_modif.strftime('%Y-%m-%d'),
-                                   statut_modif, plantation_modif, nb_arbres_modif, membre_selection_modif.id))
-                        conn.commit()
+                        db_pool.ecrire('''UPDATE membres SET nom = ?, numero_membre = ?, telephone = ?, adresse = ?, date_adhesion = ?, statut = ?, plantation_ha = ?, nb_arbres = ?
+                                          WHERE id = ?''',
+                                       (nom_modif, numero_modif, telephone_modif, adresse_modif, date_adhesion_modif.strftime('%Y-%m-%d'),
+                                        statut_modif, plantation_modif, nb_arbres_modif, membre_selection_modif.id))
                         st.success("Membre mis à jour avec succès.")
                         st.rerun()
         else:
@@ -256,8 +169,7 @@ def gestion_membres():
                 st.warning(f"⚠️ Voulez-vous vraiment supprimer **{st.session_state.membre_a_supprimer_info}** ? Cette action est irréversible.")
                 col1, col2 = st.columns(2)
                 if col1.button("Confirmer la suppression du membre"):
-                    c.execute("DELETE FROM membres WHERE id = ?", (st.session_state.membre_a_supprimer_id,))
-                    conn.commit()
+                    db_pool.ecrire("DELETE FROM membres WHERE id = ?", (st.session_state.membre_a_supprimer_id,))
                     st.success(f"Membre {st.session_state.membre_a_supprimer_info} supprimé avec succès.")
                     st.session_state.confirm_suppr_membre = False
                     st.session_state.membre_a_supprimer_id = None
@@ -281,8 +193,7 @@ def gestion_membres():
             st.warning("⚠️ Cette action supprimera **tous les membres** de manière irréversible.")
             col1_reset, col2_reset = st.columns(2)
             if col1_reset.button("Confirmer la suppression de tous les membres"):
-                c.execute("DELETE FROM membres")
-                conn.commit()
+                db_pool.ecrire("DELETE FROM membres")
                 st.success("Tous les membres ont été supprimés.")
                 st.session_state.confirm_suppression_membres = False
                 st.rerun()
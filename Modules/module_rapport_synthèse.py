@@ -2,7 +2,9 @@ import streamlit as st
 import sqlite3
 import pandas as pd
 from datetime import date
-from io import BytesIO
+from Modules import archives, db_pool, export_excel
+from Modules.exports import bouton_export_excel, bouton_export_pdf
+from Modules.taches import afficher_taches, bouton_tache, type_tache
 
 # Note: Session state initialization is handled by App_gestion.py
 # Removed global session state initialization to avoid conflicts
@@ -20,15 +22,9 @@ except ImportError:
     def apply_download_button_styles():
         pass
 
-# ReportLab imports avec gestion d'erreur
-try:
-    from reportlab.lib import colors
-    from reportlab.lib.pagesizes import letter
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
-    from reportlab.lib.units import inch
-    REPORTLAB_AVAILABLE = True
-except ImportError:
-    REPORTLAB_AVAILABLE = False
+# Export PDF (ReportLab optionnel)
+from Modules.rapport_pdf import REPORTLAB_AVAILABLE, generer_pdf
+if not REPORTLAB_AVAILABLE:
     st.warning("⚠️ ReportLab n'est pas installé. L'export PDF ne sera pas disponible.")
 
 # Connexion dynamique à la base de données sélectionnée
@@ -38,7 +34,7 @@ def get_connection():
         if not db_path:
             st.error("❌ Aucune base de données sélectionnée. Veuillez retourner à l'accueil pour sélectionner une coopérative.")
             st.stop()
-        return sqlite3.connect(db_path, check_same_thread=False)
+        return db_pool.get_connection(db_path)
     except sqlite3.Error as e:
         st.error(f"Erreur de connexion à la base de données : {e}")
         return None
@@ -46,74 +42,111 @@ def get_connection():
         st.error(f"Erreur générale de connexion : {e}")
         return None
 
-# Function to export DataFrame to PDF bytes using ReportLab
-def export_df_to_pdf_bytes(df):
-    if not REPORTLAB_AVAILABLE:
-        st.error("ReportLab n'est pas installé. Impossible d'exporter en PDF.")
-        return None
-    
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=0.5*inch, leftMargin=0.5*inch, topMargin=0.5*inch, bottomMargin=0.5*inch)
-    story = []
+# Export PDF via le moteur commun (Modules/rapport_pdf.py)
+def export_df_to_pdf_bytes(df, title="Rapport de synthèse", db_path=None):
+    return generer_pdf(
+        df, titre=title, db_path=db_path,
+        largeurs_colonnes={'Indicateur': 4, 'Valeur': 2},
+        colonnes_numeriques=['Valeur'],
+    )
 
-    headers = df.columns.tolist()
-    data_list = df.values.tolist()
-    
-    data_for_table = [headers] + [[str(cell) if cell is not None else '' for cell in row] for row in data_list]
 
-    page_width, _ = letter
-    available_width = page_width - 1*inch
-    num_cols = len(headers)
-    
-    # Adjusted col_widths_map for rapport_synthese module
-    col_widths_map = {
-        'Indicateur': 4*inch, # Wider for descriptive text
-        'Valeur': 2*inch      # For numeric/short text values
-    }
-    
-    actual_col_widths = []
-    default_col_width = (available_width / num_cols) if num_cols > 0 else 1*inch
-    
-    for header in headers:
-        actual_col_widths.append(col_widths_map.get(header, default_col_width))
-    
-    current_total_width = sum(actual_col_widths)
-    if current_total_width > available_width and current_total_width > 0:
-        scale_factor = available_width / current_total_width
-        actual_col_widths = [w * scale_factor for w in actual_col_widths]
-    elif num_cols > 0 and not actual_col_widths:
-        actual_col_widths = [default_col_width] * num_cols
-
-    table = Table(data_for_table, colWidths=actual_col_widths if actual_col_widths and num_cols > 0 else None)
-
-    style_commands = [
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#4F81BD")),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'), # Default to left align
-        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10), # Slightly larger for report headers
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor("#DCE6F1")),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('LEFTPADDING', (0,0), (-1,-1), 5),
-        ('RIGHTPADDING', (0,0), (-1,-1), 5),
-    ]
-    
-    # Specific alignment for 'Valeur' column to be right-aligned
-    try:
-        valeur_idx = headers.index('Valeur')
-        style_commands.append(('ALIGN', (valeur_idx, 1), (valeur_idx, -1), 'RIGHT'))
-    except ValueError:
-        pass # 'Valeur' column not found
-        
-    table.setStyle(TableStyle(style_commands))
-    story.append(table)
-    doc.build(story)
-    return buffer.getvalue()
+
+def bornes_periode(annee, mois=None):
+    """
+    Retourne les bornes (début inclus, fin exclue) d'un mois ou d'une année,
+    au format ISO utilisé pour les dates stockées.
+    """
+    if mois is None:
+        return date(annee, 1, 1).isoformat(), date(annee + 1, 1, 1).isoformat()
+    debut = date(annee, mois, 1)
+    fin = date(annee + 1, 1, 1) if mois == 12 else date(annee, mois + 1, 1)
+    return debut.isoformat(), fin.isoformat()
+
+# Indicateurs d'une période [:debut, :fin) ; {productions}, {ventes}, {cotisations} :
+# vues *_effectives de la base vivante ou de l'archive de l'année
+REQUETE_SYNTHESE = """
+    SELECT
+        (SELECT COALESCE(SUM(quantite), 0) FROM {productions}
+          WHERE date_livraison >= :debut AND date_livraison < :fin) AS total_livraison,
+        (SELECT COALESCE(SUM(montant), 0) FROM {ventes}
+          WHERE date_vente >= :debut AND date_vente < :fin) AS total_ventes,
+        (SELECT COALESCE(SUM(montant), 0) FROM {cotisations}
+          WHERE date_paiement >= :debut AND date_paiement < :fin) AS total_cotisations,
+        (SELECT COALESCE(SUM(montant), 0) FROM comptabilite
+          WHERE date_operation >= :debut AND date_operation < :fin
+            AND type = 'recette') AS recettes,
+        (SELECT COALESCE(SUM(montant), 0) FROM comptabilite
+          WHERE date_operation >= :debut AND date_operation < :fin
+            AND type = 'dépense') AS depenses
+"""
+
+def calculer_synthese(conn, debut, fin):
+    """
+    Calcule les indicateurs de la période [debut, fin) en une seule requête,
+    sur les enregistrements effectifs (vues *_effectives, hors lignes en erreur).
+    Une période d'une campagne archivée est lue dans la base d'archive de l'année.
+    """
+    annee = int(debut[:4])
+    productions, ventes, cotisations = (archives.source_annee(conn, vue, annee) for vue in
+                                        ("productions_effectives", "ventes_effectives", "cotisations_effectives"))
+    ligne = conn.execute(REQUETE_SYNTHESE.format(productions=productions, ventes=ventes, cotisations=cotisations),
+                         {"debut": debut, "fin": fin}).fetchone()
+    return dict(zip(("total_livraison", "total_ventes", "total_cotisations", "recettes", "depenses"), ligne))
+
+def tableau_synthese(synthese):
+    """Tableau Indicateur / Valeur d'une synthèse (exports)."""
+    return pd.DataFrame({
+        "Indicateur": ["Total Livraison (kg)", "Total Ventes (FCFA)", "Cotisations (FCFA)",
+                       "Recettes (FCFA)", "Dépenses (FCFA)", "Solde Net (FCFA)"],
+        "Valeur": [synthese["total_livraison"], synthese["total_ventes"], synthese["total_cotisations"],
+                   synthese["recettes"], synthese["depenses"], synthese["recettes"] - synthese["depenses"]]
+    })
+
+def detail_mensuel(conn, annee, progression=None):
+    """Indicateurs de chacun des mois de l'année, suivis d'une ligne de total."""
+    lignes = []
+    for mois in range(1, 13):
+        synthese = calculer_synthese(conn, *bornes_periode(annee, mois))
+        lignes.append({
+            "Mois": f"{annee}-{mois:02d}",
+            "Livraisons (kg)": synthese["total_livraison"],
+            "Ventes (FCFA)": synthese["total_ventes"],
+            "Cotisations (FCFA)": synthese["total_cotisations"],
+            "Recettes (FCFA)": synthese["recettes"],
+            "Dépenses (FCFA)": synthese["depenses"],
+            "Solde (FCFA)": synthese["recettes"] - synthese["depenses"],
+        })
+        if progression:
+            progression(mois / 13, f"Mois {mois:02d}/12")
+    df = pd.DataFrame(lignes)
+    total = df.drop(columns="Mois").sum()
+    return pd.concat([df, pd.DataFrame([{"Mois": "Total", **total.to_dict()}])], ignore_index=True)
+
+@type_tache("rapport_synthese")
+def _tache_rapport_synthese(conn, parametres, base_fichier, progression):
+    """Rapport de synthèse détaillé (Excel : synthèse + détail mensuel ; PDF : détail mensuel)."""
+    annee, mois = int(parametres["annee"]), parametres.get("mois")
+    synthese = tableau_synthese(calculer_synthese(conn, *bornes_periode(annee, mois)))
+    detail = detail_mensuel(conn, annee, progression) if mois is None else None
+    nom_fichier = f"rapport_{'mensuel' if mois else 'annuel'}_{annee}" + (f"_{int(mois):02d}" if mois else "")
+    titre = f"Rapport de synthèse - {f'{int(mois):02d}/' if mois else ''}{annee}"
+
+    if parametres.get("format") == "pdf":
+        chemin = base_fichier + ".pdf"
+        if detail is not None:
+            contenu = generer_pdf(detail, titre=titre, db_path=conn.pool.db_path, alignements={'Mois': 'LEFT'})
+        else:
+            contenu = export_df_to_pdf_bytes(synthese, titre, conn.pool.db_path)
+        with open(chemin, "wb") as fichier:
+            fichier.write(contenu)
+        return {"fichier": chemin, "nom_fichier": nom_fichier + ".pdf", "mime": "application/pdf"}
+
+    chemin = base_fichier + ".xlsx"
+    feuilles = [("Synthèse", synthese)] + ([("Détail mensuel", detail)] if detail is not None else [])
+    export_excel.ecrire_classeur(chemin, feuilles)
+    return {"fichier": chemin, "nom_fichier": nom_fichier + ".xlsx",
+            "mime": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"}
 
 
 
@@ -139,35 +172,15 @@ def rapport_synthese():
         else:
             annee = st.number_input("Année", min_value=2000, max_value=2100, step=1, value=2024)
 
-    # Clause SQL selon mode
-    clause = f"strftime('%Y-%m', date_livraison) = '{annee:04d}-{mois:02d}'" if mode == "Mensuel" else f"strftime('%Y', date_livraison) = '{annee}'"
-
-    # Données principales
-    total_livraison = pd.read_sql_query(f"SELECT SUM(quantite) AS total FROM productions WHERE {clause}", conn)["total"][0] or 0
-    total_ventes = pd.read_sql_query(
-        f"""SELECT SUM(quantite * prix_unitaire) AS total 
-            FROM ventes 
-            WHERE {clause.replace('date_livraison', 'date_vente')} 
-            AND statut IN ('valide', 'correction')""",
-        conn
-    )["total"][0] or 0
-    total_cotisations = pd.read_sql_query(
-        f"""SELECT SUM(montant) AS total 
-            FROM cotisations 
-            WHERE statut != 'erreur' 
-            AND {clause.replace('date_livraison', 'date_paiement')}""",
-        conn
-    )["total"][0] or 0
-
-    q_compta = pd.read_sql_query(
-        f"""SELECT type, SUM(montant) as total 
-            FROM comptabilite 
-            WHERE {clause.replace('date_livraison', 'date_operation')} 
-            GROUP BY type""",
-        conn
-    )
-    recettes = q_compta[q_compta["type"] == "recette"]["total"].sum()
-    depenses = q_compta[q_compta["type"] == "dépense"]["total"].sum()
+    # Bornes [début, fin) de la période : filtres par plage sur les colonnes de date indexées
+    debut, fin = bornes_periode(annee, mois if mode == "Mensuel" else None)
+    synthese = calculer_synthese(conn, debut, fin)
+
+    total_livraison = synthese["total_livraison"]
+    total_ventes = synthese["total_ventes"]
+    total_cotisations = synthese["total_cotisations"]
+    recettes = synthese["recettes"]
+    depenses = synthese["depenses"]
     solde = recettes - depenses
 
     # Onglets de navigation
@@ -207,41 +220,33 @@ def rapport_synthese():
     with onglet[2]:
         st.subheader("📤 Exporter le rapport au format Excel")
 
-        from io import BytesIO
-        export_df = pd.DataFrame({
-            "Indicateur": ["Total Livraison (kg)", "Total Ventes (FCFA)", "Cotisations (FCFA)",
-                           "Recettes (FCFA)", "Dépenses (FCFA)", "Solde Net (FCFA)"],
-            "Valeur": [total_livraison, total_ventes, total_cotisations, recettes, depenses, solde]
-        })
+        export_df = tableau_synthese(synthese)
 
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            export_df.to_excel(writer, index=False, sheet_name="Synthèse")
-            data_export = output.getvalue()
-
-        st.download_button(
-            label="📥 Télécharger le rapport (.xlsx)",
-            data=data_export,
-            file_name=f"rapport_{mode.lower()}_{annee}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+        # Fichiers générés uniquement au clic sur les boutons de téléchargement
+        bouton_export_excel("📥 Télécharger le rapport (.xlsx)", export_df,
+                            f"rapport_{mode.lower()}_{annee}.xlsx", nom_feuille="Synthèse",
+                            key='excel_download_rapport')
 
         # PDF Export
-        if not export_df.empty:
+        if REPORTLAB_AVAILABLE:
+            bouton_export_pdf("📥 Télécharger le rapport (.pdf)", export_df,
+                              f"rapport_{mode.lower()}_{annee}.pdf", export_df_to_pdf_bytes,
+                              titre=f"Rapport de synthèse - {mode} {annee}", key='pdf_download_rapport')
+        else:
+            st.info("📄 Export PDF non disponible (ReportLab non installé)")
+
+        # Rapport détaillé (détail mois par mois pour un rapport annuel) préparé par la file de tâches
+        st.subheader("⏳ Rapport détaillé en arrière-plan")
+        parametres_tache = {"annee": int(annee), "mois": mois if mode == "Mensuel" else None}
+        titre_tache = f"Rapport {mode.lower()} {f'{mois:02d}/' if mode == 'Mensuel' else ''}{annee}"
+        col1, col2 = st.columns(2)
+        with col1:
+            bouton_tache("📊 Préparer le rapport Excel", "rapport_synthese", f"{titre_tache} (Excel)",
+                         {**parametres_tache, "format": "xlsx"}, categorie="rapport_synthese",
+                         key="tache_rapport_excel")
+        with col2:
             if REPORTLAB_AVAILABLE:
-                try:
-                    pdf_export_buffer_rapport = export_df_to_pdf_bytes(export_df.copy())
-                    if pdf_export_buffer_rapport:
-                        st.download_button(
-                            label="📥 Télécharger le rapport (.pdf)",
-                            data=pdf_export_buffer_rapport,
-                            file_name=f"rapport_{mode.lower()}_{annee}.pdf",
-                            mime='application/pdf',
-                            key='pdf_download_rapport'
-                        )
-                except Exception as e:
-                    st.error(f"Erreur lors de la génération du PDF : {e}")
-            else:
-                st.info("📄 Export PDF non disponible (ReportLab non installé)")
-        elif export_df.empty:
-            st.caption("Aucune donnée à exporter en PDF.")
+                bouton_tache("📄 Préparer le rapport PDF", "rapport_synthese", f"{titre_tache} (PDF)",
+                             {**parametres_tache, "format": "pdf"}, categorie="rapport_synthese",
+                             key="tache_rapport_pdf")
+        afficher_taches("rapport_synthese")
@@ -4,7 +4,8 @@ import streamlit as st
 import sqlite3
 import os
 import shutil # For copying uploaded file
-import hashlib
+from datetime import date
+from Modules import archives, auth, db_pool, registre_coops
 
 # Directory for storing logos, relative to the main app's execution path.
 # It's good practice to ensure this path is correctly resolved.
@@ -17,75 +18,91 @@ def ensure_logo_dir_exists():
         os.makedirs(LOGO_BASE_DIR)
 
 def get_db_connection():
-    """Establishes a connection to the SQLite database from session state."""
+    """Returns the pooled connection to the SQLite database from session state."""
     db_path = st.session_state.get("db_path")
     if not db_path:
         st.error("La base de données de la coopérative n'est pas sélectionnée.")
         return None
-    conn = sqlite3.connect(db_path, check_same_thread=False)
-    conn.row_factory = sqlite3.Row # Allows accessing columns by name
-    return conn
+    return db_pool.get_connection(db_path)
+
+def get_row_cursor(conn):
+    """
+    Returns a cursor whose rows can be accessed by column name.
+    The row factory is set on the cursor, not on the shared pooled connection.
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    return cursor
 
 def initialize_settings_table():
     """
-    Creates the 'config' table if it doesn't exist in the current coop's database.
-    This table will store the cooperative's name, slogan, and logo path.
-    It's designed to hold a single row of configuration.
+    Ensures the 'config' table exists in the current coop's database.
+    The table and its single configuration row are created by the schema
+    migrations (Modules/db_migrations.py) applied when the database is first
+    opened, so no DDL runs here.
     """
-    conn = get_db_connection()
-    if not conn:
-        return
+    get_db_connection()
 
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS config (
-            id INTEGER PRIMARY KEY DEFAULT 1, -- Ensures only one row effectively
-            name TEXT,
-            slogan TEXT,
-            logo_path TEXT,
-            type_coop TEXT,
-            sigle TEXT,
-            date_creation TEXT,
-            immatriculation TEXT,
-            CONSTRAINT unique_config_row CHECK (id = 1) -- Enforce single row
-        )
-    ''')
-    # Ensure there's exactly one row for configuration
-    cursor.execute("SELECT COUNT(*) FROM config")
-    if cursor.fetchone()[0] == 0:
-        default_name = st.session_state.get("nom_coop", "Ma Coopérative")
-        cursor.execute("INSERT INTO config (id, name, slogan, logo_path, type_coop, sigle, date_creation, immatriculation) VALUES (1, ?, ?, ?, ?, ?, ?, ?)",
-                       (default_name, 'Notre Slogan', None, '', '', '', ''))
-    conn.commit()
-    conn.close()
+@st.cache_data(show_spinner=False)
+def _read_cooperative_config(db_path):
+    """
+    Reads the 'config' row of the database at db_path.
+    Cached per database path and cleared by save_cooperative_info(), so
+    page navigation does not query the configuration again.
+    """
+    conn = db_pool.get_connection(db_path)
+    cursor = get_row_cursor(conn)
+    cursor.execute("SELECT name, slogan, logo_path, type_coop, sigle, date_creation, immatriculation FROM config WHERE id = 1 LIMIT 1")
+    info = cursor.fetchone()
+    return dict(info) if info else None
+
+@st.cache_data(show_spinner=False)
+def load_logo_bytes(logo_path):
+    """
+    Returns the content of a logo file, or None if it cannot be read.
+    Loaded once per path and served from memory afterwards; the cache is
+    cleared when the cooperative information (and possibly the logo) is saved.
+    """
+    if not logo_path:
+        return None
+    try:
+        with open(logo_path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+@st.cache_data(show_spinner=False)
+def find_default_logo():
+    """Path of the first image found in LOGO_BASE_DIR (cached), or None."""
+    if not os.path.isdir(LOGO_BASE_DIR):
+        return None
+    for file in sorted(os.listdir(LOGO_BASE_DIR)):
+        if file.lower().endswith(('.png', '.jpg', '.jpeg')):
+            return os.path.join(LOGO_BASE_DIR, file)
+    return None
+
+def clear_cooperative_cache(db_path=None):
+    """Invalidates the cached configuration of db_path (all databases if None) and the logos."""
+    if db_path:
+        _read_cooperative_config.clear(db_path)
+    else:
+        _read_cooperative_config.clear()
+    load_logo_bytes.clear()
+    find_default_logo.clear()
 
 def load_cooperative_info():
     """
     Loads the cooperative's information (name, slogan, logo_path)
     from the 'config' table of the currently selected cooperative's database.
     """
-    ensure_logo_dir_exists()
-    initialize_settings_table() # Ensure table exists
-
-    conn = get_db_connection()
-    if not conn:
+    db_path = st.session_state.get("db_path")
+    if not db_path:
+        st.error("La base de données de la coopérative n'est pas sélectionnée.")
         return {"name": "N/A", "slogan": "N/A", "logo_path": None}
 
-    cursor = conn.cursor()
-    cursor.execute("SELECT name, slogan, logo_path, type_coop, sigle, date_creation, immatriculation FROM config WHERE id = 1 LIMIT 1")
-    info = cursor.fetchone()
-    conn.close()
-
+    info = _read_cooperative_config(db_path)
     if info:
-        return {
-            "name": info["name"],
-            "slogan": info["slogan"],
-            "logo_path": info["logo_path"],
-            "type_coop": info["type_coop"],
-            "sigle": info["sigle"],
-            "date_creation": info["date_creation"],
-            "immatriculation": info["immatriculation"]
-        }
+        return info
     # Fallback if somehow the row is missing after initialization
     return {
         "name": st.session_state.get("nom_coop", "N/A"),
@@ -102,30 +119,30 @@ def save_cooperative_info(name, slogan, logo_path, type_coop, sigle, date_creati
     Saves or updates the cooperative's information in the 'config' table.
     """
     ensure_logo_dir_exists()
-    initialize_settings_table() # Ensure table and row exist
 
-    conn = get_db_connection()
-    if not conn:
+    if not get_db_connection():
         return False, "Échec de la connexion à la base de données."
 
-    cursor = conn.cursor()
     try:
-        cursor.execute("""
+        db_pool.ecrire("""
             UPDATE config
             SET name = ?, slogan = ?, logo_path = ?, type_coop = ?, sigle = ?, date_creation = ?, immatriculation = ?
             WHERE id = 1
         """, (name, slogan, logo_path, type_coop, sigle, date_creation, immatriculation))
-        conn.commit()
+        clear_cooperative_cache(st.session_state.get("db_path"))
+        # Keep the cooperative registry (login lookup by name, sigle or alias) in sync;
+        # a registry failure does not undo the saved configuration.
+        try:
+            registre_coops.enregistrer_cooperative(st.session_state.get("db_path"), name, sigle)
+        except (sqlite3.Error, OSError) as e:
+            st.warning(f"Registre des coopératives non mis à jour : {e}")
         # Update session state if the name changed, as App_gestion.py uses it for display
         if st.session_state.get("nom_coop") != name:
             st.session_state["nom_coop"] = name
         message = f"Informations de la coopérative '{name}' mises à jour."
         return True, message
     except sqlite3.Error as e:
-        conn.rollback()
         return False, f"Erreur de base de données: {e}"
-    finally:
-        conn.close()
 
 def display_settings_page():
     """
@@ -134,15 +151,18 @@ def display_settings_page():
     st.header("⚙️ Paramètres de la Coopérative")
 
     try:
-        tabs = st.tabs(["Gestion des utilisateurs", "Modification des informations"])
-        if tabs and len(tabs) >= 2:
-            tab1, tab2 = tabs[0], tabs[1]
+        tabs = st.tabs(["Gestion des utilisateurs", "Modification des informations", "Clôture de campagne"])
+        if tabs and len(tabs) >= 3:
+            tab1, tab2, tab3 = tabs[0], tabs[1], tabs[2]
             
             with tab1:
                 gestion_utilisateurs()
 
             with tab2:
                 modification_informations()
+
+            with tab3:
+                cloture_campagnes()
         else:
             # Fallback si les tabs ne fonctionnent pas
             st.subheader("Gestion des utilisateurs")
@@ -151,6 +171,10 @@ def display_settings_page():
             st.markdown("---")
             st.subheader("Modification des informations")
             modification_informations()
+
+            st.markdown("---")
+            st.subheader("Clôture de campagne")
+            cloture_campagnes()
     except Exception as e:
         st.error(f"Erreur lors de l'affichage des paramètres : {e}")
         # Fallback simple
@@ -181,8 +205,9 @@ def modification_informations():
         
         st.write("Logo actuel:")
         current_logo_path = current_info.get("logo_path")
-        if current_logo_path and os.path.exists(current_logo_path):
-            st.image(current_logo_path, width=150)
+        current_logo = load_logo_bytes(current_logo_path)
+        if current_logo:
+            st.image(current_logo, width=150)
         elif current_logo_path:
             st.warning(f"Fichier logo introuvable à : {current_logo_path}")
         else:
@@ -218,13 +243,72 @@ def modification_informations():
         else:
             st.error(message)
 
+def cloture_campagnes():
+    """Displays the UI for archiving finished campaign years (see Modules/archives.py)."""
+    conn = get_db_connection()
+    if not conn:
+        return
+    db_path = st.session_state["db_path"]
+
+    st.subheader("Clôture de campagne")
+    st.caption("Les livraisons, ventes, cotisations, transactions et lots épuisés d'une année terminée sont "
+               "déplacés dans une base d'archive en lecture seule. Les totaux des tableaux de bord sont conservés ; "
+               "les historiques filtrés sur l'année lisent l'archive.")
+
+    cloturees = conn.execute("""
+        SELECT annee, fichier, date_archivage, lignes_archivees FROM campagnes_archivees ORDER BY annee DESC
+    """).fetchall()
+    if cloturees:
+        st.dataframe(
+            [{"Année": annee, "Fichier": fichier, "Archivée le": date_archivage, "Lignes": lignes}
+             for annee, fichier, date_archivage, lignes in cloturees],
+            use_container_width=True,
+        )
+        # Lignes saisies après la clôture d'une année : une nouvelle clôture les archive
+        for annee, *_ in cloturees:
+            restantes = archives.lignes_restantes(conn, annee)
+            if restantes:
+                detail = ", ".join(f"{table} : {nombre}" for table, nombre in restantes.items())
+                st.warning(f"⚠️ {annee} : lignes saisies après la clôture ({detail}). Relancez la clôture de {annee}.")
+
+    annee_courante = date.today().year
+    annees = sorted({int(ligne[0]) for ligne in conn.execute("""
+        SELECT substr(date_livraison, 1, 4) FROM productions
+        UNION SELECT substr(date_vente, 1, 4) FROM ventes
+        UNION SELECT substr(date_paiement, 1, 4) FROM cotisations
+        UNION SELECT substr(date_transaction, 1, 4) FROM transactions
+    """).fetchall() if ligne[0] and str(ligne[0]).isdigit() and int(ligne[0]) < annee_courante}, reverse=True)
+    if not annees:
+        st.info("Aucune campagne terminée à archiver.")
+        return
+
+    with st.form("form_cloture_campagne"):
+        annee = st.selectbox("Campagne à clôturer", annees)
+        compacter = st.checkbox("Compacter la base après archivage (VACUUM)", value=False)
+        confirme = st.checkbox("Je confirme le déplacement des données de cette année vers l'archive")
+        soumis = st.form_submit_button("🗄️ Clôturer la campagne")
+
+    if soumis:
+        if not confirme:
+            st.error("❌ Veuillez confirmer la clôture.")
+            return
+        try:
+            with st.spinner(f"Archivage de la campagne {annee}..."):
+                lignes = archives.archiver_annee(db_path, annee, compacter=compacter)
+        except (ValueError, sqlite3.Error, OSError) as e:
+            st.error(f"❌ Échec de l'archivage : {e}")
+            return
+        total = sum(lignes.values())
+        st.success(f"✅ Campagne {annee} archivée : {total} ligne(s) déplacée(s) vers "
+                   f"{os.path.basename(archives.chemin_archive(db_path, annee))}.")
+
 def get_all_users():
     """Fetches all users from the 'utilisateurs' table."""
     conn = get_db_connection()
     if not conn:
         return []
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, nom_prenoms, role, statut, gmail FROM utilisateurs")
+    cursor = get_row_cursor(conn)
+    cursor.execute("SELECT id, nom_prenoms, role, statut, gmail, id_membre FROM utilisateurs")
     users = cursor.fetchall()
     conn.close()
     return users
@@ -234,68 +318,52 @@ def get_all_membres():
     conn = get_db_connection()
     if not conn:
         return []
-    cursor = conn.cursor()
+    cursor = get_row_cursor(conn)
     cursor.execute("SELECT id, nom, telephone FROM membres")
     membres = cursor.fetchall()
     conn.close()
     return membres
 
-def create_user_for_member(nom_prenoms, role, statut, mot_de_passe, gmail):
-    """Creates a new user in the database."""
-    conn = get_db_connection()
-    if not conn:
+def create_user_for_member(nom_prenoms, role, statut, mot_de_passe, gmail, id_membre=None):
+    """Creates a new user in the database, linked to the member id_membre."""
+    if not get_db_connection():
         return False, "Database connection failed."
-    
-    cursor = conn.cursor()
+
     try:
-        # Hash password
-        salt = os.urandom(32)
-        key = hashlib.pbkdf2_hmac('sha256', mot_de_passe.encode('utf-8'), salt, 100000)
-        
-        cursor.execute("""
-            INSERT INTO utilisateurs (nom_prenoms, role, statut, mot_de_passe, salt, gmail)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (nom_prenoms, role, statut, key.hex(), salt.hex(), gmail))
-        conn.commit()
+        # Hash password (algorithm and iteration count stored with the hash)
+        salt, key, algo_hash, iterations = auth.hash_password(mot_de_passe)
+
+        db_pool.ecrire("""
+            INSERT INTO utilisateurs (nom_prenoms, role, statut, mot_de_passe, salt, gmail, algo_hash, iterations, id_membre)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (nom_prenoms, role, statut, key.hex(), salt.hex(), gmail, algo_hash, iterations, id_membre))
         return True, "Utilisateur créé avec succès."
     except sqlite3.IntegrityError:
         return False, "Un utilisateur avec ce nom ou cet email existe déjà."
     except sqlite3.Error as e:
         return False, f"Erreur de base de données: {e}"
-    finally:
-        conn.close()
 
 def update_user_role(user_id, new_role):
     """Updates the role of a specific user."""
-    conn = get_db_connection()
-    if not conn:
+    if not get_db_connection():
         return False, "Database connection failed."
-    
-    cursor = conn.cursor()
+
     try:
-        cursor.execute("UPDATE utilisateurs SET role = ? WHERE id = ?", (new_role, user_id))
-        conn.commit()
+        db_pool.ecrire("UPDATE utilisateurs SET role = ? WHERE id = ?", (new_role, user_id))
         return True, "Rôle de l'utilisateur mis à jour."
     except sqlite3.Error as e:
         return False, f"Erreur de base de données: {e}"
-    finally:
-        conn.close()
 
 def delete_user(user_id):
     """Deletes a user from the database."""
-    conn = get_db_connection()
-    if not conn:
+    if not get_db_connection():
         return False, "Database connection failed."
-    
-    cursor = conn.cursor()
+
     try:
-        cursor.execute("DELETE FROM utilisateurs WHERE id = ?", (user_id,))
-        conn.commit()
+        db_pool.ecrire("DELETE FROM utilisateurs WHERE id = ?", (user_id,))
         return True, "Utilisateur supprimé."
     except sqlite3.Error as e:
         return False, f"Erreur de base de données: {e}"
-    finally:
-        conn.close()
 
 
 def gestion_utilisateurs():
@@ -319,7 +387,8 @@ def gestion_utilisateurs():
 
     users = get_all_users()
     membres = get_all_membres()
-    user_names = [user['nom_prenoms'] for user in users]
+    # Accounts are matched to members by utilisateurs.id_membre (not by name: homonyms)
+    users_by_member = {user['id_membre']: user for user in users if user['id_membre'] is not None}
 
     # Interface de recherche et filtrage
     st.write("### 🔍 Recherche et Filtres")
@@ -345,7 +414,7 @@ def gestion_utilisateurs():
             continue
             
         # Filtrage par statut utilisateur
-        has_user_account = membre['nom'] in user_names
+        has_user_account = membre['id'] in users_by_member
         if filter_status == "Avec compte utilisateur" and not has_user_account:
             continue
         elif filter_status == "Sans compte utilisateur" and has_user_account:
@@ -425,7 +494,7 @@ def gestion_utilisateurs():
                 st.write(f"📞 {membre['telephone']}")
             
             with col3:
-                has_user_account = membre['nom'] in user_names
+                has_user_account = membre['id'] in users_by_member
                 if has_user_account:
                     st.success("✅ Compte actif")
                 else:
@@ -433,7 +502,7 @@ def gestion_utilisateurs():
             
             # Gestion des rôles et comptes utilisateur
             if has_user_account:
-                user = next((u for u in users if u['nom_prenoms'] == membre['nom']), None)
+                user = users_by_member.get(membre['id'])
                 if user:
                     with st.expander(f"🔧 Gérer le compte de {membre['nom']}", expanded=False):
                         col1, col2 = st.columns(2)
@@ -483,7 +552,7 @@ def gestion_utilisateurs():
                         
                         if submitted:
                             if password and gmail:
-                                success, message = create_user_for_member(membre['nom'], role, 'actif', password, gmail)
+                                success, message = create_user_for_member(membre['nom'], role, 'actif', password, gmail, membre['id'])
                                 if success:
                                     st.success(message)
                                     st.rerun()
@@ -2,11 +2,14 @@ import streamlit as st
 import sqlite3
 import pandas as pd
 from datetime import date
-from io import BytesIO
+from Modules import archives, db_pool, db_stocks
+from Modules.exports import bouton_export_excel, bouton_export_pdf
+from Modules.taches import exports_arriere_plan, requete_export
+from Modules.pagination import requete_paginee, bornes_annee, conditions_filtres, expression_annee, valeurs_distinctes
 
 # Import conditionnel des modules
 try:
-    from Modules.module_cultures import get_cultures_actives, get_qualites_culture, get_types_produits_culture, initialize_cultures_table
+    from Modules.module_cultures import get_cultures_actives, get_qualites_culture, get_types_produits_culture
 except ImportError as e:
     st.error(f"Erreur d'import module_cultures: {e}")
     # Fonctions de fallback
@@ -16,8 +19,6 @@ except ImportError as e:
         return ["Bonne", "Moyenne", "Mauvaise"]
     def get_types_produits_culture(culture_id):
         return ["brut", "transformé"]
-    def initialize_cultures_table():
-        pass
 
 try:
     from Modules.download_button_styles import apply_download_button_styles
@@ -25,24 +26,50 @@ except ImportError:
     def apply_download_button_styles():
         pass
 
-# ReportLab imports avec gestion d'erreur
-try:
-    from reportlab.lib import colors
-    from reportlab.lib.pagesizes import letter
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
-    from reportlab.lib.units import inch
-    REPORTLAB_AVAILABLE = True
-except ImportError:
-    REPORTLAB_AVAILABLE = False
+# Export PDF (ReportLab optionnel)
+from Modules.rapport_pdf import REPORTLAB_AVAILABLE, generer_pdf
+if not REPORTLAB_AVAILABLE:
     st.warning("⚠️ ReportLab n'est pas installé. L'export PDF ne sera pas disponible.")
 
+# Historiques affichés par requete_paginee ; {table} : table vivante ou d'archive
+LOTS_STOCK = {
+    "colonnes": ["id", "culture_nom AS culture", "type_produit", "qualite", "quantite",
+                 "date_entree", "COALESCE(observations, commentaire) AS observations"],
+    "source": "FROM stocks",
+    "ordre": "culture_nom, type_produit, qualite, date_entree, id",
+}
+HISTORIQUE_MOUVEMENTS = {
+    "colonnes": ["id", "date_mouvement", "CASE sens WHEN 'entree' THEN 'Entrée' ELSE 'Sortie' END AS sens",
+                 "culture_nom AS culture", "type_produit", "qualite", "quantite",
+                 "id_lot AS lot", "id_vente AS vente", "motif"],
+    "source": "FROM mouvements_stock",
+    "ordre": "date_mouvement DESC, id DESC",
+}
+HISTORIQUE_VENTES = requete_export("historique_ventes", {
+    "colonnes": ["id", "COALESCE(culture_nom, 'Hévéa') AS culture",
+                 "COALESCE(type_produit, 'brut') AS type_produit",
+                 "COALESCE(qualite, 'Standard') AS qualite", "quantite", "prix_unitaire",
+                 "COALESCE(prix_total, quantite * prix_unitaire) AS prix_total",
+                 "COALESCE(client, acheteur) AS client", "date_vente", "mode_paiement",
+                 "COALESCE(observations, commentaire) AS observations"],
+    "source": "FROM {table}",
+    "ordre": "date_vente DESC, id DESC",
+    "table": "ventes",
+    "filtres": {
+        "culture": "COALESCE(culture_nom, 'Hévéa') = ?",
+        "type_produit": "COALESCE(type_produit, 'brut') = ?",
+        "client": "COALESCE(client, acheteur) = ?",
+        "annee": expression_annee("date_vente"),
+    },
+})
+
 def get_connection():
     try:
         db_path = st.session_state.get("db_path")
         if not db_path:
             st.error("❌ Aucune base de données sélectionnée. Veuillez retourner à l'accueil pour sélectionner une coopérative.")
             st.stop()
-        return sqlite3.connect(db_path, check_same_thread=False)
+        return db_pool.get_connection(db_path)
     except sqlite3.Error as e:
         st.error(f"Erreur de connexion à la base de données : {e}")
         return None
@@ -51,140 +78,21 @@ def get_connection():
         return None
 
 def initialize_multicultural_tables():
-    """Initialise les tables pour le système multiculturel"""
-    conn = get_connection()
-    if not conn:
-        return
-    
-    c = conn.cursor()
-    
-    # Vérifier et ajouter les colonnes culture aux tables existantes
-    try:
-        # Vérifier si les colonnes existent déjà dans stocks
-        c.execute("PRAGMA table_info(stocks)")
-        columns_stocks = [column[1] for column in c.fetchall()]
-        
-        if 'culture_id' not in columns_stocks:
-            c.execute("ALTER TABLE stocks ADD COLUMN culture_id INTEGER")
-        if 'culture_nom' not in columns_stocks:
-            c.execute("ALTER TABLE stocks ADD COLUMN culture_nom TEXT")
-        if 'type_produit' not in columns_stocks:
-            c.execute("ALTER TABLE stocks ADD COLUMN type_produit TEXT DEFAULT 'brut'")
-        if 'qualite' not in columns_stocks:
-            c.execute("ALTER TABLE stocks ADD COLUMN qualite TEXT DEFAULT 'Standard'")
-        if 'observations' not in columns_stocks:
-            c.execute("ALTER TABLE stocks ADD COLUMN observations TEXT")
-        if 'date_entree' not in columns_stocks:
-            c.execute("ALTER TABLE stocks ADD COLUMN date_entree TEXT")
-    except Exception as e:
-        print(f"Erreur lors de la modification de la table stocks: {e}")
-        # En cas d'erreur, essayer de continuer avec les autres tables
-    
-    try:
-        # Vérifier si les colonnes existent déjà dans ventes
-        c.execute("PRAGMA table_info(ventes)")
-        columns_ventes = [column[1] for column in c.fetchall()]
-        
-        if 'culture_id' not in columns_ventes:
-            c.execute("ALTER TABLE ventes ADD COLUMN culture_id INTEGER")
-        if 'culture_nom' not in columns_ventes:
-            c.execute("ALTER TABLE ventes ADD COLUMN culture_nom TEXT")
-        if 'type_produit' not in columns_ventes:
-            c.execute("ALTER TABLE ventes ADD COLUMN type_produit TEXT DEFAULT 'brut'")
-        if 'prix_total' not in columns_ventes:
-            c.execute("ALTER TABLE ventes ADD COLUMN prix_total REAL")
-        if 'client' not in columns_ventes:
-            c.execute("ALTER TABLE ventes ADD COLUMN client TEXT")
-        if 'mode_paiement' not in columns_ventes:
-            c.execute("ALTER TABLE ventes ADD COLUMN mode_paiement TEXT")
-        if 'qualite' not in columns_ventes:
-            c.execute("ALTER TABLE ventes ADD COLUMN qualite TEXT")
-        if 'date_vente' not in columns_ventes:
-            c.execute("ALTER TABLE ventes ADD COLUMN date_vente TEXT")
-        if 'observations' not in columns_ventes:
-            c.execute("ALTER TABLE ventes ADD COLUMN observations TEXT")
-    except Exception as e:
-        print(f"Erreur lors de la modification de la table ventes: {e}")
-    
-    conn.commit()
-    conn.close()
-
-def export_df_to_pdf_bytes(df, title="Export"):
-    """Exporte un DataFrame en PDF"""
-    if not REPORTLAB_AVAILABLE:
-        st.error("ReportLab n'est pas installé. Impossible d'exporter en PDF.")
-        return None
-    
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=0.5*inch, leftMargin=0.5*inch, topMargin=0.5*inch, bottomMargin=0.5*inch)
-    story = []
-
-    headers = df.columns.tolist()
-    data_list = df.values.tolist()
-    
-    data_for_table = [headers] + [[str(cell) if cell is not None else '' for cell in row] for row in data_list]
+    """
+    Conservée pour compatibilité : les colonnes multiculturelles de stocks et ventes
+    sont ajoutées par les migrations de schéma (Modules/db_migrations.py).
+    """
+    get_connection()
 
-    page_width, _ = letter
-    available_width = page_width - 1*inch
-    num_cols = len(headers)
-    
-    col_widths_map = {
-        'id': 0.4*inch,
-        'culture': 1.0*inch,
-        'type_produit': 1.0*inch,
-        'qualite': 0.8*inch,
-        'quantite': 0.8*inch,
-        'date_entree': 1.0*inch,
-        'date_vente': 1.0*inch,
-        'prix_unitaire': 1.0*inch,
-        'prix_total': 1.0*inch,
-        'client': 1.2*inch
-    }
-    
-    actual_col_widths = []
-    default_col_width = (available_width / num_cols) if num_cols > 0 else 1*inch
-    
-    for header in headers:
-        actual_col_widths.append(col_widths_map.get(header, default_col_width))
-    
-    current_total_width = sum(actual_col_widths)
-    if current_total_width > available_width and current_total_width > 0:
-        scale_factor = available_width / current_total_width
-        actual_col_widths = [w * scale_factor for w in actual_col_widths]
-    elif num_cols > 0 and not actual_col_widths:
-        actual_col_widths = [default_col_width] * num_cols
+# Mise en page PDF des stocks et ventes (exports immédiats et en arrière-plan)
+OPTIONS_PDF = {
+    "largeurs_colonnes": {'prix_unitaire': 1.0, 'prix_total': 1.0, 'client': 1.2},
+    "colonnes_numeriques": ['quantite', 'prix_unitaire', 'prix_total'],
+}
 
-    table = Table(data_for_table, colWidths=actual_col_widths if actual_col_widths and num_cols > 0 else None)
-
-    style_commands = [
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#4F81BD")),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 9),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 6),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor("#DCE6F1")),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('LEFTPADDING', (0,0), (-1,-1), 3),
-        ('RIGHTPADDING', (0,0), (-1,-1), 3),
-    ]
-    
-    numeric_cols = ['quantite', 'prix_unitaire', 'prix_total']
-    for col_name in numeric_cols:
-        try:
-            col_idx = headers.index(col_name)
-            style_commands.append(('ALIGN', (col_idx, 1), (col_idx, -1), 'RIGHT'))
-        except ValueError:
-            pass
-        
-    table.setStyle(TableStyle(style_commands))
-    story.append(table)
-    doc.build(story)
-    return buffer.getvalue()
+def export_df_to_pdf_bytes(df, title="Export", db_path=None):
+    """Exporte un DataFrame (ou des lots de lignes) en PDF"""
+    return generer_pdf(df, titre=title, db_path=db_path, **OPTIONS_PDF)
 
 def gestion_stocks():
     """Interface de gestion des stocks multiculturels"""
@@ -195,10 +103,6 @@ def gestion_stocks():
     
     st.header("📦 Gestion des Stocks Multi-Cultures")
     
-    # Initialiser les tables
-    initialize_cultures_table()
-    initialize_multicultural_tables()
-    
     # Onglets
     onglets = st.tabs(["📥 Entrée en stock", "📋 État des stocks", "🔄 Mouvements", "🧹 Réinitialisation"])
     
@@ -241,68 +145,39 @@ def gestion_stocks():
         
         if st.button("✅ Ajouter au stock", type="primary"):
             if quantite > 0:
-                c.execute('''
-                    INSERT INTO stocks (culture_id, culture_nom, type_produit, qualite, quantite, date_entree, observations)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (culture_info['id'], culture_info['nom_culture'], type_produit, qualite, quantite, date_entree, observations))
-                conn.commit()
+                # Nouveau lot et mouvement d'entrée dans le grand livre
+                db_pool.executer_ecriture(lambda conn_ecriture: db_stocks.entrer_en_stock(
+                    conn_ecriture, culture_info['id'], culture_info['nom_culture'], type_produit, qualite,
+                    quantite, date_entree, observations))
                 st.success(f"✅ Stock de {culture_info['nom_culture']} ajouté avec succès!")
                 st.balloons()
                 st.rerun()
             else:
                 st.error("❌ Veuillez saisir une quantité valide.")
     
-    # Onglet 2: État des stocks
+    # Onglet 2: État des stocks (une ligne par produit dans soldes_stock)
     with onglets[1]:
         st.subheader("📋 État actuel des stocks")
         
-        # Vérifier d'abord quelles colonnes existent dans la table stocks
-        c.execute("PRAGMA table_info(stocks)")
-        columns_info = c.fetchall()
-        existing_columns = [column[1] for column in columns_info]
-        
-        # Construire la requête en fonction des colonnes disponibles
-        if 'qualite' in existing_columns:
-            df_stocks = pd.read_sql_query('''
-                SELECT id, COALESCE(culture_nom, 'Hévéa') as culture, 
-                       COALESCE(type_produit, 'brut') as type_produit,
-                       qualite, quantite, date_entree, observations
-                FROM stocks
-                WHERE quantite > 0
-                ORDER BY culture_nom, type_produit, qualite
-            ''', conn)
-        else:
-            # Si la colonne qualite n'existe pas, utiliser une valeur par défaut
-            df_stocks = pd.read_sql_query('''
-                SELECT id, COALESCE(culture_nom, 'Hévéa') as culture, 
-                       COALESCE(type_produit, 'brut') as type_produit,
-                       'Standard' as qualite, quantite, 
-                       COALESCE(date_entree, date_mouvement) as date_entree, 
-                       COALESCE(observations, commentaire) as observations
-                FROM stocks
-                WHERE quantite > 0
-                ORDER BY culture_nom, type_produit
-            ''', conn)
+        df_soldes = pd.read_sql_query('''
+            SELECT culture_nom AS culture, type_produit, qualite, quantite, date_maj AS dernier_mouvement
+            FROM soldes_stock
+            ORDER BY culture_nom, type_produit, qualite
+        ''', conn)
         
-        if not df_stocks.empty:
+        if not df_soldes.empty:
             # Filtres
             col1, col2, col3 = st.columns(3)
             with col1:
-                # Filtrer les valeurs None avant le tri
-                cultures_uniques = [culture for culture in df_stocks['culture'].unique() if culture is not None and str(culture).strip()]
-                cultures_options = ['Sélectionner un filtre...'] + ['Toutes les cultures'] + sorted(cultures_uniques)
+                cultures_options = ['Sélectionner un filtre...'] + ['Toutes les cultures'] + sorted(df_soldes['culture'].unique())
                 filtre_culture = st.selectbox("🌱 Filtrer par culture", cultures_options, key="filtre_culture_stock")
             
             with col2:
-                # Filtrer les valeurs None avant le tri
-                types_uniques = [type_prod for type_prod in df_stocks['type_produit'].unique() if type_prod is not None and str(type_prod).strip()]
-                types_options = ['Sélectionner un filtre...'] + ['Tous les types'] + sorted(types_uniques)
+                types_options = ['Sélectionner un filtre...'] + ['Tous les types'] + sorted(df_soldes['type_produit'].unique())
                 filtre_type = st.selectbox("🏷️ Filtrer par type", types_options, key="filtre_type_stock")
             
             with col3:
-                # Filtrer les valeurs None avant le tri
-                qualites_uniques = [qualite for qualite in df_stocks['qualite'].unique() if qualite is not None and str(qualite).strip()]
-                qualites_options = ['Sélectionner un filtre...'] + ['Toutes les qualités'] + sorted(qualites_uniques)
+                qualites_options = ['Sélectionner un filtre...'] + ['Toutes les qualités'] + sorted(df_soldes['qualite'].unique())
                 filtre_qualite = st.selectbox("⭐ Filtrer par qualité", qualites_options, key="filtre_qualite_stock")
             
             # Afficher les données seulement si au moins un filtre est sélectionné (pas "Sélectionner un filtre...")
@@ -310,65 +185,59 @@ def gestion_stocks():
                 filtre_type != 'Sélectionner un filtre...' or 
                 filtre_qualite != 'Sélectionner un filtre...'):
                 
-                # Appliquer les filtres
-                df = df_stocks.copy()
-                if filtre_culture != 'Toutes les cultures' and filtre_culture != 'Sélectionner un filtre...':
-                    df = df[df['culture'] == filtre_culture]
-                if filtre_type != 'Tous les types' and filtre_type != 'Sélectionner un filtre...':
-                    df = df[df['type_produit'] == filtre_type]
-                if filtre_qualite != 'Toutes les qualités' and filtre_qualite != 'Sélectionner un filtre...':
-                    df = df[df['qualite'] == filtre_qualite]
+                # Valeur None = filtre non sélectionné (voir pagination.clause_where)
+                culture = None if filtre_culture in ('Toutes les cultures', 'Sélectionner un filtre...') else filtre_culture
+                type_produit = None if filtre_type in ('Tous les types', 'Sélectionner un filtre...') else filtre_type
+                qualite = None if filtre_qualite in ('Toutes les qualités', 'Sélectionner un filtre...') else filtre_qualite
                 
-                # Statistiques
-                if not df.empty:
+                resume_culture = df_soldes
+                if culture is not None:
+                    resume_culture = resume_culture[resume_culture['culture'] == culture]
+                if type_produit is not None:
+                    resume_culture = resume_culture[resume_culture['type_produit'] == type_produit]
+                if qualite is not None:
+                    resume_culture = resume_culture[resume_culture['qualite'] == qualite]
+                
+                if not resume_culture.empty:
+                    # Détail des lots non épuisés, filtré et paginé en SQL
+                    st.subheader("📋 Détail des lots")
+                    df_lots, totaux_lots, requete_lots = requete_paginee(
+                        conn, "lots_stock",
+                        colonnes=LOTS_STOCK["colonnes"],
+                        source=LOTS_STOCK["source"],
+                        conditions=[("quantite > 0", ()), ("culture_nom = ?", culture),
+                                    ("type_produit = ?", type_produit), ("qualite = ?", qualite)],
+                        ordre=LOTS_STOCK["ordre"],
+                    )
+                    st.dataframe(df_lots, use_container_width=True)
+                    
+                    # Statistiques
                     col1, col2, col3, col4 = st.columns(4)
                     with col1:
-                        st.metric("📦 Total articles", len(df))
+                        st.metric("📦 Lots en stock", totaux_lots["nb_lignes"])
                     with col2:
-                        st.metric("⚖️ Quantité totale", f"{df['quantite'].sum():.1f} kg")
+                        st.metric("⚖️ Quantité totale", f"{resume_culture['quantite'].sum():.1f} kg")
                     with col3:
-                        st.metric("🌱 Cultures en stock", df['culture'].nunique())
+                        st.metric("🌱 Cultures en stock", resume_culture['culture'].nunique())
                     with col4:
-                        st.metric("🏷️ Types différents", df['type_produit'].nunique())
+                        st.metric("🏷️ Types différents", resume_culture['type_produit'].nunique())
                     
                     # Résumé par culture
                     st.subheader("📊 Résumé par culture")
-                    resume_culture = df.groupby(['culture', 'type_produit', 'qualite'])['quantite'].sum().reset_index()
-                    resume_culture = resume_culture.sort_values(['culture', 'type_produit', 'qualite'])
                     st.dataframe(resume_culture, use_container_width=True)
                     
-                    # Détail complet
-                    st.subheader("📋 Détail des stocks")
-                    st.dataframe(df, use_container_width=True)
-                    
-                    # Export
+                    # Export (fichiers générés uniquement au clic)
                     col1, col2 = st.columns(2)
                     with col1:
-                        output_stock = BytesIO()
-                        with pd.ExcelWriter(output_stock, engine='xlsxwriter') as writer:
-                            df.to_excel(writer, index=False, sheet_name='Stocks')
-                            resume_culture.to_excel(writer, index=False, sheet_name='Resume_par_culture')
-                        
-                        st.download_button(
-                            label="📥 Exporter en Excel",
-                            data=output_stock.getvalue(),
-                            file_name='stocks_multiculturels.xlsx',
-                            mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-                        )
+                        bouton_export_excel("📥 Exporter en Excel", requete_lots, 'stocks_multiculturels.xlsx',
+                                            nom_feuille='Stocks',
+                                            feuilles_supplementaires={'Resume_par_culture': resume_culture},
+                                            key='excel_download_stocks')
                     
                     with col2:
                         if REPORTLAB_AVAILABLE:
-                            try:
-                                pdf_data = export_df_to_pdf_bytes(df, "Stocks")
-                                if pdf_data:
-                                    st.download_button(
-                                        label="📄 Exporter en PDF",
-                                        data=pdf_data,
-                                        file_name='stocks_multiculturels.pdf',
-                                        mime='application/pdf'
-                                    )
-                            except Exception as e:
-                                st.error(f"Erreur PDF : {e}")
+                            bouton_export_pdf("📄 Exporter en PDF", requete_lots, 'stocks_multiculturels.pdf',
+                                              export_df_to_pdf_bytes, titre="Stocks", key='pdf_download_stocks')
                         else:
                             st.info("📄 Export PDF non disponible (ReportLab non installé)")
                 else:
@@ -378,35 +247,17 @@ def gestion_stocks():
         else:
             st.info("ℹ️ Aucun stock disponible.")
     
-    # Onglet 3: Mouvements
+    # Onglet 3: Mouvements (grand livre des entrées et sorties)
     with onglets[2]:
         st.subheader("🔄 Mouvements de stock")
         
-        # Vérifier d'abord quelles colonnes existent dans la table stocks
-        c.execute("PRAGMA table_info(stocks)")
-        columns_info = c.fetchall()
-        existing_columns = [column[1] for column in columns_info]
-        
-        # Construire la requête en fonction des colonnes disponibles
-        if 'qualite' in existing_columns:
-            df_mouvements = pd.read_sql_query('''
-                SELECT id, COALESCE(culture_nom, 'Hévéa') as culture,
-                       COALESCE(type_produit, 'brut') as type_produit,
-                       qualite, quantite, date_entree, observations
-                FROM stocks
-                ORDER BY date_entree DESC
-            ''', conn)
-        else:
-            # Si la colonne qualite n'existe pas, utiliser une valeur par défaut
-            df_mouvements = pd.read_sql_query('''
-                SELECT id, COALESCE(culture_nom, 'Hévéa') as culture,
-                       COALESCE(type_produit, 'brut') as type_produit,
-                       'Standard' as qualite, quantite, 
-                       COALESCE(date_entree, date_mouvement) as date_entree, 
-                       COALESCE(observations, commentaire) as observations
-                FROM stocks
-                ORDER BY COALESCE(date_entree, date_mouvement) DESC
-            ''', conn)
+        df_mouvements, totaux_mouvements, _ = requete_paginee(
+            conn, "mouvements_stock",
+            colonnes=HISTORIQUE_MOUVEMENTS["colonnes"],
+            source=HISTORIQUE_MOUVEMENTS["source"],
+            conditions=[],
+            ordre=HISTORIQUE_MOUVEMENTS["ordre"],
+        )
         
         if not df_mouvements.empty:
             st.dataframe(df_mouvements, use_container_width=True)
@@ -427,8 +278,7 @@ def gestion_stocks():
             st.warning("⚠️ Cette action supprimera **tous les stocks** de manière irréversible.")
             col1, col2 = st.columns(2)
             if col1.button("✅ Confirmer la suppression", type="primary"):
-                c.execute("DELETE FROM stocks")
-                conn.commit()
+                db_pool.executer_ecriture(db_stocks.vider_stocks)
                 st.success("✅ Tous les stocks ont été supprimés.")
                 st.session_state.confirm_suppression_stocks = False
                 st.rerun()
@@ -447,10 +297,6 @@ def gestion_ventes():
     
     st.header("🛒 Gestion des Ventes Multi-Cultures")
     
-    # Initialiser les tables
-    initialize_cultures_table()
-    initialize_multicultural_tables()
-    
     # Onglets
     onglets = st.tabs(["💰 Nouvelle vente", "📊 Historique des ventes", "📈 Analyses", "🧹 Réinitialisation"])
     
@@ -458,31 +304,12 @@ def gestion_ventes():
     with onglets[0]:
         st.subheader("💰 Enregistrer une nouvelle vente")
         
-        # Vérifier d'abord quelles colonnes existent dans la table stocks
-        c.execute("PRAGMA table_info(stocks)")
-        columns_info = c.fetchall()
-        existing_columns = [column[1] for column in columns_info]
-        
-        # Récupérer les stocks disponibles en fonction des colonnes disponibles
-        if 'qualite' in existing_columns:
-            stocks_disponibles = pd.read_sql_query('''
-                SELECT id, COALESCE(culture_nom, 'Hévéa') as culture,
-                       COALESCE(type_produit, 'brut') as type_produit,
-                       qualite, quantite
-                FROM stocks
-                WHERE quantite > 0
-                ORDER BY culture, type_produit, qualite
-            ''', conn)
-        else:
-            # Si la colonne qualite n'existe pas, utiliser une valeur par défaut
-            stocks_disponibles = pd.read_sql_query('''
-                SELECT id, COALESCE(culture_nom, 'Hévéa') as culture,
-                       COALESCE(type_produit, 'brut') as type_produit,
-                       'Standard' as qualite, quantite
-                FROM stocks
-                WHERE quantite > 0
-                ORDER BY culture, type_produit
-            ''', conn)
+        # Produits disponibles : une ligne par culture/type/qualité (soldes_stock)
+        stocks_disponibles = pd.read_sql_query('''
+            SELECT culture_nom AS culture, type_produit, qualite, quantite
+            FROM soldes_stock
+            ORDER BY culture_nom, type_produit, qualite
+        ''', conn)
         
         if stocks_disponibles.empty:
             st.warning("⚠️ Aucun stock disponible pour la vente.")
@@ -491,20 +318,21 @@ def gestion_ventes():
         # Créer les options de sélection
         stock_options = {}
         for _, stock in stocks_disponibles.iterrows():
-            label = f"{stock['culture']} - {stock['type_produit']} - {stock['qualite']} ({stock['quantite']} kg disponible)"
+            label = f"{stock['culture']} - {stock['type_produit']} - {stock['qualite']} ({stock['quantite']:g} kg disponible)"
             stock_options[label] = stock
         
         col1, col2 = st.columns(2)
         
         with col1:
-            stock_selectionne = st.selectbox("📦 Stock à vendre", list(stock_options.keys()))
+            stock_selectionne = st.selectbox("📦 Produit à vendre", list(stock_options.keys()))
             stock_info = stock_options[stock_selectionne]
             
             quantite_vente = st.number_input(
                 "📦 Quantité à vendre (kg)", 
                 min_value=0.0, 
                 max_value=float(stock_info['quantite']),
-                step=0.1
+                step=0.1,
+                help="La quantité est prélevée sur les lots les plus anciens en premier."
             )
             
             prix_unitaire = st.number_input("💰 Prix unitaire (FCFA/kg)", min_value=0.0, step=1.0)
@@ -523,25 +351,32 @@ def gestion_ventes():
         
         if st.button("✅ Enregistrer la vente", type="primary"):
             if quantite_vente > 0 and prix_unitaire > 0 and client.strip():
-                if quantite_vente <= stock_info['quantite']:
-                    # Enregistrer la vente
-                    c.execute('''
-                        INSERT INTO ventes (culture_id, culture_nom, type_produit, qualite, quantite, 
-                                          prix_unitaire, prix_total, client, date_vente, mode_paiement, observations)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (None, stock_info['culture'], stock_info['type_produit'], stock_info['qualite'],
-                          quantite_vente, prix_unitaire, prix_total, client, date_vente, mode_paiement, observations_vente))
-                    
-                    # Mettre à jour le stock
-                    nouvelle_quantite = stock_info['quantite'] - quantite_vente
-                    c.execute("UPDATE stocks SET quantite = ? WHERE id = ?", (nouvelle_quantite, stock_info['id']))
-                    
-                    conn.commit()
-                    st.success(f"✅ Vente de {stock_info['culture']} enregistrée avec succès!")
+                culture_id = next((culture['id'] for culture in get_cultures_actives()
+                                   if culture['nom_culture'] == stock_info['culture']), None)
+                vente = {
+                    "culture_id": culture_id, "prix_unitaire": prix_unitaire, "prix_total": prix_total,
+                    "client": client, "date_vente": date_vente, "mode_paiement": mode_paiement,
+                    "observations": observations_vente,
+                }
+                try:
+                    # Vente et imputation FIFO sur les lots dans une seule transaction
+                    _, imputations = db_pool.executer_ecriture(lambda conn_ecriture: db_stocks.vendre_fifo(
+                        conn_ecriture, stock_info['culture'], stock_info['type_produit'], stock_info['qualite'],
+                        quantite_vente, vente))
+                except ValueError as e:
+                    # Stock vendu entre-temps depuis une autre session
+                    st.error(f"❌ {e}")
+                except TimeoutError:
+                    # Écriture annulée avant d'avoir commencé (voir db_pool.executer_ecriture)
+                    st.error("❌ Base occupée : la vente n'a pas été enregistrée. Veuillez réessayer.")
+                except sqlite3.Error as e:
+                    st.error(f"❌ Erreur de la base de données : la vente n'a peut-être pas été enregistrée. "
+                             f"Vérifiez l'historique des ventes avant de la saisir à nouveau. ({e})")
+                else:
+                    st.success(f"✅ Vente de {stock_info['culture']} enregistrée avec succès "
+                               f"({len(imputations)} lot(s) prélevé(s))!")
                     st.balloons()
                     st.rerun()
-                else:
-                    st.error("❌ Quantité insuffisante en stock.")
             else:
                 st.error("❌ Veuillez remplir tous les champs obligatoires.")
     
@@ -549,62 +384,30 @@ def gestion_ventes():
     with onglets[1]:
         st.subheader("📊 Historique des ventes")
         
-        # Vérifier d'abord quelles colonnes existent dans la table ventes
-        c.execute("PRAGMA table_info(ventes)")
-        columns_info = c.fetchall()
-        existing_columns = [column[1] for column in columns_info]
-        
-        # Construire la requête en fonction des colonnes disponibles
-        if 'qualite' in existing_columns and 'culture_nom' in existing_columns:
-            df_ventes = pd.read_sql_query('''
-                SELECT id, COALESCE(culture_nom, 'Hévéa') as culture,
-                       COALESCE(type_produit, 'brut') as type_produit,
-                       qualite, quantite, prix_unitaire, prix_total, client, date_vente, mode_paiement, observations
-                FROM ventes
-                ORDER BY date_vente DESC
-            ''', conn)
-        else:
-            # Si les colonnes n'existent pas, utiliser les colonnes de base avec des valeurs par défaut
-            df_ventes = pd.read_sql_query('''
-                SELECT id, 'Hévéa' as culture,
-                       'brut' as type_produit,
-                       'Standard' as qualite, quantite, prix_unitaire, 
-                       COALESCE(prix_total, quantite * prix_unitaire) as prix_total, 
-                       COALESCE(client, acheteur) as client, date_vente, 
-                       'Espèces' as mode_paiement, 
-                       COALESCE(observations, commentaire) as observations
-                FROM ventes
-                ORDER BY date_vente DESC
-            ''', conn)
-        
-        if not df_ventes.empty:
-            # Convertir la date
-            df_ventes['date_vente'] = pd.to_datetime(df_ventes['date_vente'])
-            
-            # Filtres
+        campagnes_archivees = archives.annees_archivees(conn)
+        if c.execute("SELECT EXISTS(SELECT 1 FROM ventes)").fetchone()[0] or campagnes_archivees:
+            # Filtres (options lues par requêtes DISTINCT, sans charger la table)
             col1, col2, col3, col4 = st.columns(4)
             with col1:
-                # Filtrer les valeurs None avant le tri
-                cultures_uniques = [culture for culture in df_ventes['culture'].unique() if culture is not None and str(culture).strip()]
-                cultures_options = ['Sélectionner un filtre...'] + ['Toutes les cultures'] + sorted(cultures_uniques)
+                cultures_uniques = valeurs_distinctes(conn, "SELECT DISTINCT COALESCE(culture_nom, 'Hévéa') FROM ventes ORDER BY 1")
+                cultures_options = ['Sélectionner un filtre...'] + ['Toutes les cultures'] + cultures_uniques
                 filtre_culture = st.selectbox("🌱 Culture", cultures_options, key="filtre_culture_vente")
             
             with col2:
-                # Filtrer les valeurs None avant le tri
-                types_uniques = [type_prod for type_prod in df_ventes['type_produit'].unique() if type_prod is not None and str(type_prod).strip()]
-                types_options = ['Sélectionner un filtre...'] + ['Tous les types'] + sorted(types_uniques)
+                types_uniques = valeurs_distinctes(conn, "SELECT DISTINCT COALESCE(type_produit, 'brut') FROM ventes ORDER BY 1")
+                types_options = ['Sélectionner un filtre...'] + ['Tous les types'] + types_uniques
                 filtre_type = st.selectbox("🏷️ Type", types_options, key="filtre_type_vente")
             
             with col3:
-                # Filtrer les valeurs None avant le tri
-                clients_uniques = [client for client in df_ventes['client'].unique() if client is not None and str(client).strip()]
-                clients_options = ['Sélectionner un filtre...'] + ['Tous les clients'] + sorted(clients_uniques)
+                clients_uniques = valeurs_distinctes(conn, "SELECT DISTINCT COALESCE(client, acheteur) FROM ventes ORDER BY 1")
+                clients_options = ['Sélectionner un filtre...'] + ['Tous les clients'] + clients_uniques
                 filtre_client = st.selectbox("👤 Client", clients_options, key="filtre_client_vente")
             
             with col4:
-                # Filtrer les valeurs None avant le tri et convertir en entiers
-                years_uniques = [int(year) for year in df_ventes['date_vente'].dt.year.unique() if year is not None and not pd.isna(year)]
-                years = ['Sélectionner un filtre...'] + ['Toutes les années'] + sorted(years_uniques)
+                # Années de la base et campagnes archivées (lues dans leur base d'archive)
+                years_uniques = sorted({int(a) for a in valeurs_distinctes(conn, "SELECT DISTINCT substr(date_vente, 1, 4) FROM ventes")}
+                                       | set(campagnes_archivees))
+                years = ['Sélectionner un filtre...'] + ['Toutes les années'] + years_uniques
                 filtre_annee = st.selectbox("📅 Année", years, key="filtre_annee_vente")
             
             # Afficher les données seulement si au moins un filtre est sélectionné (pas "Sélectionner un filtre...")
@@ -613,60 +416,59 @@ def gestion_ventes():
                 filtre_client != 'Sélectionner un filtre...' or 
                 filtre_annee != 'Sélectionner un filtre...'):
                 
-                # Appliquer les filtres
-                df = df_ventes.copy()
-                if filtre_culture != 'Toutes les cultures' and filtre_culture != 'Sélectionner un filtre...':
-                    df = df[df['culture'] == filtre_culture]
-                if filtre_type != 'Tous les types' and filtre_type != 'Sélectionner un filtre...':
-                    df = df[df['type_produit'] == filtre_type]
-                if filtre_client != 'Tous les clients' and filtre_client != 'Sélectionner un filtre...':
-                    df = df[df['client'] == filtre_client]
-                if filtre_annee != 'Toutes les années' and filtre_annee != 'Sélectionner un filtre...':
-                    df = df[df['date_vente'].dt.year == filtre_annee]
+                # Filtres appliqués en SQL ; seule la page visible est chargée
+                table_ventes = archives.source_annee(conn, "ventes", filtre_annee)
+                if table_ventes != "ventes":
+                    st.caption(f"🗄️ Campagne {filtre_annee} archivée : consultation seule.")
+                filtres = {
+                    "culture": None if filtre_culture in ('Sélectionner un filtre...', 'Toutes les cultures') else filtre_culture,
+                    "type_produit": None if filtre_type in ('Sélectionner un filtre...', 'Tous les types') else filtre_type,
+                    "client": None if filtre_client in ('Sélectionner un filtre...', 'Tous les clients') else filtre_client,
+                    "annee": bornes_annee(None if filtre_annee in ('Sélectionner un filtre...', 'Toutes les années') else filtre_annee),
+                }
+                df, totaux, requete = requete_paginee(
+                    conn, "historique_ventes",
+                    colonnes=HISTORIQUE_VENTES["colonnes"],
+                    source=HISTORIQUE_VENTES["source"].format(table=table_ventes),
+                    conditions=conditions_filtres(HISTORIQUE_VENTES, filtres),
+                    ordre=HISTORIQUE_VENTES["ordre"],
+                    agregats={
+                        "quantite_totale": "COALESCE(SUM(quantite), 0)",
+                        "chiffre_affaires": "COALESCE(SUM(COALESCE(prix_total, quantite * prix_unitaire)), 0)",
+                        "nb_clients": "COUNT(DISTINCT COALESCE(client, acheteur))",
+                    },
+                )
                 
                 # Statistiques
-                if not df.empty:
+                if totaux["nb_lignes"]:
                     col1, col2, col3, col4 = st.columns(4)
                     with col1:
-                        st.metric("🛒 Total ventes", len(df))
+                        st.metric("🛒 Total ventes", totaux["nb_lignes"])
                     with col2:
-                        st.metric("📦 Quantité vendue", f"{df['quantite'].sum():.1f} kg")
+                        st.metric("📦 Quantité vendue", f"{totaux['quantite_totale']:.1f} kg")
                     with col3:
-                        st.metric("💰 Chiffre d'affaires", f"{df['prix_total'].sum():,.0f} FCFA")
+                        st.metric("💰 Chiffre d'affaires", f"{totaux['chiffre_affaires']:,.0f} FCFA")
                     with col4:
-                        st.metric("👥 Clients différents", df['client'].nunique())
+                        st.metric("👥 Clients différents", totaux["nb_clients"])
                     
                     st.dataframe(df, use_container_width=True)
                     
-                    # Export
+                    # Export de toutes les lignes filtrées, généré uniquement au clic
                     col1, col2 = st.columns(2)
                     with col1:
-                        output_ventes = BytesIO()
-                        with pd.ExcelWriter(output_ventes, engine='xlsxwriter') as writer:
-                            df.to_excel(writer, index=False, sheet_name='Ventes')
-                        
-                        st.download_button(
-                            label="📥 Exporter en Excel",
-                            data=output_ventes.getvalue(),
-                            file_name='ventes_multiculturelles.xlsx',
-                            mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-                        )
+                        bouton_export_excel("📥 Exporter en Excel", requete, 'ventes_multiculturelles.xlsx',
+                                            nom_feuille='Ventes', key='excel_download_ventes')
                     
                     with col2:
                         if REPORTLAB_AVAILABLE:
-                            try:
-                                pdf_data = export_df_to_pdf_bytes(df, "Ventes")
-                                if pdf_data:
-                                    st.download_button(
-                                        label="📄 Exporter en PDF",
-                                        data=pdf_data,
-                                        file_name='ventes_multiculturelles.pdf',
-                                        mime='application/pdf'
-                                    )
-                            except Exception as e:
-                                st.error(f"Erreur PDF : {e}")
+                            bouton_export_pdf("📄 Exporter en PDF", requete, 'ventes_multiculturelles.pdf',
+                                              export_df_to_pdf_bytes, titre="Ventes", key='pdf_download_ventes')
                         else:
                             st.info("📄 Export PDF non disponible (ReportLab non installé)")
+                    
+                    exports_arriere_plan("historique_ventes", "historique_ventes", table_ventes, filtres,
+                                         "ventes_multiculturelles", "Ventes", nom_feuille="Ventes",
+                                         options_pdf=OPTIONS_PDF)
                 else:
                     st.info("ℹ️ Aucune vente ne correspond aux filtres sélectionnés.")
             else:
@@ -678,13 +480,17 @@ def gestion_ventes():
     with onglets[2]:
         st.subheader("📈 Analyses des ventes")
         
-        if not df_ventes.empty:
+        # Agrégats calculés en SQL sur les ventes effectives (hors ventes en erreur)
+        ventes_par_culture = pd.read_sql_query('''
+            SELECT COALESCE(culture_nom, 'Hévéa') AS culture,
+                   SUM(quantite) AS quantite,
+                   SUM(montant) AS prix_total
+            FROM ventes_effectives
+            GROUP BY 1
+        ''', conn)
+        
+        if not ventes_par_culture.empty:
             # Ventes par culture
-            ventes_par_culture = df_ventes.groupby('culture').agg({
-                'quantite': 'sum',
-                'prix_total': 'sum'
-            }).reset_index()
-            
             col1, col2 = st.columns(2)
             with col1:
                 st.subheader("🌱 Ventes par culture")
@@ -695,7 +501,14 @@ def gestion_ventes():
                 st.bar_chart(ventes_par_culture.set_index('culture')['prix_total'])
             
             # Top clients
-            top_clients = df_ventes.groupby('client')['prix_total'].sum().sort_values(ascending=False).head(10)
+            top_clients = pd.read_sql_query('''
+                SELECT COALESCE(client, acheteur) AS client,
+                       SUM(montant) AS prix_total
+                FROM ventes_effectives
+                GROUP BY 1
+                ORDER BY prix_total DESC
+                LIMIT 10
+            ''', conn).set_index('client')['prix_total']
             st.subheader("🏆 Top 10 clients")
             st.bar_chart(top_clients)
         else:
@@ -715,8 +528,7 @@ def gestion_ventes():
             st.warning("⚠️ Cette action supprimera **toutes les ventes** de manière irréversible.")
             col1, col2 = st.columns(2)
             if col1.button("✅ Confirmer la suppression", type="primary"):
-                c.execute("DELETE FROM ventes")
-                conn.commit()
+                db_pool.ecrire("DELETE FROM ventes")
                 st.success("✅ Toutes les ventes ont été supprimées.")
                 st.session_state.confirm_suppression_ventes = False
                 st.rerun()
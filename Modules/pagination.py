@@ -0,0 +1,127 @@
+# Modules/pagination.py
+
+import streamlit as st
+import pandas as pd
+
+# Tailles de page proposées dans les historiques
+TAILLES_PAGE = [20, 50, 100]
+
+
+def clause_where(conditions):
+    """
+    Construit une clause WHERE paramétrée à partir de couples (expression SQL, valeur).
+    Une valeur None signifie « filtre non sélectionné » : la condition est ignorée.
+    Une valeur tuple fournit plusieurs paramètres à la même expression.
+    """
+    expressions, parametres = [], []
+    for expression, valeur in conditions:
+        if valeur is None:
+            continue
+        expressions.append(expression)
+        parametres.extend(valeur if isinstance(valeur, tuple) else (valeur,))
+    if not expressions:
+        return "", []
+    return "WHERE " + " AND ".join(expressions), parametres
+
+
+def requete_filtree(colonnes, source, conditions, ordre):
+    """
+    Requête d'historique (sans pagination) et ses paramètres : SELECT colonnes
+    source WHERE conditions ORDER BY ordre. Utilisée par requete_paginee() et
+    par la vérification des plans de requêtes (Modules/db_plans_requetes.py).
+    """
+    where, parametres = clause_where(conditions)
+    return f"SELECT {', '.join(colonnes)} {source} {where} ORDER BY {ordre}", list(parametres)
+
+
+def expression_annee(colonne):
+    """Expression de filtre par plage [1er janvier, 1er janvier suivant) sur une colonne de date indexée."""
+    return f"{colonne} >= ? AND {colonne} < ?"
+
+
+def bornes_annee(annee):
+    """Paramètres de expression_annee() pour une année (None : filtre non sélectionné)."""
+    return None if annee is None else (f"{int(annee):04d}-01-01", f"{int(annee) + 1:04d}-01-01")
+
+
+def condition_annee(colonne, annee):
+    """Condition par plage [1er janvier, 1er janvier suivant) sur une colonne de date indexée."""
+    return (expression_annee(colonne), bornes_annee(annee))
+
+
+def conditions_filtres(definition, filtres):
+    """
+    Conditions d'un historique à partir des valeurs de ses filtres nommés :
+    definition['filtres'] associe chaque nom à son expression SQL, filtres
+    associe un nom à sa valeur (None : filtre non sélectionné).
+    """
+    return [(definition["filtres"][nom], valeur) for nom, valeur in filtres.items()]
+
+
+def valeurs_distinctes(conn, requete, parametres=()):
+    """Retourne les valeurs non vides de la première colonne d'une requête (options de filtres)."""
+    return [ligne[0] for ligne in conn.execute(requete, parametres).fetchall()
+            if ligne[0] is not None and str(ligne[0]).strip()]
+
+
+def _controles_pagination(cle, total_lignes):
+    """Affiche taille de page et boutons Précédent/Suivant ; retourne (limite, décalage)."""
+    cle_page = f"page_{cle}"
+    col_taille, col_prec, col_info, col_suiv = st.columns([1, 1, 2, 1])
+    with col_taille:
+        taille_page = st.selectbox("Lignes par page", TAILLES_PAGE, key=f"taille_page_{cle}")
+
+    total_pages = max((total_lignes - 1) // taille_page + 1, 1)
+    page = min(st.session_state.get(cle_page, 0), total_pages - 1)
+    st.session_state[cle_page] = page
+
+    with col_prec:
+        if st.button("⬅️ Précédent", key=f"prec_{cle}", disabled=page == 0):
+            st.session_state[cle_page] = page - 1
+            st.rerun()
+    with col_info:
+        st.write(f"Page {page + 1} sur {total_pages} ({total_lignes} lignes)")
+    with col_suiv:
+        if st.button("➡️ Suivant", key=f"suiv_{cle}", disabled=page >= total_pages - 1):
+            st.session_state[cle_page] = page + 1
+            st.rerun()
+
+    return taille_page, page * taille_page
+
+
+def requete_paginee(conn, cle, colonnes, source, conditions, ordre, agregats=None):
+    """
+    Exécute une requête d'historique filtrée côté SQL et n'en charge que la page visible.
+
+    - colonnes : expressions du SELECT (ex. "p.id", "m.nom AS membre")
+    - source : clause FROM (avec jointures éventuelles)
+    - conditions : couples (expression, valeur) passés à clause_where()
+    - ordre : clause ORDER BY (ajouter une colonne unique, ex. l'id, pour un ordre stable)
+    - agregats : {nom: expression SQL} calculés sur toutes les lignes filtrées
+
+    Retourne (df_page, totaux, requete) : totaux contient 'nb_lignes' et les agrégats ;
+    requete = {'sql', 'params'} décrit l'ensemble filtré (sans pagination) pour les exports.
+    """
+    where, parametres = clause_where(conditions)
+    agregats = agregats or {}
+
+    # Comptage et totaux en une seule requête d'agrégation
+    expressions = ", ".join(["COUNT(*)"] + list(agregats.values()))
+    ligne = conn.execute(f"SELECT {expressions} {source} {where}", parametres).fetchone()
+    totaux = dict(zip(["nb_lignes"] + list(agregats.keys()), ligne))
+
+    sql, _ = requete_filtree(colonnes, source, conditions, ordre)
+    requete = {"sql": sql, "params": list(parametres)}
+
+    # Revenir à la première page quand les filtres changent
+    signature = (where, tuple(parametres))
+    if st.session_state.get(f"filtres_{cle}") != signature:
+        st.session_state[f"filtres_{cle}"] = signature
+        st.session_state[f"page_{cle}"] = 0
+
+    if not totaux["nb_lignes"]:
+        return pd.DataFrame(), totaux, requete
+
+    limite, decalage = _controles_pagination(cle, totaux["nb_lignes"])
+    df_page = pd.read_sql_query(f"{sql} LIMIT ? OFFSET ?", conn, params=list(parametres) + [limite, decalage])
+    return df_page, totaux, requete
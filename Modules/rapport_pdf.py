@@ -0,0 +1,222 @@
+# Modules/rapport_pdf.py
+
+import os
+from datetime import datetime
+from io import BytesIO
+
+import pandas as pd
+
+from Modules import db_pool
+
+# ReportLab imports avec gestion d'erreur
+try:
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Image, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+    REPORTLAB_AVAILABLE = True
+except ImportError:
+    REPORTLAB_AVAILABLE = False
+
+# Moteur commun des exports PDF : les lignes sont découpées en tableaux d'une
+# page (en-tête répété), produits au fur et à mesure de la mise en page, ce qui
+# borne la mémoire quel que soit le nombre de lignes exportées.
+
+LIGNES_PAR_TABLEAU = 40   # lignes de données par tableau (environ une page en police 8)
+HAUTEUR_LIGNE = 14        # hauteur fixe des lignes : évite la mesure de chaque cellule
+MARGE = 0.5               # marges de page, en pouces
+
+# Largeurs par défaut (en pouces) des colonnes courantes ; les autres colonnes
+# se partagent la largeur disponible.
+LARGEURS_COLONNES = {
+    'id': 0.4,
+    'id_membre': 0.7,
+    'membre': 1.5,
+    'nom': 1.5,
+    'culture': 1.0,
+    'type_produit': 1.0,
+    'qualite': 0.8,
+    'quantite': 0.8,
+    'montant': 1.0,
+    'date_livraison': 1.0,
+    'date_paiement': 1.0,
+    'date_entree': 1.0,
+    'date_vente': 1.0,
+    'date_transaction': 1.0,
+    'statut': 0.7,
+    'correction_id': 0.9,
+}
+
+
+class _FluxElements(list):
+    """
+    Liste d'éléments alimentée à la demande : doc.build() retire les éléments
+    un à un en tête de liste, et la liste est complétée depuis le générateur.
+    """
+
+    def __init__(self, elements, avance=3):
+        super().__init__()
+        self._elements = iter(elements)
+        self._avance = avance
+        self._completer()
+
+    def _completer(self):
+        while len(self) < self._avance:
+            element = next(self._elements, None)
+            if element is None:
+                break
+            self.append(element)
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._completer()
+
+
+def entete_cooperative(db_path):
+    """Nom et chemin du logo de la coopérative (table config), ou (None, None)."""
+    if not db_path:
+        return None, None
+    try:
+        conn = db_pool.get_pool(db_path).connexion()
+        ligne = conn.execute("SELECT name, logo_path FROM config WHERE id = 1").fetchone()
+    except Exception:
+        return None, None
+    return (ligne[0], ligne[1]) if ligne else (None, None)
+
+
+def _lots(source):
+    """Normalise la source en itérateur de DataFrames (un DataFrame ou des lots de read_sql_query)."""
+    if isinstance(source, pd.DataFrame):
+        return iter([source])
+    return iter(source)
+
+
+def _texte(valeur):
+    if valeur is None or valeur != valeur:  # None, NaN, NaT
+        return ''
+    return str(valeur)
+
+
+def _largeurs(colonnes, largeurs_colonnes, largeur_disponible):
+    """Largeurs des colonnes calculées une seule fois pour tout le document."""
+    largeurs_colonnes = {**LARGEURS_COLONNES, **(largeurs_colonnes or {})}
+    defaut = largeur_disponible / len(colonnes)
+    largeurs = [largeurs_colonnes[c] * inch if c in largeurs_colonnes else defaut for c in colonnes]
+    total = sum(largeurs)
+    if total > largeur_disponible:
+        largeurs = [l * largeur_disponible / total for l in largeurs]
+    return largeurs
+
+
+def _style(colonnes, colonnes_droite, alignements):
+    """Style partagé par tous les tableaux d'un document."""
+    commandes = [
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#4F81BD")),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 9),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor("#DCE6F1")),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 8),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ('LEFTPADDING', (0, 0), (-1, -1), 3),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 3),
+    ]
+    for i, colonne in enumerate(colonnes):
+        alignement = alignements.get(colonne, 'RIGHT' if colonne in colonnes_droite else None)
+        if alignement:
+            commandes.append(('ALIGN', (i, 1), (i, -1), alignement))
+    return TableStyle(commandes)
+
+
+def _chainer(premier, lots):
+    yield premier
+    yield from lots
+
+
+def _elements(lots, premier, titre, nom_coop, logo_path, largeur_disponible,
+              largeurs_colonnes, colonnes_numeriques, alignements):
+    styles = getSampleStyleSheet()
+
+    # En-tête : logo et nom de la coopérative, titre du document
+    if logo_path and os.path.exists(logo_path):
+        try:
+            logo = Image(logo_path)
+            ratio = 0.8 * inch / logo.imageHeight
+            logo.drawHeight, logo.drawWidth = 0.8 * inch, logo.imageWidth * ratio
+            logo.hAlign = 'LEFT'
+            yield logo
+        except Exception:
+            pass
+    if nom_coop:
+        yield Paragraph(nom_coop, styles['Heading2'])
+    if titre:
+        yield Paragraph(titre, styles['Title'])
+        yield Paragraph(f"Édité le {datetime.now().strftime('%d/%m/%Y %H:%M')}", styles['Normal'])
+        yield Spacer(1, 12)
+
+    colonnes = [str(c) for c in premier.columns]
+    if not colonnes:
+        yield Paragraph("Aucune donnée.", styles['Normal'])
+        return
+
+    # Largeurs et style calculés une fois ; colonnes numériques alignées à droite
+    largeurs = _largeurs(colonnes, largeurs_colonnes, largeur_disponible)
+    colonnes_droite = set(colonnes_numeriques or [])
+    identifiants = {c for c in colonnes if c == 'id' or c.startswith('id_') or c.endswith('_id')}
+    colonnes_droite |= {str(c) for c, t in premier.dtypes.items() if pd.api.types.is_numeric_dtype(t)} - identifiants
+    style = _style(colonnes, colonnes_droite, alignements or {})
+
+    def tableau(lignes):
+        table = Table([colonnes] + lignes, colWidths=largeurs,
+                      rowHeights=HAUTEUR_LIGNE, repeatRows=1)
+        table.setStyle(style)
+        return table
+
+    vide = True
+    for lot in _chainer(premier, lots):
+        lignes = []
+        for ligne in lot.itertuples(index=False, name=None):
+            lignes.append([_texte(v) for v in ligne])
+            if len(lignes) == LIGNES_PAR_TABLEAU:
+                vide = False
+                yield tableau(lignes)
+                lignes = []
+        if lignes:
+            vide = False
+            yield tableau(lignes)
+    if vide:
+        yield tableau([])
+
+
+def generer_pdf(source, titre=None, largeurs_colonnes=None, colonnes_numeriques=None,
+                alignements=None, db_path=None):
+    """
+    Génère un PDF tabulaire et retourne son contenu (bytes).
+
+    - source : DataFrame ou itérable de DataFrames (ex. read_sql_query avec chunksize)
+    - titre : titre du document ; le nom et le logo de la coopérative (table config
+      de db_path) sont ajoutés en en-tête
+    - largeurs_colonnes : {colonne: largeur en pouces} complétant LARGEURS_COLONNES
+    - colonnes_numeriques : colonnes alignées à droite (en plus des colonnes numériques)
+    - alignements : {colonne: 'LEFT' | 'CENTER' | 'RIGHT'} imposés
+    """
+    if not REPORTLAB_AVAILABLE:
+        raise ImportError("ReportLab n'est pas installé. Impossible d'exporter en PDF.")
+
+    lots = _lots(source)
+    premier = next(lots, pd.DataFrame())
+    nom_coop, logo_path = entete_cooperative(db_path)
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, title=titre or "",
+                            rightMargin=MARGE * inch, leftMargin=MARGE * inch,
+                            topMargin=MARGE * inch, bottomMargin=MARGE * inch)
+    largeur_disponible = letter[0] - 2 * MARGE * inch
+    doc.build(_FluxElements(_elements(lots, premier, titre, nom_coop, logo_path, largeur_disponible,
+                                      largeurs_colonnes, colonnes_numeriques, alignements)))
+    return buffer.getvalue()
@@ -0,0 +1,257 @@
+# Modules/registre_coops.py
+
+import difflib
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from datetime import datetime
+
+import streamlit as st
+
+# Registre central des coopératives hébergées : une petite base SQLite qui
+# associe les noms normalisés, sigles et alias au fichier de base de chaque
+# coopérative. La connexion retrouve une coopérative par une recherche sur
+# clé primaire au lieu de parcourir et normaliser tous les fichiers de data/.
+
+DOSSIER_BASES = "data"
+FICHIER_REGISTRE = os.path.join(DOSSIER_BASES, "registre.db")
+# Fichiers .db de data/ qui ne sont pas des bases de coopérative
+FICHIERS_EXCLUS = {"modèle_base.db", "registre.db"}
+
+SEUIL_SIMILARITE = 0.6   # score minimal (difflib) d'une suggestion
+NB_SUGGESTIONS = 5
+
+_verrou_initialisation = threading.Lock()
+_schema_cree = False
+
+
+def normaliser(texte):
+    """Forme de recherche d'un nom : minuscules, sans accents ni ponctuation."""
+    texte = unicodedata.normalize("NFKD", str(texte or ""))
+    texte = "".join(c for c in texte if not unicodedata.combining(c)).lower()
+    return re.sub(r"[^a-z0-9]+", " ", texte).strip()
+
+
+def nom_depuis_fichier(nom_fichier):
+    """Nom normalisé déduit du fichier (coop_<nom>.db)."""
+    racine = os.path.splitext(os.path.basename(nom_fichier))[0]
+    if racine.startswith("coop_"):
+        racine = racine[len("coop_"):]
+    return normaliser(racine)
+
+
+def _connexion():
+    """Connexion au registre ; le schéma est créé à la première ouverture du processus."""
+    global _schema_cree
+    os.makedirs(DOSSIER_BASES, exist_ok=True)
+    conn = sqlite3.connect(FICHIER_REGISTRE, timeout=10)
+    conn.execute("PRAGMA foreign_keys = ON")
+    if _schema_cree:
+        return conn
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS cooperatives (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chemin TEXT NOT NULL UNIQUE,
+            nom TEXT NOT NULL,
+            sigle TEXT,
+            taille_octets INTEGER,
+            date_enregistrement TEXT,
+            dernier_acces TEXT
+        );
+        CREATE TABLE IF NOT EXISTS alias (
+            alias TEXT PRIMARY KEY,
+            id_cooperative INTEGER NOT NULL REFERENCES cooperatives(id) ON DELETE CASCADE,
+            origine TEXT NOT NULL DEFAULT 'auto'
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_alias_cooperative ON alias(id_cooperative);
+    """)
+    _schema_cree = True
+    return conn
+
+
+def _chemin_normalise(chemin):
+    return os.path.normpath(chemin)
+
+
+def _enregistrer(conn, chemin, nom, sigle=None):
+    """Ajoute ou met à jour une coopérative et ses alias automatiques (sans commit)."""
+    chemin = _chemin_normalise(chemin)
+    taille = os.path.getsize(chemin) if os.path.exists(chemin) else None
+    conn.execute("""
+        INSERT INTO cooperatives (chemin, nom, sigle, taille_octets, date_enregistrement)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(chemin) DO UPDATE SET nom = excluded.nom, sigle = excluded.sigle,
+                                          taille_octets = excluded.taille_octets
+    """, (chemin, nom, sigle or None, taille, datetime.now().isoformat(timespec="seconds")))
+    id_coop = conn.execute("SELECT id FROM cooperatives WHERE chemin = ?", (chemin,)).fetchone()[0]
+
+    # Alias automatiques recalculés ; les alias ajoutés manuellement sont conservés
+    conn.execute("DELETE FROM alias WHERE id_cooperative = ? AND origine = 'auto'", (id_coop,))
+    alias = {normaliser(nom), nom_depuis_fichier(chemin), normaliser(sigle)} - {""}
+    conn.executemany(
+        "INSERT OR IGNORE INTO alias (alias, id_cooperative) VALUES (?, ?)",
+        [(a, id_coop) for a in alias],
+    )
+    return id_coop
+
+
+def _lire_config(chemin):
+    """(nom, sigle) lus dans la table config d'une base de coopérative, en lecture seule."""
+    try:
+        conn = sqlite3.connect(f"file:{chemin}?mode=ro", uri=True)
+        try:
+            ligne = conn.execute("SELECT name, sigle FROM config WHERE id = 1").fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        ligne = None
+    if ligne and ligne[0]:
+        return ligne[0], ligne[1]
+    return nom_depuis_fichier(chemin), None
+
+
+def synchroniser_registre():
+    """
+    Rapproche le registre du contenu de data/ : enregistre les bases absentes
+    du registre et retire celles dont le fichier n'existe plus.
+    Retourne (ajoutées, retirées).
+    """
+    if not os.path.isdir(DOSSIER_BASES):
+        return 0, 0
+    fichiers = {
+        _chemin_normalise(os.path.join(DOSSIER_BASES, f))
+        for f in os.listdir(DOSSIER_BASES)
+        if f.endswith(".db") and f not in FICHIERS_EXCLUS
+    }
+    conn = _connexion()
+    try:
+        connus = {ligne[0] for ligne in conn.execute("SELECT chemin FROM cooperatives")}
+        for chemin in fichiers - connus:
+            _enregistrer(conn, chemin, *_lire_config(chemin))
+        retires = connus - fichiers
+        conn.executemany("DELETE FROM cooperatives WHERE chemin = ?", [(c,) for c in retires])
+        conn.commit()
+    finally:
+        conn.close()
+    return len(fichiers - connus), len(retires)
+
+
+@st.cache_resource(show_spinner=False)
+def _registre_initialise():
+    """Synchronisation initiale, une seule fois par processus."""
+    with _verrou_initialisation:
+        synchroniser_registre()
+    return True
+
+
+def enregistrer_cooperative(chemin, nom, sigle=None):
+    """Ajoute ou met à jour une coopérative dans le registre (création, modification du nom ou du sigle)."""
+    _registre_initialise()
+    conn = _connexion()
+    try:
+        _enregistrer(conn, chemin, nom, sigle)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def ajouter_alias(chemin, alias):
+    """Ajoute un alias manuel (ancien nom, abréviation locale...) à une coopérative."""
+    alias = normaliser(alias)
+    if not alias:
+        return False
+    conn = _connexion()
+    try:
+        ligne = conn.execute("SELECT id FROM cooperatives WHERE chemin = ?",
+                             (_chemin_normalise(chemin),)).fetchone()
+        if not ligne:
+            return False
+        conn.execute("INSERT OR REPLACE INTO alias (alias, id_cooperative, origine) VALUES (?, ?, 'manuel')",
+                     (alias, ligne[0]))
+        conn.commit()
+        return True
+    finally:
+        conn.close()
+
+
+def trouver_cooperative(nom):
+    """
+    Chemin de la base dont le nom, le sigle ou un alias correspond à nom
+    (après normalisation), ou None. Une entrée dont le fichier a disparu est retirée.
+    """
+    _registre_initialise()
+    conn = _connexion()
+    try:
+        ligne = conn.execute("""
+            SELECT c.id, c.chemin FROM alias a JOIN cooperatives c ON c.id = a.id_cooperative
+            WHERE a.alias = ?
+        """, (normaliser(nom),)).fetchone()
+        if ligne and not os.path.exists(ligne[1]):
+            conn.execute("DELETE FROM cooperatives WHERE id = ?", (ligne[0],))
+            conn.commit()
+            return None
+        return ligne[1] if ligne else None
+    finally:
+        conn.close()
+
+
+def rechercher_cooperatives(texte, limite=NB_SUGGESTIONS):
+    """
+    Recherche approchée pour le formulaire de connexion : alias contenant le
+    texte saisi, puis alias proches (difflib). Retourne une liste de
+    {'nom', 'sigle', 'chemin'} sans doublon.
+    """
+    recherche = normaliser(texte)
+    if not recherche:
+        return []
+    _registre_initialise()
+    conn = _connexion()
+    try:
+        alias = dict(conn.execute("SELECT alias, id_cooperative FROM alias").fetchall())
+        cooperatives = {
+            ligne[0]: {"nom": ligne[1], "sigle": ligne[2], "chemin": ligne[3]}
+            for ligne in conn.execute("SELECT id, nom, sigle, chemin FROM cooperatives")
+        }
+    finally:
+        conn.close()
+
+    candidats = [a for a in alias if recherche in a]
+    candidats += difflib.get_close_matches(recherche, list(alias), n=limite * 2, cutoff=SEUIL_SIMILARITE)
+    resultats, vus = [], set()
+    for candidat in candidats:
+        id_coop = alias[candidat]
+        if id_coop not in vus:
+            vus.add(id_coop)
+            resultats.append(cooperatives[id_coop])
+        if len(resultats) == limite:
+            break
+    return resultats
+
+
+def noter_acces(chemin):
+    """Met à jour la date du dernier accès et la taille du fichier (suivi d'exploitation)."""
+    chemin = _chemin_normalise(chemin)
+    taille = os.path.getsize(chemin) if os.path.exists(chemin) else None
+    conn = _connexion()
+    try:
+        conn.execute("UPDATE cooperatives SET dernier_acces = ?, taille_octets = ? WHERE chemin = ?",
+                     (datetime.now().isoformat(timespec="seconds"), taille, chemin))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def lister_cooperatives():
+    """Coopératives du registre avec leurs métadonnées (nom, sigle, chemin, taille, dernier accès)."""
+    _registre_initialise()
+    conn = _connexion()
+    conn.row_factory = sqlite3.Row
+    try:
+        return [dict(ligne) for ligne in conn.execute("""
+            SELECT nom, sigle, chemin, taille_octets, date_enregistrement, dernier_acces
+            FROM cooperatives ORDER BY nom
+        """)]
+    finally:
+        conn.close()
@@ -0,0 +1,100 @@
+# Modules/ressources_statiques.py
+
+import base64
+import os
+from io import BytesIO
+
+import streamlit as st
+
+# Pillow (installé avec Streamlit) pour redimensionner et compresser les images
+try:
+    from PIL import Image, features
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+# Image de fond du portail et de la page de connexion : redimensionnée et
+# compressée une seule fois par processus, puis servie comme fichier statique
+# (server.enableStaticServing, voir .streamlit/config.toml) ou, à défaut,
+# comme data URI mise en cache et partagée par toutes les sessions.
+
+DOSSIER_ASSETS = os.path.join("data", "assets")
+NOM_IMAGE_FOND = "hevea_image"
+EXTENSIONS_IMAGE = ['.jpg', '.jpeg', '.png', '.JPG', '.JPEG', '.PNG']
+MIMES_IMAGE = {'.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png', '.webp': 'image/webp'}
+
+# Dossier "static" à côté du script principal (App_gestion.py), servi sous app/static/
+DOSSIER_STATIQUE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
+URL_STATIQUE = "app/static"
+
+LARGEUR_MAX_FOND = 1600   # largeur maximale (px) de l'image de fond
+QUALITE_FOND = 70         # qualité de compression WebP/JPEG
+
+
+def _source_image_fond():
+    """Chemin de l'image de fond d'origine (data/assets/hevea_image.*), ou None."""
+    for ext in EXTENSIONS_IMAGE:
+        chemin = os.path.join(DOSSIER_ASSETS, f"{NOM_IMAGE_FOND}{ext}")
+        if os.path.exists(chemin):
+            return chemin
+    return None
+
+
+def _compresser(chemin_source):
+    """
+    Redimensionne l'image à LARGEUR_MAX_FOND et la compresse en WebP (JPEG si
+    Pillow ne gère pas le WebP). Retourne (contenu, extension).
+    Sans Pillow, l'image d'origine est utilisée telle quelle.
+    """
+    if not PIL_AVAILABLE:
+        with open(chemin_source, "rb") as fichier:
+            return fichier.read(), os.path.splitext(chemin_source)[1].lower()
+
+    with Image.open(chemin_source) as image:
+        image = image.convert("RGB")
+        if image.width > LARGEUR_MAX_FOND:
+            image.thumbnail((LARGEUR_MAX_FOND, image.height), Image.LANCZOS)
+        buffer = BytesIO()
+        if features.check("webp"):
+            image.save(buffer, "WEBP", quality=QUALITE_FOND, method=6)
+            return buffer.getvalue(), ".webp"
+        image.save(buffer, "JPEG", quality=QUALITE_FOND, optimize=True, progressive=True)
+        return buffer.getvalue(), ".jpg"
+
+
+def _publier(nom_fichier, contenu):
+    """Écrit le fichier dans DOSSIER_STATIQUE (remplacement atomique) ; False en cas d'échec."""
+    try:
+        os.makedirs(DOSSIER_STATIQUE, exist_ok=True)
+        chemin = os.path.join(DOSSIER_STATIQUE, nom_fichier)
+        temporaire = f"{chemin}.{os.getpid()}.tmp"
+        with open(temporaire, "wb") as fichier:
+            fichier.write(contenu)
+        os.replace(temporaire, chemin)
+        return True
+    except OSError:
+        return False
+
+
+@st.cache_resource(show_spinner=False)
+def url_image_fond():
+    """
+    URL de l'image de fond à utiliser dans le CSS (url('...')), ou "" si
+    aucune image n'est présente. Calculée une fois pour toutes les sessions.
+    """
+    source = _source_image_fond()
+    if not source:
+        return ""
+    try:
+        contenu, extension = _compresser(source)
+    except OSError:
+        return ""
+
+    if st.get_option("server.enableStaticServing"):
+        nom_fichier = f"{NOM_IMAGE_FOND}_web{extension}"
+        if _publier(nom_fichier, contenu):
+            # Paramètre de version : le navigateur recharge l'image si la source change
+            return f"{URL_STATIQUE}/{nom_fichier}?v={int(os.path.getmtime(source))}"
+
+    mime = MIMES_IMAGE.get(extension, 'image/jpeg')
+    return f"data:{mime};base64,{base64.b64encode(contenu).decode()}"
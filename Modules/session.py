@@ -0,0 +1,261 @@
+# Modules/session.py
+
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+import streamlit as st
+import yaml
+from yaml.loader import SafeLoader
+
+from Modules import db_pool
+
+logger = logging.getLogger(__name__)
+
+# Gestion des cookies côté navigateur (installé avec streamlit-authenticator)
+try:
+    import extra_streamlit_components as stx
+    COOKIES_DISPONIBLES = True
+except ImportError:
+    COOKIES_DISPONIBLES = False
+
+# Session authentifiée : créée une seule fois à la connexion (utilisateur,
+# rôle, membre lié, base de la coopérative, permissions) et conservée dans
+# st.session_state. Un cookie signé (HMAC) permet de la restaurer après un
+# rafraîchissement du navigateur, sans nouveau hachage PBKDF2 ni recherche par
+# nom. La clé de signature est propre au serveur : [cookie] key dans
+# .streamlit/secrets.toml ou variable d'environnement COOP_COOKIE_KEY. Sans
+# clé (ou avec celle publiée dans config.yaml), aucun cookie n'est émis.
+
+FICHIER_CONFIG = "config.yaml"
+CLE_SESSION = "session_utilisateur"
+DUREE_COOKIE_JOURS = 30
+VARIABLE_CLE_COOKIE = "COOP_COOKIE_KEY"
+LONGUEUR_MIN_CLE_COOKIE = 32
+
+# Menus accessibles par rôle (en plus de l'accueil et de l'interface membre)
+MENUS_BASE = ["🏡Accueil", "✨Interface Membre"]
+MENUS_PAR_ROLE = {
+    'admin': ["👥Gestion des Membres", "💳Cotisations", "🌱Gestion des Cultures", "🌾Production & Collecte",
+              "📦Stocks", "🛒Ventes", "📊Comptabilité", "📑Rapports & Synthèse",
+              "📥Import en masse", "⚙️Paramètres"],
+    'comptable': ["💳Cotisations", "📊Comptabilité", "📑Rapports & Synthèse"],
+    'magasinier': ["🌱Gestion des Cultures", "📦Stocks", "🛒Ventes", "🌾Production & Collecte"],
+}
+
+# Tableau de bord de la fédération : il lit toutes les coopératives hébergées,
+# il est donc réservé aux comptes désignés par l'exploitant du serveur (section
+# [federation] de .streamlit/secrets.toml, clé comptes, ou variable
+# d'environnement COOP_FEDERATION_COMPTES, adresses séparées par des virgules),
+# quel que soit leur rôle dans leur coopérative.
+MENU_FEDERATION = "🌐Fédération"
+VARIABLE_FEDERATION = "COOP_FEDERATION_COMPTES"
+
+
+def _parametre_serveur(section, cle, variable):
+    """Valeur lue dans st.secrets[section][cle], sinon dans la variable d'environnement, sinon None."""
+    try:
+        return st.secrets[section][cle]
+    except (KeyError, FileNotFoundError):
+        return os.environ.get(variable)
+
+
+def comptes_federation():
+    """Adresses (en minuscules) des comptes autorisés à consulter la fédération."""
+    comptes = _parametre_serveur("federation", "comptes", VARIABLE_FEDERATION) or []
+    if isinstance(comptes, str):
+        comptes = comptes.split(",")
+    return {str(compte).strip().lower() for compte in comptes if str(compte).strip()}
+
+
+def acces_federation(gmail):
+    """Vrai si le compte est désigné par le serveur pour la fédération."""
+    return bool(gmail) and gmail.strip().lower() in comptes_federation()
+
+
+@st.cache_resource(show_spinner=False)
+def _config_cookie():
+    """
+    (nom, clé, durée en jours) du cookie de session, ou None si les cookies
+    sont désactivés. Nom et durée sont lus dans config.yaml, la clé dans les
+    secrets du serveur : la clé de config.yaml, versionnée avec le code, est
+    refusée, de même qu'une clé trop courte.
+    """
+    try:
+        with open(FICHIER_CONFIG, encoding="utf-8") as fichier:
+            cookie = (yaml.load(fichier, Loader=SafeLoader) or {}).get("cookie") or {}
+    except (OSError, yaml.YAMLError):
+        cookie = {}
+    cle = str(_parametre_serveur("cookie", "key", VARIABLE_CLE_COOKIE) or "")
+    if not cle:
+        return None
+    if cle == str(cookie.get("key") or "") or len(cle) < LONGUEUR_MIN_CLE_COOKIE:
+        # Signalé une fois par processus (résultat mis en cache)
+        logger.warning("Clé des cookies de session refusée (clé publiée dans config.yaml ou de moins de %d "
+                       "caractères) : les sessions ne survivront pas à un rafraîchissement du navigateur.",
+                       LONGUEUR_MIN_CLE_COOKIE)
+        return None
+    return (cookie.get("name") or "coop_auth_cookie", cle.encode("utf-8"),
+            cookie.get("expiry_days", DUREE_COOKIE_JOURS))
+
+
+def _b64(donnees):
+    return base64.urlsafe_b64encode(donnees).rstrip(b"=").decode("ascii")
+
+
+def _de_b64(texte):
+    return base64.urlsafe_b64decode(texte + "=" * (-len(texte) % 4))
+
+
+def _empreinte_mot_de_passe(cle, mot_de_passe_hache):
+    """Empreinte du hachage stocké : un changement de mot de passe invalide les cookies émis."""
+    return hmac.new(cle, mot_de_passe_hache.encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+
+
+def signer_jeton(donnees, cle):
+    """Jeton 'contenu.signature' (base64url, HMAC-SHA256)."""
+    contenu = _b64(json.dumps(donnees, separators=(",", ":")).encode("utf-8"))
+    signature = _b64(hmac.new(cle, contenu.encode("ascii"), hashlib.sha256).digest())
+    return f"{contenu}.{signature}"
+
+
+def verifier_jeton(jeton, cle):
+    """Contenu d'un jeton dont la signature est valide et qui n'a pas expiré, sinon None."""
+    try:
+        contenu, signature = jeton.split(".", 1)
+        attendue = _b64(hmac.new(cle, contenu.encode("ascii"), hashlib.sha256).digest())
+        if not hmac.compare_digest(signature, attendue):
+            return None
+        donnees = json.loads(_de_b64(contenu))
+    except (ValueError, AttributeError):
+        return None
+    if donnees.get("exp", 0) < time.time():
+        return None
+    return donnees
+
+
+def _charger_utilisateur(db_path, cle, valeur):
+    """Ligne utilisateur (par id ou par gmail) et id du membre lié (utilisateurs.id_membre)."""
+    conn = db_pool.get_connection(db_path)
+    utilisateur = conn.execute(
+        f"SELECT id, nom_prenoms, role, gmail, mot_de_passe, id_membre FROM utilisateurs WHERE {cle} = ?", (valeur,)
+    ).fetchone()
+    if not utilisateur:
+        return None, None
+    return utilisateur[:5], utilisateur[5]
+
+
+def _installer_session(db_path, utilisateur, id_membre):
+    id_utilisateur, nom_prenoms, role, gmail, _ = utilisateur
+    session = {
+        "id_utilisateur": id_utilisateur,
+        "nom": nom_prenoms,
+        "gmail": gmail,
+        "role": role,
+        "id_membre": id_membre,
+        "db_path": db_path,
+        "permissions": MENUS_BASE + MENUS_PAR_ROLE.get(role, [])
+                       + ([MENU_FEDERATION] if acces_federation(gmail) else []),
+    }
+    st.session_state[CLE_SESSION] = session
+    # Clés historiques lues par les modules
+    st.session_state["authentication_status"] = True
+    st.session_state["name"] = nom_prenoms
+    st.session_state["username"] = gmail
+    st.session_state["user_role"] = role
+    return session
+
+
+def ouvrir_session(db_path, gmail):
+    """
+    Crée la session après une connexion réussie (mot de passe déjà vérifié)
+    et prépare le cookie signé qui sera écrit au prochain rendu.
+    """
+    utilisateur, id_membre = _charger_utilisateur(db_path, "gmail", gmail)
+    if not utilisateur:
+        return None
+    session = _installer_session(db_path, utilisateur, id_membre)
+    st.session_state.pop("session_fermee", None)
+
+    config = _config_cookie()
+    if config:
+        nom, cle, jours = config
+        expiration = datetime.now() + timedelta(days=jours)
+        st.session_state["cookie_en_attente"] = ("ecrire", signer_jeton({
+            "uid": utilisateur[0],
+            "db": db_path,
+            "mdp": _empreinte_mot_de_passe(cle, utilisateur[4]),
+            "exp": int(expiration.timestamp()),
+        }, cle), expiration)
+    return session
+
+
+def session_courante():
+    """Session authentifiée de l'utilisateur, ou None."""
+    return st.session_state.get(CLE_SESSION)
+
+
+def restaurer_session():
+    """
+    Restaure la session depuis le cookie signé (rafraîchissement du navigateur).
+    Retourne la session, ou None si le cookie est absent, invalide ou révoqué.
+    """
+    if session_courante() or st.session_state.get("session_fermee"):
+        return session_courante()
+    config = _config_cookie()
+    if not config:
+        return None
+    nom, cle, _ = config
+    donnees = verifier_jeton(st.context.cookies.get(nom), cle)
+    if not donnees or not os.path.exists(donnees.get("db", "")):
+        return None
+
+    db_path = donnees["db"]
+    utilisateur, id_membre = _charger_utilisateur(db_path, "id", donnees.get("uid"))
+    if not utilisateur or not hmac.compare_digest(donnees.get("mdp", ""), _empreinte_mot_de_passe(cle, utilisateur[4])):
+        return None
+
+    session = _installer_session(db_path, utilisateur, id_membre)
+    st.session_state["db_path"] = db_path
+    try:
+        import Modules.module_settings as module_settings
+        st.session_state["nom_coop"] = module_settings.load_cooperative_info().get("name")
+    except Exception:
+        st.session_state["nom_coop"] = None
+    st.session_state["show_login_page"] = False
+    return session
+
+
+def fermer_session():
+    """Déconnexion : oublie la session et fait supprimer le cookie par le navigateur."""
+    st.session_state.pop(CLE_SESSION, None)
+    # Le cookie reste visible dans st.context.cookies jusqu'au prochain chargement de la page
+    st.session_state["session_fermee"] = True
+    if _config_cookie():
+        st.session_state["cookie_en_attente"] = ("supprimer", None, None)
+
+
+def appliquer_cookie():
+    """
+    Écrit ou supprime le cookie en attente. Appelé en début de rendu, hors de
+    tout st.rerun() immédiat, pour que le composant s'exécute dans le navigateur.
+    """
+    attente = st.session_state.pop("cookie_en_attente", None)
+    config = _config_cookie()
+    if not attente or not config or not COOKIES_DISPONIBLES:
+        return
+    action, valeur, expiration = attente
+    gestionnaire = stx.CookieManager(key="gestionnaire_cookies")
+    try:
+        if action == "ecrire":
+            gestionnaire.set(config[0], valeur, expires_at=expiration, key="cookie_ecrire")
+        else:
+            gestionnaire.delete(config[0], key="cookie_supprimer")
+    except KeyError:
+        # delete() échoue si le navigateur n'a pas transmis le cookie
+        pass
@@ -0,0 +1,404 @@
+# Modules/taches.py
+
+import json
+import os
+import re
+import socket
+import sqlite3
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import streamlit as st
+
+from Modules import db_pool, export_excel, rapport_pdf
+from Modules.pagination import conditions_filtres, requete_filtree
+
+# File de tâches locale pour les rapports et exports lourds : la tâche est
+# enregistrée dans la table taches de la base de la coopérative, exécutée par
+# un pool de threads du serveur, et son résultat est écrit sur disque pour être
+# téléchargé plus tard sans recalcul. La session de l'utilisateur n'est pas
+# bloquée pendant l'exécution.
+
+TACHES_SIMULTANEES = 2                  # tâches exécutées en parallèle sur le serveur
+DOSSIER_RESULTATS = os.path.join("data", "taches")
+DUREE_CONSERVATION_JOURS = 7            # résultats supprimés au-delà
+INTERVALLE_RAFRAICHISSEMENT = 2         # secondes entre deux mises à jour de la liste
+INTERVALLE_PROGRESSION = 0.5            # secondes minimum entre deux écritures de progression
+
+STATUTS = {
+    "en_attente": "⏳ En attente",
+    "en_cours": "⚙️ En cours",
+    "terminee": "✅ Terminée",
+    "echec": "❌ Échec",
+}
+
+MIME_EXCEL = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+MIME_PDF = 'application/pdf'
+
+# Les tâches encore en attente ou en cours lors d'un redémarrage du serveur
+# sont marquées en échec : le jeton (hôte:pid:identifiant) désigne le processus
+# qui les a lancées. Celles d'un autre processus encore actif (plusieurs
+# serveurs sur la même base) ne sont pas touchées.
+_HOTE = socket.gethostname()
+_JETON_PROCESSUS = f"{_HOTE}:{os.getpid()}:{uuid.uuid4().hex}"
+
+# Types de tâches : nom -> fonction(conn, parametres, base_fichier, progression)
+# La fonction retourne un dict {'fichier', 'nom_fichier', 'mime', 'message'}
+# (toutes les clés sont optionnelles).
+TYPES_TACHES = {}
+
+# Requêtes exportables en arrière-plan : identifiant -> définition d'historique
+# {'colonnes', 'source', 'ordre', 'table', 'filtres'} ou requête fixe {'sql'}.
+# Une tâche d'export n'enregistre que l'identifiant, la table lue et les valeurs
+# des filtres : le SQL est reconstruit à partir de ces définitions du code,
+# jamais lu dans la table taches.
+REQUETES_EXPORT = {}
+
+
+def type_tache(nom):
+    """Décorateur enregistrant une fonction comme type de tâche."""
+    def enregistrer(fonction):
+        TYPES_TACHES[nom] = fonction
+        return fonction
+    return enregistrer
+
+
+def requete_export(identifiant, definition):
+    """Enregistre une requête exportable par les tâches ; retourne la définition."""
+    REQUETES_EXPORT[identifiant] = definition
+    return definition
+
+
+@st.cache_resource(show_spinner=False)
+def _executeur():
+    return ThreadPoolExecutor(max_workers=TACHES_SIMULTANEES, thread_name_prefix="tache")
+
+
+def _maintenant():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _connexion_suivi(db_path):
+    """
+    Connexion dédiée aux mises à jour de statut et de progression : elles ne
+    passent pas par le pool et n'invalident donc pas les caches de lecture.
+    """
+    return sqlite3.connect(db_path, timeout=5)
+
+
+def _mettre_a_jour(db_path, id_tache, **champs):
+    colonnes = ", ".join(f"{nom} = ?" for nom in champs)
+    conn = _connexion_suivi(db_path)
+    try:
+        conn.execute(f"UPDATE taches SET {colonnes} WHERE id = ?", list(champs.values()) + [id_tache])
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _dossier_resultats(db_path):
+    nom_base = os.path.splitext(os.path.basename(db_path))[0]
+    dossier = os.path.join(DOSSIER_RESULTATS, nom_base)
+    os.makedirs(dossier, exist_ok=True)
+    return dossier
+
+
+def _executer(db_path, id_tache):
+    """Exécute une tâche dans un thread du pool et enregistre son résultat."""
+    _mettre_a_jour(db_path, id_tache, statut="en_cours", date_debut=_maintenant(), progression=0)
+    derniere_ecriture = [0.0]
+
+    def progression(fraction, message=None):
+        # Écritures limitées pour ne pas solliciter la base à chaque lot de lignes
+        if time.monotonic() - derniere_ecriture[0] < INTERVALLE_PROGRESSION:
+            return
+        derniere_ecriture[0] = time.monotonic()
+        champs = {"progression": max(0.0, min(float(fraction), 1.0))}
+        if message:
+            champs["message"] = message
+        _mettre_a_jour(db_path, id_tache, **champs)
+
+    try:
+        conn = db_pool.get_pool(db_path).connexion()
+        type_nom, parametres = conn.execute(
+            "SELECT type, parametres FROM taches WHERE id = ?", (id_tache,)
+        ).fetchone()
+        fonction = TYPES_TACHES[type_nom]
+        base_fichier = os.path.join(_dossier_resultats(db_path), f"tache_{id_tache}")
+        resultat = fonction(conn, json.loads(parametres or "{}"), base_fichier, progression) or {}
+        _mettre_a_jour(
+            db_path, id_tache, statut="terminee", progression=1, date_fin=_maintenant(),
+            fichier_resultat=resultat.get("fichier"), nom_fichier=resultat.get("nom_fichier"),
+            mime=resultat.get("mime"), message=resultat.get("message"),
+        )
+    except Exception as e:
+        traceback.print_exc()
+        _mettre_a_jour(db_path, id_tache, statut="echec", date_fin=_maintenant(), message=str(e))
+
+
+def soumettre_tache(type_nom, titre, parametres, categorie=None, db_path=None):
+    """Enregistre une tâche et la confie au pool de threads ; retourne son identifiant."""
+    if type_nom not in TYPES_TACHES:
+        raise ValueError(f"Type de tâche inconnu : {type_nom}")
+    db_path = os.path.abspath(db_path or st.session_state.get("db_path"))
+    conn = _connexion_suivi(db_path)
+    try:
+        # Les résultats expirés sont supprimés à la création d'une nouvelle tâche
+        _purger_expirees(conn)
+        curseur = conn.execute('''
+            INSERT INTO taches (type, categorie, titre, parametres, utilisateur, statut,
+                                jeton_processus, date_creation)
+            VALUES (?, ?, ?, ?, ?, 'en_attente', ?, ?)
+        ''', (type_nom, categorie, titre, json.dumps(parametres, default=str),
+              st.session_state.get("username"), _JETON_PROCESSUS, _maintenant()))
+        conn.commit()
+        id_tache = curseur.lastrowid
+    finally:
+        conn.close()
+    _executeur().submit(_executer, db_path, id_tache)
+    return id_tache
+
+
+def _processus_actif(jeton):
+    """
+    Faux si le jeton désigne un processus arrêté : processus de cet hôte qui
+    n'existe plus, ou jeton sans pid (antérieur à ce format). Un processus d'un
+    autre hôte, ou de cet hôte sous Windows (pas de test sans dépendance), est
+    supposé actif.
+    """
+    elements = (jeton or "").rsplit(":", 2)
+    if len(elements) != 3 or not elements[1].isdigit():
+        return False
+    hote, pid = elements[0], int(elements[1])
+    if hote != _HOTE or os.name == "nt":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@st.cache_resource(show_spinner=False)
+def _reprendre_interrompues(db_path):
+    """
+    Marque en échec les tâches actives laissées par un processus arrêté.
+    Exécutée une seule fois par processus et par base (au premier affichage des tâches).
+    """
+    conn = _connexion_suivi(db_path)
+    try:
+        jetons = [ligne[0] for ligne in conn.execute(
+            "SELECT DISTINCT jeton_processus FROM taches WHERE statut IN ('en_attente', 'en_cours')"
+        ) if ligne[0] != _JETON_PROCESSUS]
+        interrompus = [(jeton,) for jeton in jetons if not _processus_actif(jeton)]
+        conn.executemany('''
+            UPDATE taches SET statut = 'echec', message = 'Interrompue par un redémarrage du serveur'
+            WHERE statut IN ('en_attente', 'en_cours') AND jeton_processus IS ?
+        ''', interrompus)
+        conn.commit()
+    finally:
+        conn.close()
+    return len(interrompus)
+
+
+def _purger_expirees(conn):
+    """Supprime les tâches terminées depuis plus de DUREE_CONSERVATION_JOURS et leurs fichiers (sans valider)."""
+    limite = (datetime.now() - timedelta(days=DUREE_CONSERVATION_JOURS)).strftime("%Y-%m-%d %H:%M:%S")
+    expirees = conn.execute(
+        "SELECT id, fichier_resultat FROM taches WHERE statut IN ('terminee', 'echec') AND date_creation < ?",
+        (limite,)
+    ).fetchall()
+    for _, fichier in expirees:
+        if fichier and os.path.exists(fichier):
+            os.remove(fichier)
+    conn.executemany("DELETE FROM taches WHERE id = ?", [(id_tache,) for id_tache, _ in expirees])
+
+
+def supprimer_tache(id_tache, db_path=None):
+    """Supprime une tâche terminée et son fichier de résultat."""
+    db_path = os.path.abspath(db_path or st.session_state.get("db_path"))
+    conn = _connexion_suivi(db_path)
+    try:
+        ligne = conn.execute("SELECT fichier_resultat FROM taches WHERE id = ?", (id_tache,)).fetchone()
+        if ligne and ligne[0] and os.path.exists(ligne[0]):
+            os.remove(ligne[0])
+        conn.execute("DELETE FROM taches WHERE id = ? AND statut IN ('terminee', 'echec')", (id_tache,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def lister_taches(categorie=None, db_path=None, limite=10):
+    """Tâches récentes de l'utilisateur connecté (toutes catégories si categorie est None)."""
+    db_path = os.path.abspath(db_path or st.session_state.get("db_path"))
+    _reprendre_interrompues(db_path)
+    conn = _connexion_suivi(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        lignes = conn.execute('''
+            SELECT * FROM taches
+            WHERE COALESCE(utilisateur, '') = COALESCE(?, '')
+              AND (? IS NULL OR categorie = ?)
+            ORDER BY id DESC LIMIT ?
+        ''', (st.session_state.get("username"), categorie, categorie, limite)).fetchall()
+        return [dict(ligne) for ligne in lignes]
+    finally:
+        conn.close()
+
+
+def _lire_fichier(chemin):
+    def lire():
+        with open(chemin, "rb") as fichier:
+            return fichier.read()
+    return lire
+
+
+def afficher_taches(categorie=None, titre="📋 Tâches en arrière-plan"):
+    """
+    Affiche les tâches de l'utilisateur avec leur progression et le téléchargement
+    des résultats. La liste se met à jour seule tant qu'une tâche est active.
+    """
+    cle = categorie or "toutes"
+    taches_actives = any(t["statut"] in ("en_attente", "en_cours") for t in lister_taches(categorie))
+
+    @st.fragment(run_every=INTERVALLE_RAFRAICHISSEMENT if taches_actives else None)
+    def liste():
+        taches = lister_taches(categorie)
+        if not taches:
+            return
+        st.markdown(f"**{titre}**")
+        for tache in taches:
+            col_info, col_action, col_suppr = st.columns([4, 2, 1])
+            with col_info:
+                st.write(f"{STATUTS.get(tache['statut'], tache['statut'])} — {tache['titre']}")
+                if tache["statut"] in ("en_attente", "en_cours"):
+                    st.progress(tache["progression"] or 0.0, text=tache["message"] or None)
+                elif tache["message"]:
+                    st.caption(tache["message"])
+            with col_action:
+                fichier = tache["fichier_resultat"]
+                if tache["statut"] == "terminee" and fichier and os.path.exists(fichier):
+                    st.download_button("📥 Télécharger", data=_lire_fichier(fichier),
+                                       file_name=tache["nom_fichier"], mime=tache["mime"],
+                                       key=f"telecharger_tache_{cle}_{tache['id']}", on_click="ignore")
+            with col_suppr:
+                if tache["statut"] in ("terminee", "echec"):
+                    if st.button("🗑️", key=f"supprimer_tache_{cle}_{tache['id']}", help="Supprimer"):
+                        supprimer_tache(tache["id"])
+                        st.rerun(scope="fragment")
+        # Toutes les tâches suivies sont terminées : arrêter le rafraîchissement automatique
+        if taches_actives and not any(t["statut"] in ("en_attente", "en_cours") for t in taches):
+            st.rerun()
+
+    liste()
+
+
+def bouton_tache(label, type_nom, titre, parametres, categorie=None, key=None):
+    """Bouton ajoutant une tâche à la file ; retourne True lorsqu'une tâche a été soumise."""
+    if st.button(label, key=key):
+        try:
+            soumettre_tache(type_nom, titre, parametres, categorie=categorie)
+            st.success(f"✅ « {titre} » ajouté à la file des tâches.")
+            return True
+        except Exception as e:
+            st.error(f"Erreur lors de la création de la tâche : {e}")
+    return False
+
+
+def exports_arriere_plan(categorie, identifiant, table, filtres, nom_fichier, titre, nom_feuille="Export",
+                         options_pdf=None):
+    """
+    Section « exports en arrière-plan » d'un historique : exports complets de
+    la requête filtrée (Excel et PDF) exécutés par la file de tâches.
+    identifiant : requête enregistrée par requete_export() ; table : table lue
+    (vivante ou d'archive) ; filtres : {nom du filtre: valeur} (voir conditions_filtres).
+    """
+    with st.expander("⏳ Exports volumineux en arrière-plan"):
+        parametres = {"requete": identifiant, "table": table, "filtres": filtres, "titre": titre,
+                      "nom_fichier": nom_fichier, "nom_feuille": nom_feuille}
+        col1, col2 = st.columns(2)
+        with col1:
+            bouton_tache("📊 Préparer l'export Excel", "export_excel", f"{titre} (Excel)",
+                         parametres, categorie=categorie, key=f"tache_excel_{categorie}")
+        with col2:
+            if rapport_pdf.REPORTLAB_AVAILABLE:
+                bouton_tache("📄 Préparer l'export PDF", "export_pdf", f"{titre} (PDF)",
+                             {**parametres, "options_pdf": options_pdf or {}},
+                             categorie=categorie, key=f"tache_pdf_{categorie}")
+        afficher_taches(categorie)
+
+
+# --- Types de tâches génériques -------------------------------------------
+
+def _requete_export(parametres):
+    """
+    Requête {'sql', 'params'} d'une tâche d'export, reconstruite à partir de sa
+    définition dans REQUETES_EXPORT. Lève ValueError pour une requête, une table
+    ou un filtre non déclarés.
+    """
+    definition = REQUETES_EXPORT.get(parametres.get("requete"))
+    if definition is None:
+        raise ValueError(f"Requête d'export inconnue : {parametres.get('requete')}")
+    if "sql" in definition:
+        return {"sql": definition["sql"], "params": list(parametres.get("params", []))}
+
+    # Table vivante ou table de la base d'archive d'une année (alias archive_<année>)
+    table = parametres.get("table") or definition["table"]
+    if not re.fullmatch(rf"(archive_\d{{4}}\.)?{re.escape(definition['table'])}", table):
+        raise ValueError(f"Table d'export non autorisée : {table}")
+    filtres = parametres.get("filtres", {})
+    inconnus = set(filtres) - set(definition["filtres"])
+    if inconnus:
+        raise ValueError(f"Filtre(s) d'export inconnu(s) : {', '.join(sorted(inconnus))}")
+    # JSON restitue les paires de paramètres (bornes d'année) sous forme de listes
+    valeurs = {nom: tuple(valeur) if isinstance(valeur, list) else valeur for nom, valeur in filtres.items()}
+    sql, params = requete_filtree(definition["colonnes"], definition["source"].format(table=table),
+                                  conditions_filtres(definition, valeurs), definition["ordre"])
+    return {"sql": sql, "params": params}
+
+
+def _compter_lignes(conn, requete):
+    return conn.execute(f"SELECT COUNT(*) FROM ({requete['sql']})", requete["params"]).fetchone()[0]
+
+
+@type_tache("export_excel")
+def _tache_export_excel(conn, parametres, base_fichier, progression):
+    """Export Excel d'une requête enregistrée (écriture en mode constant_memory)."""
+    requete = _requete_export(parametres)
+    total = max(_compter_lignes(conn, requete), 1)
+    chemin = base_fichier + ".xlsx"
+    export_excel.ecrire_classeur(
+        chemin, [(parametres.get("nom_feuille", "Export"), requete)], conn,
+        progression=lambda lignes: progression(lignes / total, f"{lignes} / {total} lignes"),
+    )
+    return {"fichier": chemin, "nom_fichier": parametres["nom_fichier"] + ".xlsx", "mime": MIME_EXCEL,
+            "message": f"{total} ligne(s) exportée(s)"}
+
+
+@type_tache("export_pdf")
+def _tache_export_pdf(conn, parametres, base_fichier, progression):
+    """Export PDF d'une requête enregistrée par le moteur commun."""
+    import pandas as pd
+
+    requete = _requete_export(parametres)
+    total = max(_compter_lignes(conn, requete), 1)
+
+    def lots():
+        lignes = 0
+        for lot in pd.read_sql_query(requete["sql"], conn, params=requete["params"], chunksize=5000):
+            yield lot
+            lignes += len(lot)
+            progression(lignes / total, f"{lignes} / {total} lignes")
+
+    contenu = rapport_pdf.generer_pdf(lots(), titre=parametres.get("titre"), db_path=conn.pool.db_path,
+                                      **parametres.get("options_pdf", {}))
+    chemin = base_fichier + ".pdf"
+    with open(chemin, "wb") as fichier:
+        fichier.write(contenu)
+    return {"fichier": chemin, "nom_fichier": parametres["nom_fichier"] + ".pdf", "mime": MIME_PDF,
+            "message": f"{total} ligne(s) exportée(s)"}
@@ -3,9 +3,10 @@ import os
 import shutil
 import sqlite3
 import Modules.module_settings as module_settings
+from Modules import db_pool, db_migrations, registre_coops, session
 from Modules.module_settings import LOGO_BASE_DIR, ensure_logo_dir_exists # For logo file handling
-import hashlib
-import base64
+from Modules.auth import hash_password, login_user
+from Modules.ressources_statiques import url_image_fond
 
 # Dossier contenant les bases de données
 DB_FOLDER = "data"
@@ -16,7 +17,7 @@ def creer_nouvelle_cooperative(nom_coop, uploaded_file_obj=None, slogan="", type
     nom_fichier = f"coop_{nom_coop.lower().replace(' ', '_')}.db"
     chemin_fichier_nouvelle_coop = os.path.join(DB_FOLDER, nom_fichier)
 
-    if os.path.exists(chemin_fichier_nouvelle_coop):
+    if os.path.exists(chemin_fichier_nouvelle_coop) or registre_coops.trouver_cooperative(nom_coop):
         st.error("Une coopérative avec ce nom existe déjà.")
         return False, "Une coopérative avec ce nom existe déjà."
 
@@ -36,11 +37,9 @@ def creer_nouvelle_cooperative(nom_coop, uploaded_file_obj=None, slogan="", type
         # 1. Copy the model database
         shutil.copyfile(MODEL_DB, chemin_fichier_nouvelle_coop)
 
-        # 2. Connect and drop any existing 'config' table from the model to ensure clean slate
+        # 2. Bring the copied schema up to date (tables, config row, columns)
         conn_new = sqlite3.connect(chemin_fichier_nouvelle_coop)
-        cursor_new = conn_new.cursor()
-        cursor_new.execute("DROP TABLE IF EXISTS config")
-        conn_new.commit()
+        db_migrations.appliquer_migrations(conn_new)
         conn_new.close()
 
         # 3. Temporarily set session state for module_settings functions
@@ -50,10 +49,7 @@ def creer_nouvelle_cooperative(nom_coop, uploaded_file_obj=None, slogan="", type
         st.session_state["db_path"] = chemin_fichier_nouvelle_coop
         st.session_state["nom_coop"] = nom_coop
         
-        # 4. Initialize the config table with the correct schema using module_settings
-        module_settings.initialize_settings_table() # This creates the table and a default row
-
-        # 5. Handle logo upload
+        # 4. Handle logo upload
         actual_logo_path = None
         if uploaded_file_obj:
             ensure_logo_dir_exists() # Uses LOGO_BASE_DIR from module_settings
@@ -69,8 +65,9 @@ def creer_nouvelle_cooperative(nom_coop, uploaded_file_obj=None, slogan="", type
                 st.error(f"Erreur lors de la sauvegarde du logo : {e}")
                 actual_logo_path = None # Don't save path if save failed
 
-        # 6. Save the initial cooperative info (name, slogan, logo_path) using module_settings
-        # This will update the default row created by initialize_settings_table
+        # 5. Save the initial cooperative info (name, slogan, logo_path) using module_settings
+        # This will update the config row created by the schema migrations
+        # and register the cooperative (name, sigle) in the cooperative registry
         success, msg = module_settings.save_cooperative_info(nom_coop, slogan, actual_logo_path, type_coop, sigle, date_creation, immatriculation)
         
         if success:
@@ -98,12 +95,6 @@ def creer_nouvelle_cooperative(nom_coop, uploaded_file_obj=None, slogan="", type
                 st.warning(f"Impossible de supprimer le fichier de base de données partiellement créé : {oe}")
         return False, f"Erreur majeure: {e}"
 
-def hash_password(password):
-    """Hashes the password with a salt."""
-    salt = os.urandom(32)
-    key = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, 100000)
-    return salt, key
-
 def create_admin(nom_prenoms, role, statut, mot_de_passe, gmail):
     """Crée un nouvel administrateur dans la base de données de la coopérative actuelle."""
     db_path = st.session_state.get("db_path")
@@ -112,18 +103,12 @@ def create_admin(nom_prenoms, role, statut, mot_de_passe, gmail):
         return
 
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        salt, key = hash_password(mot_de_passe)
-
-        cursor.execute("""
-            INSERT INTO utilisateurs (nom_prenoms, role, statut, mot_de_passe, salt, gmail)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (nom_prenoms, role, statut, key.hex(), salt.hex(), gmail))
+        salt, key, algo_hash, iterations = hash_password(mot_de_passe)
 
-        conn.commit()
-        conn.close()
+        db_pool.ecrire("""
+            INSERT INTO utilisateurs (nom_prenoms, role, statut, mot_de_passe, salt, gmail, algo_hash, iterations)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (nom_prenoms, role, statut, key.hex(), salt.hex(), gmail, algo_hash, iterations), db_path)
         st.success("Administrateur créé avec succès.")
         # Reset the flag to hide the form
         st.session_state['show_admin_form'] = False
@@ -149,27 +134,15 @@ def show_admin_creation_form():
 
 def show_login_page():
     """Affiche la page de connexion avec le champ nom de coopérative."""
-    # Chercher l'image dans différents formats
-    hevea_image_path = None
-    for ext in ['.jpg', '.jpeg', '.png', '.JPG', '.JPEG', '.PNG']:
-        test_path = os.path.join("data", "assets", f"hevea_image{ext}")
-        if os.path.exists(test_path):
-            hevea_image_path = test_path
-            break
-    
-    # Encoder l'image en base64 pour l'utiliser dans le CSS
-    background_image_base64 = ""
-    
-    if hevea_image_path:
-        with open(hevea_image_path, "rb") as img_file:
-            background_image_base64 = base64.b64encode(img_file.read()).decode()
+    # Image de fond redimensionnée et mise en cache une fois pour toutes les sessions
+    url_fond = url_image_fond()
     
     # CSS pour la page de connexion avec image de fond
     st.markdown(f"""
         <style>
         /* Arrière-plan avec image d'hévéa pour la page de connexion */
         .stApp {{
-            background-image: linear-gradient(rgba(0, 0, 0, 0.4), rgba(0, 0, 0, 0.4)), url('data:image/jpeg;base64,{background_image_base64}');
+            background-image: linear-gradient(rgba(0, 0, 0, 0.4), rgba(0, 0, 0, 0.4)), url('{url_fond}');
             background-size: cover;
             background-position: center;
             background-repeat: no-repeat;
@@ -354,21 +327,26 @@ def show_login_page():
                     # Chercher la base de données de la coopérative
                     db_path = find_cooperative_db(nom_cooperative)
                     if db_path:
-                        # Importer la fonction de connexion
-                        from Modules.auth import login_user
                         
                         # Définir temporairement le chemin de la base de données
                         st.session_state["db_path"] = db_path
                         st.session_state["nom_coop"] = nom_cooperative
                         
                         if login_user(db_path, username, password):
+                            registre_coops.noter_acces(db_path)
                             st.success(f"Connexion réussie à la coopérative : {nom_cooperative}")
                             st.session_state["show_login_page"] = False
                             st.rerun()
                         else:
-                            st.error("Nom d'utilisateur ou mot de passe incorrect.")
+                            st.error(st.session_state.pop("login_message", "Nom d'utilisateur ou mot de passe incorrect."))
                     else:
                         st.error(f"Coopérative '{nom_cooperative}' non trouvée. Vérifiez le nom saisi.")
+                        suggestions = registre_coops.rechercher_cooperatives(nom_cooperative)
+                        if suggestions:
+                            st.info("Vouliez-vous dire : " + ", ".join(
+                                f"**{c['nom']}**" + (f" ({c['sigle']})" if c['sigle'] else "")
+                                for c in suggestions
+                            ))
                 else:
                     st.error("Veuillez remplir tous les champs.")
             
@@ -378,6 +356,7 @@ def show_login_page():
                 st.session_state["db_path"] = None
                 st.session_state["nom_coop"] = None
                 st.session_state["config_df"] = None
+                session.fermer_session()
                 st.session_state["authentication_status"] = None
                 st.session_state["user_role"] = None
                 st.session_state["name"] = None
@@ -389,50 +368,35 @@ def show_login_page():
 
 # Fonction pour trouver la base de données d'une coopérative par son nom
 def find_cooperative_db(nom_coop):
-    """Trouve le fichier de base de données correspondant au nom de la coopérative."""
-    if not os.path.exists(DB_FOLDER):
-        return None
-    
-    # Normaliser le nom de la coopérative pour la recherche
+    """
+    Trouve le fichier de base de données correspondant au nom de la coopérative.
+    La recherche passe par le registre des coopératives (nom, sigle ou alias
+    normalisés) au lieu de parcourir le dossier data/.
+    """
+    chemin_fichier = registre_coops.trouver_cooperative(nom_coop)
+    if chemin_fichier:
+        return chemin_fichier
+
+    # Base créée hors de l'application (copie manuelle) : nom de fichier exact
     nom_normalise = nom_coop.lower().replace(' ', '_')
-    nom_fichier = f"coop_{nom_normalise}.db"
-    chemin_fichier = os.path.join(DB_FOLDER, nom_fichier)
-    
+    chemin_fichier = os.path.join(DB_FOLDER, f"coop_{nom_normalise}.db")
     if os.path.exists(chemin_fichier):
+        registre_coops.synchroniser_registre()
         return chemin_fichier
-    
-    # Si pas trouvé avec la normalisation exacte, chercher dans tous les fichiers
-    fichiers_db = [f for f in os.listdir(DB_FOLDER) if f.endswith(".db") and f != "modèle_base.db"]
-    for fichier in fichiers_db:
-        nom_fichier_normalise = fichier.replace("coop_", "").replace(".db", "").replace("_", " ").lower()
-        if nom_fichier_normalise == nom_coop.lower():
-            return os.path.join(DB_FOLDER, fichier)
-    
+
     return None
 
 # Page d'accueil multi-coopératives
 def accueil():
     # CSS pour la page d'accueil du portail avec image de fond
-    # Chercher l'image dans différents formats
-    hevea_image_path = None
-    for ext in ['.jpg', '.jpeg', '.png', '.JPG', '.JPEG', '.PNG']:
-        test_path = os.path.join("data", "assets", f"hevea_image{ext}")
-        if os.path.exists(test_path):
-            hevea_image_path = test_path
-            break
-    
-    # Encoder l'image en base64 pour l'utiliser dans le CSS
-    background_image_base64 = ""
-    
-    if hevea_image_path:
-        with open(hevea_image_path, "rb") as img_file:
-            background_image_base64 = base64.b64encode(img_file.read()).decode()
+    # Image de fond redimensionnée et mise en cache une fois pour toutes les sessions
+    url_fond = url_image_fond()
     
     st.markdown(f"""
         <style>
         /* Arrière-plan avec image d'hévéa */
         .stApp {{
-            background-image: linear-gradient(rgba(0, 0, 0, 0.4), rgba(0, 0, 0, 0.4)), url('data:image/jpeg;base64,{background_image_base64}');
+            background-image: linear-gradient(rgba(0, 0, 0, 0.4), rgba(0, 0, 0, 0.4)), url('{url_fond}');
             background-size: cover;
             background-position: center;
             background-repeat: no-repeat;
@@ -748,8 +712,8 @@ def accueil():
     if not os.path.exists(DB_FOLDER):
         os.makedirs(DB_FOLDER)
 
-    # Vérifier s'il y a des coopératives existantes
-    fichiers_db = [f for f in os.listdir(DB_FOLDER) if f.endswith(".db") and f != "modèle_base.db"]
+    # Vérifier s'il y a des coopératives existantes (registre des coopératives)
+    fichiers_db = registre_coops.lister_cooperatives()
     
     if fichiers_db:
         section_content = """
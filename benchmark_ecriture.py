@@ -0,0 +1,93 @@
+# benchmark_ecriture.py
+#
+# Mesure la durée des écritures par lots passant par le thread d'écriture
+# (Modules.db_pool.executer_ecriture), sur une copie temporaire de la base
+# modèle (data/modèle_base.db n'est pas modifiée).
+#
+#   python benchmark_ecriture.py [--membres 500] [--existantes 100000] [--lots 10] [--taille-lot 5000]
+#
+# Deux scénarios sont mesurés :
+#   - "seul"    : un lot à la fois (import en masse), une écriture par transaction
+#   - "groupé"  : deux lots soumis ensemble, exécutés dans une même transaction
+#                 avec un SAVEPOINT par écriture
+# Un lot de 5000 livraisons sur une base de 100 000 lignes doit rester sous la
+# seconde dans les deux cas (régression : journal des SAVEPOINT en mémoire).
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit.logger
+
+streamlit.logger.set_log_level("error")  # exécution hors "streamlit run"
+
+from Modules import db_migrations, db_pool
+
+MODEL_DB = os.path.join("data", "modèle_base.db")
+REQUETE = """INSERT INTO productions (id_membre, date_livraison, quantite, qualite, zone, statut, culture_id, culture_nom)
+             VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
+
+
+def lot_livraisons(ids_membres, id_culture, taille, annee):
+    return [(random.choice(ids_membres), f"{annee}-{i % 12 + 1:02d}-{i % 28 + 1:02d}", 5.0, "A", "Zone 1",
+             "valide", id_culture, "Cacao") for i in range(taille)]
+
+
+def preparer_base(dossier, nb_membres, nb_existantes):
+    chemin = os.path.join(dossier, "coop_benchmark.db")
+    shutil.copyfile(MODEL_DB, chemin)
+    conn = sqlite3.connect(chemin)
+    db_migrations.appliquer_migrations(conn)
+    conn.executemany("INSERT INTO membres (nom, numero_membre, statut) VALUES (?, ?, ?)",
+                     [(f"Membre {i}", f"B{i:05d}", "actif") for i in range(nb_membres)])
+    id_culture = conn.execute("INSERT INTO cultures (nom_culture) VALUES ('Cacao')").lastrowid
+    ids_membres = [ligne[0] for ligne in conn.execute("SELECT id FROM membres")]
+    conn.executemany(REQUETE, lot_livraisons(ids_membres, id_culture, nb_existantes, 2024))
+    conn.commit()
+    conn.close()
+    return chemin, ids_membres, id_culture
+
+
+def ecrire_lot(db_path, lignes):
+    debut = time.perf_counter()
+    db_pool.executer_ecriture(lambda conn: conn.executemany(REQUETE, lignes), db_path)
+    return time.perf_counter() - debut
+
+
+def afficher(nom, durees, taille_lot):
+    print(f"{nom:<8} {len(durees):>3} lots de {taille_lot}  médiane {statistics.median(durees) * 1000:7.0f} ms  "
+          f"max {max(durees) * 1000:7.0f} ms  débit {taille_lot * len(durees) / sum(durees):9.0f} lignes/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Durée des écritures par lots via le thread d'écriture")
+    parser.add_argument("--membres", type=int, default=500)
+    parser.add_argument("--existantes", type=int, default=100000, help="livraisons déjà présentes")
+    parser.add_argument("--lots", type=int, default=10)
+    parser.add_argument("--taille-lot", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dossier:
+        db_path, ids_membres, id_culture = preparer_base(dossier, args.membres, args.existantes)
+        lots = [lot_livraisons(ids_membres, id_culture, args.taille_lot, 2025) for _ in range(args.lots)]
+
+        afficher("seul", [ecrire_lot(db_path, lot) for lot in lots], args.taille_lot)
+
+        # Deux sessions qui écrivent en même temps : leurs lots partagent une transaction
+        with ThreadPoolExecutor(max_workers=2) as sessions:
+            debut = time.perf_counter()
+            list(sessions.map(lambda lot: ecrire_lot(db_path, lot), lots))
+            duree = time.perf_counter() - debut
+        print(f"groupé   {args.lots} lots de {args.taille_lot} (2 sessions) en {duree * 1000:.0f} ms  "
+              f"débit {args.taille_lot * args.lots / duree:9.0f} lignes/s")
+        db_pool.get_pool(db_path).fermer_tout()
+
+
+if __name__ == "__main__":
+    main()
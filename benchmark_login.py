@@ -0,0 +1,108 @@
+# benchmark_login.py
+#
+# Mesure la latence des connexions sous charge concurrente, sur une copie
+# temporaire de la base modèle (data/modèle_base.db n'est pas modifiée).
+#
+#   python benchmark_login.py [--utilisateurs 20] [--connexions 200] [--concurrence 20]
+#
+# Deux scénarios sont comparés :
+#   - "direct"  : PBKDF2 calculé dans le thread de chaque session (ancien login_user)
+#   - "pool"    : Modules.auth.check_credentials (pool de hachage borné + limitation)
+# puis une rafale de tentatives erronées sur un même compte montre la limitation
+# appliquée avant tout hachage.
+
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit.logger
+
+streamlit.logger.set_log_level("error")  # exécution hors "streamlit run"
+
+from Modules import auth, db_migrations, db_pool
+
+MODEL_DB = os.path.join("data", "modèle_base.db")
+MOT_DE_PASSE = "mot-de-passe-de-test"
+
+
+def preparer_base(dossier, nb_utilisateurs):
+    chemin = os.path.join(dossier, "coop_benchmark.db")
+    shutil.copyfile(MODEL_DB, chemin)
+    conn = sqlite3.connect(chemin)
+    db_migrations.appliquer_migrations(conn)
+    conn.execute("DELETE FROM utilisateurs")
+    for i in range(nb_utilisateurs):
+        salt, key, algo_hash, iterations = auth.hash_password(MOT_DE_PASSE)
+        conn.execute("""
+            INSERT INTO utilisateurs (nom_prenoms, role, statut, mot_de_passe, salt, gmail, algo_hash, iterations)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (f"Utilisateur {i}", "membre", "actif", key.hex(), salt.hex(), f"user{i}@coop.test", algo_hash, iterations))
+    conn.commit()
+    conn.close()
+    return chemin
+
+
+def connexion_directe(db_path, gmail):
+    conn = db_pool.get_connection(db_path)
+    ligne = conn.execute("SELECT mot_de_passe, salt FROM utilisateurs WHERE gmail = ?", (gmail,)).fetchone()
+    return auth.verify_password(ligne[1], ligne[0], MOT_DE_PASSE)
+
+
+def connexion_pool(db_path, gmail):
+    resultat, _ = auth.check_credentials(db_path, gmail, MOT_DE_PASSE)
+    return resultat == auth.LOGIN_OK
+
+
+def mesurer(nom, fonction, db_path, nb_utilisateurs, nb_connexions, concurrence):
+    def une_connexion(i):
+        debut = time.perf_counter()
+        ok = fonction(db_path, f"user{i % nb_utilisateurs}@coop.test")
+        return time.perf_counter() - debut, ok
+
+    debut = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrence) as sessions:
+        resultats = list(sessions.map(une_connexion, range(nb_connexions)))
+    duree = time.perf_counter() - debut
+
+    latences = sorted(r[0] * 1000 for r in resultats)
+    reussies = sum(1 for r in resultats if r[1])
+    p95 = latences[int(0.95 * (len(latences) - 1))]
+    print(f"{nom:<8} {reussies:>4}/{nb_connexions} réussies  "
+          f"médiane {statistics.median(latences):7.1f} ms  p95 {p95:7.1f} ms  max {latences[-1]:7.1f} ms  "
+          f"débit {nb_connexions / duree:6.1f} connexions/s")
+
+
+def rafale_erronee(db_path, nb_tentatives):
+    compteur = {}
+    debut = time.perf_counter()
+    for _ in range(nb_tentatives):
+        resultat, _ = auth.check_credentials(db_path, "user0@coop.test", "mauvais", ip_address="203.0.113.7")
+        compteur[resultat] = compteur.get(resultat, 0) + 1
+    duree = (time.perf_counter() - debut) * 1000
+    print(f"rafale   {nb_tentatives} tentatives erronées en {duree:.0f} ms : {compteur}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latence des connexions sous charge concurrente")
+    parser.add_argument("--utilisateurs", type=int, default=20)
+    parser.add_argument("--connexions", type=int, default=200)
+    parser.add_argument("--concurrence", type=int, default=20, help="sessions simultanées")
+    args = parser.parse_args()
+
+    print(f"PBKDF2 {auth.PBKDF2_ITERATIONS} itérations, pool de hachage : {auth.HASH_WORKERS} threads, "
+          f"{os.cpu_count()} CPU")
+    with tempfile.TemporaryDirectory() as dossier:
+        db_path = preparer_base(dossier, args.utilisateurs)
+        mesurer("direct", connexion_directe, db_path, args.utilisateurs, args.connexions, args.concurrence)
+        mesurer("pool", connexion_pool, db_path, args.utilisateurs, args.connexions, args.concurrence)
+        rafale_erronee(db_path, 50)
+        db_pool.get_pool(db_path).fermer_tout()
+
+
+if __name__ == "__main__":
+    main()
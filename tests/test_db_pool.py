@@ -0,0 +1,91 @@
+# tests/test_db_pool.py
+#
+# Thread d'écriture (Modules/db_pool.py) sur une base temporaire : échec isolé
+# dans un groupe, transaction annulée par SQLite, annulation après délai.
+
+import threading
+
+import pytest
+import streamlit.logger
+
+streamlit.logger.set_log_level("error")  # exécution hors "streamlit run"
+
+from Modules import db_pool
+
+INSERTION_MEMBRE = "INSERT INTO membres (nom) VALUES (?)"
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = db_pool.get_pool(str(tmp_path / "coop_test.db"))
+    yield pool
+    pool.fermer_tout()
+
+
+def noms_membres(pool):
+    return [ligne[0] for ligne in pool.connexion().execute("SELECT nom FROM membres ORDER BY id")]
+
+
+def bloquer_ecrivain(pool):
+    """Occupe le thread d'écriture ; les écritures soumises ensuite forment un seul groupe à la libération."""
+    occupe, liberation = threading.Event(), threading.Event()
+    pool.ecrivain().soumettre(lambda conn: (occupe.set(), liberation.wait(10)))
+    assert occupe.wait(10)
+    return liberation
+
+
+def ecrire_membre(nom):
+    return lambda conn: conn.execute(INSERTION_MEMBRE, (nom,)).lastrowid
+
+
+def test_echec_annule_seulement_son_ecriture(pool):
+    liberation = bloquer_ecrivain(pool)
+    ecrivain = pool.ecrivain()
+    futurs = [ecrivain.soumettre(ecrire_membre("A")),
+              ecrivain.soumettre(lambda conn: (conn.execute(INSERTION_MEMBRE, ("B",)), 1 / 0)),
+              ecrivain.soumettre(ecrire_membre("C"))]
+    liberation.set()
+
+    assert futurs[0].result(10)
+    with pytest.raises(ZeroDivisionError):
+        futurs[1].result(10)
+    assert futurs[2].result(10)
+    assert noms_membres(pool) == ["A", "C"]
+
+
+def test_transaction_annulee_par_sqlite(pool):
+    liberation = bloquer_ecrivain(pool)
+    ecrivain = pool.ecrivain()
+    # Une écriture qui met fin à la transaction du groupe (comme SQLITE_FULL ou une interruption)
+    futurs = [ecrivain.soumettre(ecrire_membre("A")),
+              ecrivain.soumettre(lambda conn: conn.execute("ROLLBACK")),
+              ecrivain.soumettre(ecrire_membre("C"))]
+    liberation.set()
+
+    for futur in futurs:
+        with pytest.raises(Exception):
+            futur.result(10)
+    # Le thread a survécu : les écritures suivantes sont validées
+    assert pool.ecrivain() is ecrivain and ecrivain.actif()
+    assert db_pool.ecrire(INSERTION_MEMBRE, ("D",), pool.db_path) == 1
+    assert noms_membres(pool) == ["D"]
+
+
+def test_ecrivain_redemarre(pool):
+    ecrivain = pool.ecrivain()
+    ecrivain.arreter()
+    assert not ecrivain.actif()
+    assert db_pool.ecrire(INSERTION_MEMBRE, ("A",), pool.db_path) == 1
+    assert pool.ecrivain() is not ecrivain
+
+
+def test_delai_depasse_annule_l_ecriture(pool, monkeypatch):
+    monkeypatch.setattr(db_pool, "DELAI_ECRITURE", 0.2)
+    liberation = bloquer_ecrivain(pool)
+    with pytest.raises(TimeoutError):
+        db_pool.ecrire(INSERTION_MEMBRE, ("A",), pool.db_path)
+    liberation.set()
+
+    # L'écriture annulée n'est jamais exécutée, même une fois le thread libéré
+    assert db_pool.ecrire(INSERTION_MEMBRE, ("B",), pool.db_path) == 1
+    assert noms_membres(pool) == ["B"]
@@ -0,0 +1,89 @@
+# tests/test_db_stocks.py
+#
+# Grand livre des stocks (Modules/db_stocks.py) sur une base temporaire migrée :
+# imputation FIFO des ventes, refus de la survente, soldes tenus par trigger.
+
+import sqlite3
+
+import pytest
+import streamlit.logger
+
+streamlit.logger.set_log_level("error")  # exécution hors "streamlit run"
+
+from Modules import db_migrations, db_pool, db_stocks
+
+PRODUIT = ("Cacao", "brut", "Standard")
+VENTE = {"prix_unitaire": 1000, "prix_total": None, "client": "Client", "date_vente": "2025-03-01",
+         "mode_paiement": "Espèces", "observations": ""}
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / "coop_test.db")
+    db_migrations.appliquer_migrations(conn)
+    # Trois lots du même produit, saisis dans le désordre
+    for quantite, date_entree in ((30, "2025-02-01"), (10, "2025-01-01"), (50, "2025-03-01")):
+        db_stocks.entrer_en_stock(conn, None, *PRODUIT, quantite, date_entree)
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def lots(conn):
+    return conn.execute("SELECT date_entree, quantite FROM stocks ORDER BY date_entree").fetchall()
+
+
+def solde(conn):
+    ligne = conn.execute("SELECT quantite FROM soldes_stock WHERE culture_nom = ? AND type_produit = ? "
+                         "AND qualite = ?", PRODUIT).fetchone()
+    return ligne[0] if ligne else 0
+
+
+def test_vente_imputee_aux_lots_les_plus_anciens(conn):
+    id_vente, imputations = db_stocks.vendre_fifo(conn, *PRODUIT, 25, VENTE)
+
+    assert [quantite for _, quantite in imputations] == [10, 15]
+    assert lots(conn) == [("2025-01-01", 0), ("2025-02-01", 15), ("2025-03-01", 50)]
+    sorties = conn.execute("SELECT SUM(quantite) FROM mouvements_stock WHERE sens = 'sortie' AND id_vente = ?",
+                           (id_vente,)).fetchone()[0]
+    assert sorties == 25
+    assert solde(conn) == 65
+
+
+def test_survente_refusee_sans_effet(tmp_path):
+    pool = db_pool.get_pool(str(tmp_path / "coop_test.db"))
+    try:
+        db_pool.executer_ecriture(
+            lambda conn: db_stocks.entrer_en_stock(conn, None, *PRODUIT, 40, "2025-01-01"), pool.db_path)
+        with pytest.raises(ValueError, match="Stock insuffisant"):
+            db_pool.executer_ecriture(lambda conn: db_stocks.vendre_fifo(conn, *PRODUIT, 41, VENTE), pool.db_path)
+
+        # Vente, prélèvements et mouvements annulés ensemble
+        lecture = pool.connexion()
+        assert lecture.execute("SELECT COUNT(*) FROM ventes").fetchone()[0] == 0
+        assert lecture.execute("SELECT quantite FROM stocks").fetchall() == [(40,)]
+        assert lecture.execute("SELECT COUNT(*) FROM mouvements_stock WHERE sens = 'sortie'").fetchone()[0] == 0
+        assert solde(lecture) == 40
+    finally:
+        pool.fermer_tout()
+
+
+def test_soldes_tenus_par_le_grand_livre(conn):
+    assert solde(conn) == 90
+    db_stocks.vendre_fifo(conn, *PRODUIT, 90, VENTE)
+    # Un produit épuisé quitte soldes_stock
+    assert solde(conn) == 0
+    assert conn.execute("SELECT COUNT(*) FROM soldes_stock").fetchone()[0] == 0
+
+    # La suppression d'un mouvement annule son effet sur le solde
+    conn.execute("DELETE FROM mouvements_stock WHERE sens = 'sortie' AND quantite = 10")
+    assert solde(conn) == 10
+
+    attendus = conn.execute("SELECT culture_nom, type_produit, qualite, quantite FROM soldes_stock").fetchall()
+    db_stocks.reconstruire_soldes(conn)
+    assert conn.execute("SELECT culture_nom, type_produit, qualite, quantite FROM soldes_stock").fetchall() == attendus
+
+
+def test_mouvement_non_modifiable(conn):
+    with pytest.raises(sqlite3.IntegrityError, match="ne peut pas être modifié"):
+        conn.execute("UPDATE mouvements_stock SET quantite = 0")
@@ -0,0 +1,37 @@
+# tests/test_plans_requetes.py
+#
+# Les requêtes critiques des modules utilisent les index attendus sur une
+# copie migrée de la base modèle (data/modèle_base.db n'est pas modifiée).
+
+import os
+import shutil
+import sqlite3
+
+import pytest
+import streamlit.logger
+
+streamlit.logger.set_log_level("error")  # exécution hors "streamlit run"
+
+from Modules import db_migrations, db_plans_requetes
+
+MODEL_DB = os.path.join(os.path.dirname(__file__), os.pardir, "data", "modèle_base.db")
+
+
+@pytest.fixture
+def base_migree(tmp_path):
+    chemin = tmp_path / "coop_test.db"
+    shutil.copyfile(MODEL_DB, chemin)
+    conn = sqlite3.connect(chemin)
+    db_migrations.appliquer_migrations(conn)
+    yield conn
+    conn.close()
+
+
+def test_requetes_critiques_indexees(base_migree):
+    anomalies = db_plans_requetes.verifier_plans_requetes(base_migree)
+    assert anomalies == [], "\n".join(f"{nom} : {' | '.join(plan)}" for nom, plan in anomalies)
+
+
+def test_anomalie_detectee(base_migree):
+    requetes = [("sans_index", "SELECT * FROM productions WHERE zone = ?", ("Z",), "idx_productions_date")]
+    assert [nom for nom, _ in db_plans_requetes.verifier_plans_requetes(base_migree, requetes)] == ["sans_index"]
@@ -0,0 +1,79 @@
+# tests/test_session.py
+#
+# Cookie de session signé (Modules/session.py) : signature, restauration après
+# rafraîchissement, révocation par changement de mot de passe, clé refusée.
+
+import time
+from types import SimpleNamespace
+
+import pytest
+import streamlit as st
+import streamlit.logger
+
+streamlit.logger.set_log_level("error")  # exécution hors "streamlit run"
+
+from Modules import db_pool, session
+
+CLE = "k" * 48
+GMAIL = "membre@coop.com"
+
+
+@pytest.fixture
+def cookies(tmp_path, monkeypatch):
+    """Base temporaire avec un utilisateur, clé de cookie du serveur, session vide."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / session.FICHIER_CONFIG).write_text("cookie:\n  name: test_cookie\n  key: cle_publique\n",
+                                                   encoding="utf-8")
+    monkeypatch.setenv(session.VARIABLE_CLE_COOKIE, CLE)
+    session._config_cookie.clear()
+    st.session_state.clear()
+
+    db_path = str(tmp_path / "coop_test.db")
+    db_pool.ecrire("INSERT INTO utilisateurs (nom_prenoms, role, statut, mot_de_passe, salt, gmail) "
+                   "VALUES ('Membre', 'membre', 'actif', 'hash1', 'sel', ?)", (GMAIL,), db_path)
+    yield db_path
+    st.session_state.clear()
+    session._config_cookie.clear()
+    db_pool.get_pool(db_path).fermer_tout()
+
+
+def rafraichir(monkeypatch, jeton):
+    """Nouveau chargement de la page : session vide, cookie transmis par le navigateur."""
+    st.session_state.clear()
+    monkeypatch.setattr(st, "context", SimpleNamespace(cookies={"test_cookie": jeton}))
+    return session.restaurer_session()
+
+
+def test_jeton_signe():
+    cle = CLE.encode()
+    jeton = session.signer_jeton({"uid": 1, "exp": time.time() + 60}, cle)
+    assert session.verifier_jeton(jeton, cle)["uid"] == 1
+
+    signature = jeton.split(".")[1]
+    falsifie = session.signer_jeton({"uid": 2, "exp": time.time() + 60}, cle).split(".")[0] + "." + signature
+    assert session.verifier_jeton(falsifie, cle) is None
+    assert session.verifier_jeton(jeton, b"x" * 48) is None
+    assert session.verifier_jeton(session.signer_jeton({"uid": 1, "exp": time.time() - 1}, cle), cle) is None
+    assert session.verifier_jeton(None, cle) is None
+
+
+def test_session_restauree_puis_revoquee(cookies, monkeypatch):
+    session.ouvrir_session(cookies, GMAIL)
+    action, jeton, _ = st.session_state["cookie_en_attente"]
+    assert action == "ecrire"
+
+    restauree = rafraichir(monkeypatch, jeton)
+    assert restauree["gmail"] == GMAIL and restauree["db_path"] == cookies
+
+    # Un changement de mot de passe invalide les cookies déjà émis
+    db_pool.ecrire("UPDATE utilisateurs SET mot_de_passe = 'hash2' WHERE gmail = ?", (GMAIL,), cookies)
+    assert rafraichir(monkeypatch, jeton) is None
+
+
+@pytest.mark.parametrize("cle", ["cle_publique", "courte"])
+def test_cle_refusee(cookies, monkeypatch, cle):
+    monkeypatch.setenv(session.VARIABLE_CLE_COOKIE, cle)
+    session._config_cookie.clear()
+    assert session._config_cookie() is None
+    session.ouvrir_session(cookies, GMAIL)
+    assert "cookie_en_attente" not in st.session_state